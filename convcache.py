@@ -0,0 +1,80 @@
+"""
+submit.py 使用的转换清单（manifest）。
+
+每个实验记录源文件的 size / mtime / 内容哈希以及转换器版本，
+再次运行时：
+  * size + mtime 未变且输出文件存在 → O(1) 跳过，不读源文件；
+  * 只有 mtime 变了 → 重新计算哈希，内容相同仍然跳过；
+  * 其余情况（新实验、内容改变、转换器升级）→ 重新转换。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+MANIFEST_NAME = ".convert_manifest.json"
+_CHUNK = 1 << 20
+
+
+def file_digest(path: str) -> str:
+    """分块计算文件内容的 blake2b 哈希。"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_fingerprint(path: str) -> Dict[str, Any]:
+    """源文件指纹：先 stat 再哈希，转换期间被修改的文件下次会被重新检查。"""
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": file_digest(path)}
+
+
+class ConversionManifest:
+    def __init__(self, path: str, version: str):
+        self.path = path
+        self.version = version
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f).get("entries", {})
+            except (OSError, ValueError) as e:
+                logging.warning("manifest 无法读取，将全部重新转换：%s (%s)", path, e)
+
+    def is_current(self, name: str, src: str, dst: str) -> bool:
+        entry = self.entries.get(name)
+        if entry is None or entry.get("version") != self.version:
+            return False
+        try:
+            src_st = os.stat(src)
+            dst_st = os.stat(dst)
+        except FileNotFoundError:
+            return False
+        if dst_st.st_size != entry.get("output_size") or src_st.st_size != entry.get("size"):
+            return False
+        if src_st.st_mtime_ns == entry.get("mtime_ns"):
+            return True
+        # 只是被 touch 过：内容没变就更新 mtime 并跳过
+        if file_digest(src) != entry.get("hash"):
+            return False
+        entry["mtime_ns"] = src_st.st_mtime_ns
+        return True
+
+    def record(self, name: str, fingerprint: Dict[str, Any], dst: str, count: Optional[int] = None) -> None:
+        self.entries[name] = {
+            **fingerprint,
+            "version": self.version,
+            "output_size": os.path.getsize(dst),
+            "records": count,
+        }
+
+    def save(self) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"entries": self.entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
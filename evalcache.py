@@ -0,0 +1,125 @@
+"""
+Incremental cache of per-seed RewardBench scores used by fetch.py.
+
+One SQLite row per (results_dir, experiment, seed) holds the source file's size,
+mtime and content hash together with its subset scores. A rerun only re-reads
+files whose size or mtime changed (and only re-parses them if the content hash
+changed too), so rebuilding overall_scores.csv costs time proportional to the
+new batch of evals. Category / Overall scores are not cached: fetch.py derives
+them from the full frame so they never depend on which files were re-read.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+CACHE_VERSION = 2
+
+Key = Tuple[str, str]  # (experiment, seed)
+
+
+class EvalCache:
+    def __init__(self, path: Path, results_dir: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.results_dir = str(Path(results_dir).resolve())
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(scores)")]
+        if "categories" in columns:
+            # version 1 layout; the cache is rebuilt from the metrics files
+            self.conn.execute("DROP TABLE scores")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS scores (
+  results_dir TEXT NOT NULL,
+  experiment TEXT NOT NULL,
+  seed TEXT NOT NULL,
+  path TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  mtime_ns INTEGER NOT NULL,
+  hash TEXT NOT NULL,
+  version INTEGER NOT NULL,
+  subsets TEXT NOT NULL,
+  PRIMARY KEY (results_dir, experiment, seed)
+)"""
+        )
+        self._rows: Dict[Key, tuple] = {
+            (exp, seed): (path, size, mtime_ns, digest)
+            for exp, seed, path, size, mtime_ns, digest in self.conn.execute(
+                "SELECT experiment, seed, path, size, mtime_ns, hash FROM scores "
+                "WHERE results_dir = ? AND version = ?",
+                (self.results_dir, CACHE_VERSION),
+            )
+        }
+
+    def stale(self, discovered: Iterable[Tuple[str, str, Path]]) -> List[Tuple[str, str, Path]]:
+        """Files that are new or whose path, size or mtime differ from the cached entry."""
+        out = []
+        for exp, seed, path in discovered:
+            st = os.stat(path)
+            if self._rows.get((exp, seed), (None,))[:3] != (str(path), st.st_size, st.st_mtime_ns):
+                out.append((exp, seed, path))
+        return out
+
+    def cached_hash(self, key: Key) -> Optional[str]:
+        row = self._rows.get(key)
+        return row[3] if row else None
+
+    def touch(self, key: Key, path: Path, size: int, mtime_ns: int) -> None:
+        """Content unchanged (same hash): only record the new stat."""
+        self.conn.execute(
+            "UPDATE scores SET path = ?, size = ?, mtime_ns = ? "
+            "WHERE results_dir = ? AND experiment = ? AND seed = ?",
+            (str(path), size, mtime_ns, self.results_dir, *key),
+        )
+        self._rows[key] = (str(path), size, mtime_ns, self._rows[key][3])
+
+    def store(
+        self,
+        key: Key,
+        path: Path,
+        size: int,
+        mtime_ns: int,
+        digest: str,
+        subsets: Dict[str, float],
+    ) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                self.results_dir, *key, str(path), size, mtime_ns, digest, CACHE_VERSION,
+                json.dumps(subsets),
+            ),
+        )
+        self._rows[key] = (str(path), size, mtime_ns, digest)
+
+    def prune(self, keep: Iterable[Key]) -> int:
+        """Drop entries whose result file no longer exists."""
+        gone = set(self._rows) - set(keep)
+        self.conn.executemany(
+            "DELETE FROM scores WHERE results_dir = ? AND experiment = ? AND seed = ?",
+            [(self.results_dir, *key) for key in gone],
+        )
+        for key in gone:
+            del self._rows[key]
+        return len(gone)
+
+    def load(self, keys: Sequence[Key]) -> List[Dict[str, float]]:
+        """Subset scores for each key, in the given order."""
+        rows = {
+            (exp, seed): subsets
+            for exp, seed, subsets in self.conn.execute(
+                "SELECT experiment, seed, subsets FROM scores WHERE results_dir = ?",
+                (self.results_dir,),
+            )
+        }
+        return [json.loads(rows[key]) for key in keys]
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,60 @@
+"""
+结果目录（eval_results 布局：<root>/<实验名>/model<seed>.json）的打分方式标记。
+
+rewardbench 对合并模型的评估与 rmeval.py 的 ref-free 对数概率打分得到的准确率不可比，
+而 fetch.py 会把同一目录下的结果当成同一指标汇总。第一次写入结果时在目录下记录 <root>/.scoring，
+之后用其它方式打分的写入直接报错；没有标记但已有结果的目录视为 rewardbench 合并模型评估的结果。
+"""
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+SCORING_MARKER = ".scoring"
+# run.py 合并模式（EVAL_CMD，rewardbench --model=<合并模型>）
+MERGED_SCORING = "rewardbench"
+# run.py adapter 模式（rmeval.py），完整的打分方式见 adapter_scoring
+ADAPTER_SCORING_PREFIX = "rmeval-"
+
+
+def adapter_scoring(ref_free_type: str, template: Optional[str]) -> str:
+    """rmeval.py 写入结果 JSON 的 scoring 字段与结果目录的 .scoring 标记。"""
+    return f"{ADAPTER_SCORING_PREFIX}ref-free-{ref_free_type}:{template}"
+
+
+def has_results(root: Path) -> bool:
+    return any(
+        True for pattern in ("*.json", "*/*.json")
+        for path in root.glob(pattern) if not path.relative_to(root).parts[0].startswith(".")
+    )
+
+
+def scoring_of(root: Path) -> Optional[str]:
+    """root 中结果的打分方式；目录为空时返回 None。"""
+    marker = root / SCORING_MARKER
+    if marker.is_file():
+        return marker.read_text(encoding="utf-8").strip()
+    return MERGED_SCORING if root.is_dir() and has_results(root) else None
+
+
+def claim_scoring(root: Path, method: str) -> None:
+    """确认 root 用 method 打分（第一次时写下标记）；与已有结果的打分方式不同时抛出 ValueError。"""
+    marker = root / SCORING_MARKER
+    if not marker.is_file():
+        existing = scoring_of(root) or method
+        root.mkdir(parents=True, exist_ok=True)
+        # run.py 的多个评估线程可能同时第一次写同一个目录：临时文件按线程区分
+        tmp = root / f"{SCORING_MARKER}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp.write_text(existing + "\n", encoding="utf-8")
+        try:
+            # link 不覆盖已有文件：并发时以先写下的为准
+            os.link(tmp, marker)
+        except FileExistsError:
+            pass
+        finally:
+            tmp.unlink()
+    existing = scoring_of(root)
+    if existing != method:
+        raise ValueError(f"{root} 中的结果用 {existing} 打分，与本次的 {method} 不可比；请使用另一个结果目录")
@@ -0,0 +1,193 @@
+"""
+逐行特征的列式存储：features.jsonl → 按位压缩的 0/1 矩阵（行 × coef.jsonl 中的分箱特征）。
+
+    <root>/bits.npy        (行数, ceil(特征数 / 8)) uint8，np.packbits 按行压缩，内存映射读取
+    <root>/features.json   特征名（列顺序）
+    <root>/ids.json        每行数据的 id
+    <root>/meta.json       行数 / 特征数 / 源文件 size + mtime（最后写入，存在即表示构建完成）
+
+任意子集的特征计数只是一次矩阵–向量乘法 indicator @ X，counts/ 目录中的
+human_datamodel_counts_*.json 可以按实验随时重新计算（实验中 is_swapped 的行即送人工标注的行）。
+
+python featstore.py build --input_path /root/autodl-tmp/data/multipref/features/helpsteer2-features.jsonl \
+  --output /root/autodl-tmp/data/output/helpsteer2/featstore
+python featstore.py counts --features /root/autodl-tmp/data/output/helpsteer2/featstore \
+  --store /root/autodl-tmp/data/output/helpsteer2/pairstore \
+  --output_dir /root/autodl-tmp/data/output/helpsteer2/counts
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from pairstore import SWAPPED, PairStore
+from select_subset import feature_matrix, load_coefficients
+from todpo import iter_jsonl
+
+STORE_VERSION = 1
+_CHUNK_ROWS = 1 << 16
+
+
+def _write_json(path: Path, obj: Any) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(obj, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def build_store(
+    input_path: Path, feature_names: Sequence[str], root: Path, id_col: str = "id", force: bool = False
+) -> bool:
+    """源文件与特征列表都没变时跳过，返回是否重新构建。"""
+    st = input_path.stat()
+    source = {"path": str(input_path.resolve()), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    meta_path = root / "meta.json"
+    if not force and meta_path.is_file():
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if (
+            meta.get("version") == STORE_VERSION
+            and meta.get("source") == source
+            and json.loads((root / "features.json").read_text(encoding="utf-8")) == list(feature_names)
+        ):
+            return False
+
+    df = pd.DataFrame.from_records(list(iter_jsonl(str(input_path))))
+    X = feature_matrix(df, feature_names)
+    ids = df[id_col].tolist() if id_col in df.columns else list(range(len(df)))
+
+    root.mkdir(parents=True, exist_ok=True)
+    meta_path.unlink(missing_ok=True)
+    tmp = root / "bits.tmp.npy"
+    np.save(tmp, np.packbits(X, axis=1))
+    os.replace(tmp, root / "bits.npy")
+    _write_json(root / "features.json", list(feature_names))
+    _write_json(root / "ids.json", ids)
+    _write_json(meta_path, {
+        "version": STORE_VERSION, "rows": int(X.shape[0]), "features": int(X.shape[1]), "source": source,
+    })
+    return True
+
+
+class FeatureStore:
+    def __init__(self, root: os.PathLike):
+        self.root = Path(root)
+        meta = json.loads((self.root / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"特征存储版本不支持：{self.root}")
+        self.feature_names: List[str] = json.loads((self.root / "features.json").read_text(encoding="utf-8"))
+        self.ids: List[Any] = json.loads((self.root / "ids.json").read_text(encoding="utf-8"))
+        self.bits = np.load(self.root / "bits.npy", mmap_mode="r")
+        self._row_of: Optional[Dict[Any, int]] = None
+        self._dense: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row_index(self, ids: Sequence[Any]) -> np.ndarray:
+        """id → 行号；不存在的 id 为 -1。"""
+        if self._row_of is None:
+            self._row_of = {i: r for r, i in enumerate(self.ids)}
+        return np.fromiter((self._row_of.get(i, -1) for i in ids), dtype=np.int64, count=len(ids))
+
+    def matrix(self, columns: Optional[Sequence[str]] = None) -> np.ndarray:
+        """解压后的 (行 × 特征) float32 矩阵；columns 指定特征顺序（如回归模型的 feature_names_in_）。"""
+        if self._dense is None:
+            n_feat = len(self.feature_names)
+            self._dense = np.empty((len(self), n_feat), dtype=np.float32)
+            for start in range(0, len(self), _CHUNK_ROWS):
+                block = np.asarray(self.bits[start:start + _CHUNK_ROWS])
+                self._dense[start:start + _CHUNK_ROWS] = np.unpackbits(block, axis=1, count=n_feat)
+        if columns is None:
+            return self._dense
+        col = {name: j for j, name in enumerate(self.feature_names)}
+        missing = [c for c in columns if c not in col]
+        if missing:
+            raise KeyError(f"特征存储中没有这些特征：{missing[:3]}…（共 {len(missing)} 个）")
+        return self._dense[:, [col[c] for c in columns]]
+
+    def counts(self, subsets: np.ndarray) -> np.ndarray:
+        """subsets: 长度为行数的 0/1 指示向量，或 (子集数 × 行数) 的指示矩阵 → 每个子集的特征计数。"""
+        indicator = np.asarray(subsets, dtype=np.float32)
+        return (indicator @ self.matrix()).round().astype(np.int64)
+
+    def counts_for_ids(self, ids: Sequence[Any]) -> np.ndarray:
+        rows = self.row_index(ids)
+        if (rows < 0).any():
+            logging.warning("%d/%d 个 id 不在特征存储中，已忽略", int((rows < 0).sum()), len(rows))
+        indicator = np.zeros(len(self), dtype=np.float32)
+        np.add.at(indicator, rows[rows >= 0], 1)
+        return self.counts(indicator)
+
+
+def experiment_counts(features: FeatureStore, store: PairStore, name: str) -> Dict[str, int]:
+    """实验中 is_swapped 为真的行（送人工标注的行）的特征计数，格式同 counts/*.json。"""
+    idx, flags = store.load_experiment(name)
+    ids = [
+        json.loads(store.get_line(i)).get("id")
+        for i, f in zip(idx, flags) if f & SWAPPED
+    ]
+    counts = features.counts_for_ids(ids)
+    return {feat: int(c) for feat, c in zip(features.feature_names, counts)}
+
+
+# ---------------------------------------------------------------------- CLI
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Bit-packed, memory-mapped per-row feature store",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", help="features.jsonl → 特征存储")
+    p.add_argument("--input_path", type=Path, required=True, help="每行一条数据的特征 JSONL")
+    p.add_argument("--output", type=Path, required=True, help="特征存储目录")
+    p.add_argument("--coef_path", type=Path, default=Path("regressor/linear/coef.jsonl"), help="分箱特征列表")
+    p.add_argument("--id_col", default="id")
+    p.add_argument("--force", action="store_true", help="源文件未变也重新构建")
+
+    p = sub.add_parser("counts", help="按 pairstore 中的实验重新计算 counts/*.json")
+    p.add_argument("--features", type=Path, required=True, help="特征存储目录")
+    p.add_argument("--store", type=Path, required=True, help="pairstore 目录")
+    p.add_argument("--output_dir", type=Path, required=True)
+    p.add_argument("experiments", nargs="*", help="默认全部实验")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+    if args.command == "build":
+        names, _ = load_coefficients(args.coef_path)
+        if build_store(args.input_path, names, args.output, args.id_col, args.force):
+            store = FeatureStore(args.output)
+            logging.info(
+                "✅ %d 行 × %d 个特征 → %s（%.1f KB）",
+                len(store), len(store.feature_names), args.output, store.bits.nbytes / 1024,
+            )
+        else:
+            logging.info("源文件未变化，跳过：%s", args.output)
+        return
+
+    features = FeatureStore(args.features)
+    store = PairStore(args.store)
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    names = args.experiments or store.experiments()
+    for name in names:
+        _write_json(args.output_dir / f"{name}.json", experiment_counts(features, store, name))
+    store.close()
+    logging.info("✅ %d 个实验的特征计数 → %s", len(names), args.output_dir)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
@@ -1,14 +1,20 @@
 import argparse
+import hashlib
 import json
 import logging
+import os
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Sequence, Tuple, Union
 
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
+from evalcache import EvalCache
+
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
@@ -77,6 +83,18 @@ SUBSET_MAPPING: Dict[str, List[str]] = {
 }
 
 
+# uuid / feature hash / swap count from an experiment name; each field is
+# searched independently so field order in the name does not matter
+EXPERIMENT_FIELDS = {
+    "uuid": re.compile(r"ID__([a-f0-9]+)__"),
+    "hash": re.compile(r"FEATS_(.*?)_SWAPS"),
+    "swaps": re.compile(r"SWAPS_(\d+)"),
+}
+_SEED_FILE = re.compile(r"model[_-]?(\d+)")
+_DECODER = json.JSONDecoder()
+_EXTRA_RESULTS_KEY = '"extra_results"'
+
+
 def get_args():
     """Parse CLI arguments."""
     parser = argparse.ArgumentParser(
@@ -86,8 +104,18 @@ def get_args():
     parser.add_argument(
         "--results_dir",
         type=Path,
-        required=True,
-        help="Directory containing per‑experiment *.json metrics files.",
+        default=None,
+        help="Directory containing per‑experiment *.json metrics files, and/or "
+        "per‑experiment subdirectories with one model<seed>.json per seed.",
+    )
+    parser.add_argument(
+        "--outcomes_path",
+        type=Path,
+        default=None,
+        help="Per-prompt outcome store written by rmeval.py (see outcomes.py). When given, "
+        "subset scores are computed from it instead of reading --results_dir. Only adapter-mode "
+        "evals (rmeval.py) write outcomes; merged-model rewardbench runs and existing results "
+        "in --results_dir are not in the store.",
     )
     parser.add_argument(
         "--output_path",
@@ -124,13 +152,62 @@ def get_args():
         default=None,
         help="Original dataset size (for budget scaling when using feature_counts_dir).",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=32,
+        help="Threads used to read metrics files (I/O bound, so more than the CPU count helps on network storage).",
+    )
+    parser.add_argument(
+        "--cache_path",
+        type=Path,
+        default=None,
+        help="SQLite cache of per-seed scores; only new or changed result files are re-read. "
+        "Defaults to <output_path dir>/.fetch_cache.sqlite; parsed feature counts are "
+        "pickled next to it (<cache_path>.counts.pkl).",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Re-read every metrics and feature-count file instead of using the caches.",
+    )
+    parser.add_argument(
+        "--example_counts",
+        type=json.loads,
+        default=None,
+        help="JSON object overriding EXAMPLE_COUNTS weights, e.g. '{\"math-prm\": 447}'.",
+    )
+    parser.add_argument(
+        "--drop_subsets",
+        nargs="+",
+        default=[],
+        help="Subsets left out of the category and Overall scores.",
+    )
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        default=0,
+        help="Stratified bootstrap resamples for an Overall confidence interval "
+        "(adds Overall_lo / Overall_hi); needs --outcomes_path. 0 disables it.",
+    )
+    parser.add_argument("--alpha", type=float, default=0.05, help="The CI covers 1 - alpha.")
+    parser.add_argument(
+        "--include_screened",
+        action="store_true",
+        help="With --outcomes_path, also use runs that were only scored on a screening subsample.",
+    )
+    args = parser.parse_args()
+    if args.results_dir is None and args.outcomes_path is None:
+        parser.error("one of --results_dir or --outcomes_path is required")
+    if args.bootstrap and args.outcomes_path is None:
+        parser.error("--bootstrap needs per-prompt outcomes (--outcomes_path)")
+    return args
 
 
 def main():
     args = get_args()
 
-    logging.info("Collecting experiments from %s", args.results_dir)
+    logging.info("Collecting experiments from %s", args.outcomes_path or args.results_dir)
 
     overall_df = fetch_evals_rewardbench(
         results_dir=args.results_dir,
@@ -139,6 +216,16 @@ def main():
         experiments_file=args.experiments_file,
         gpt4_threshold_score=args.gpt4_threshold_score,
         dataset_total_size=args.dataset_total_size,
+        workers=args.workers,
+        cache_path=None if args.no_cache else (
+            args.cache_path or args.output_path.parent / ".fetch_cache.sqlite"
+        ),
+        outcomes_path=args.outcomes_path,
+        include_screened=args.include_screened,
+        example_counts=args.example_counts,
+        drop_subsets=args.drop_subsets,
+        bootstrap=args.bootstrap,
+        alpha=args.alpha,
     )
 
     logging.info("Saving %d rows to %s", len(overall_df), args.output_path)
@@ -149,70 +236,63 @@ def main():
 
 def fetch_evals_rewardbench(
     *,
-    results_dir: Path,
+    results_dir: Optional[Path] = None,
     experiment_prefix: str = "",
     feature_counts_dir: Optional[Path] = None,
     experiments_file: Optional[Path] = None,
     gpt4_threshold_score: Optional[float] = None,
     dataset_total_size: Optional[int] = None,
+    workers: int = 32,
+    cache_path: Optional[Path] = None,
+    outcomes_path: Optional[Path] = None,
+    include_screened: bool = False,
+    example_counts: Optional[Dict[str, int]] = None,
+    drop_subsets: Sequence[str] = (),
+    bootstrap: int = 0,
+    alpha: float = 0.05,
 ) -> pd.DataFrame:
-    """Read local JSON metrics and assemble the full score dataframe."""
+    """Read local JSON metrics (or per-prompt outcomes) and assemble the full score dataframe."""
 
     # ------------------------------------------------------------------
     # 1. Load subset scores ------------------------------------------------
     # ------------------------------------------------------------------
-    metric_files = [
-        p for p in results_dir.glob("*.json") if p.stem.startswith(experiment_prefix)
-    ]
-    if not metric_files:
-        raise FileNotFoundError(
-            f"No *.json files starting with '{experiment_prefix}' found in {results_dir}"
+    df_seed_counts = None
+    if outcomes_path is not None:
+        df_seed_scores, df_seed_counts = load_outcome_scores(
+            outcomes_path, experiment_prefix, include_screened
         )
-
-    logging.info("Found %d metric files matching prefix", len(metric_files))
-
-    subset_scores = {}
-    for fp in tqdm(metric_files, desc="reading metrics"):
-        with open(fp, "r") as f:
-            raw = json.load(f)
-
-        # Some evaluation scripts store subset scores under a nested key, commonly
-        # called "extra_results".  Detect that and flatten automatically.
-        if isinstance(raw, dict) and "extra_results" in raw and isinstance(raw["extra_results"], dict):
-            metrics_dict = raw["extra_results"]
-        else:
-            metrics_dict = raw
-
-        # Keep only scalar numeric entries — drop paths, model names, etc.
-        numeric_metrics = {
-            k: v for k, v in metrics_dict.items() if isinstance(v, (int, float))
-        }
-        subset_scores[fp.stem] = numeric_metrics
-
-    # Build DataFrame restricted to known subset columns
-    df_subset_scores = pd.DataFrame(subset_scores).transpose()
-    known_cols = [c for c in df_subset_scores.columns if c in EXAMPLE_COUNTS]
-    if not known_cols:
+    else:
+        df_seed_scores = load_metric_scores(results_dir, experiment_prefix, workers, cache_path)
+    if drop_subsets:
+        logging.info("Dropping subsets: %s", ", ".join(drop_subsets))
+        df_seed_scores = df_seed_scores.drop(columns=list(drop_subsets), errors="ignore")
+    if not any(c in EXAMPLE_COUNTS for c in df_seed_scores.columns):
         logging.error(
             "None of the recognised subset names were found. Available columns: %s",
-            list(df_subset_scores.columns),
+            list(df_seed_scores.columns),
         )
-    else:
-        df_subset_scores = df_subset_scores[known_cols]
-    # ------------------------------------------------------------------
-    # 2. Compute category & overall scores ---------------------------------
-    # ------------------------------------------------------------------ and drop non‑subset columns like 'model'
-    df_subset_scores = (
-        pd.DataFrame(subset_scores).transpose().drop(columns=["model"], errors="ignore")
-    )
 
     # ------------------------------------------------------------------
     # 2. Compute category & overall scores ---------------------------------
     # ------------------------------------------------------------------
+    # Always over the full frame: which subsets count as present depends on all
+    # files, so cached and --no_cache runs must not compute this per batch.
     logging.info("Computing category scores…")
-    df_category_scores = get_category_scores(df_subset_scores).sort_values(
-        by="Overall", ascending=False
-    )
+    df_seed_categories = get_category_scores(df_seed_scores, example_counts)
+    df_subset_scores, df_category_scores = aggregate_seeds(df_seed_scores, df_seed_categories)
+    if bootstrap:
+        logging.info("Bootstrapping Overall (%d resamples)…", bootstrap)
+        ci = bootstrap_overall(
+            df_seed_scores,
+            df_seed_counts[df_seed_scores.columns],
+            n_boot=bootstrap,
+            alpha=alpha,
+            groups=df_seed_scores.index.get_level_values("experiment"),
+            example_counts=example_counts,
+        )
+        df_category_scores["Overall_lo"] = ci["Overall_lo"]
+        df_category_scores["Overall_hi"] = ci["Overall_hi"]
+    df_category_scores = df_category_scores.sort_values(by="Overall", ascending=False)
 
     # ------------------------------------------------------------------
     # 3. Merge with feature counts or mapping (optional) -------------------
@@ -226,42 +306,30 @@ def fetch_evals_rewardbench(
         df_subset_scores = df_subset_scores[df_subset_scores.index.str.contains("ID")]
 
         # Extract uuid + budget from experiment name
-        df_category_scores["uuid"] = df_category_scores.index.to_series().apply(
-            lambda x: re.search(r"ID__([a-f0-9]+)__", x).group(1)
-        )
-        df_category_scores["budget"] = df_category_scores.index.to_series().apply(
-            lambda x: int(re.search(r"SWAPS_(\d+)", x).group(1))
-        )
+        parts = parse_experiment_names(df_category_scores.index)
+        df_category_scores["uuid"] = parts["uuid"]
+        df_category_scores["budget"] = parts["swaps"].astype(int)
         if dataset_total_size:
-            df_category_scores["budget"] = df_category_scores["budget"].apply(
-                lambda x: int(x * 7000 / dataset_total_size)
-            )
+            df_category_scores["budget"] = (
+                df_category_scores["budget"] * 7000 / dataset_total_size
+            ).astype(int)
 
-        df_subset_scores["uuid"] = df_subset_scores.index.to_series().apply(
-            lambda x: re.search(r"ID__([a-f0-9]+)__", x).group(1)
-        )
+        df_subset_scores["uuid"] = parse_experiment_names(df_subset_scores.index)["uuid"]
 
         # Read feature‑count JSONs (one file per experiment)
-        feats = []
-        for feat_file in feature_counts_dir.glob("*.json"):
-            uuid_match = re.search(r"ID__([a-f0-9]+)__", feat_file.stem)
-            if not uuid_match:
-                continue
-            uuid = uuid_match.group(1)
-            with open(feat_file) as f:
-                feat_dict = json.load(f)
-            df_feat = (
-                pd.Series(feat_dict, name=uuid)
-                .to_frame()
-                .transpose()
-                .reset_index()
-                .rename(columns={"index": "uuid"})
-            )
-            feats.append(df_feat)
-        df_feats = pd.concat(feats, ignore_index=True)
+        df_feats = load_feature_counts(
+            feature_counts_dir,
+            workers=workers,
+            cache_path=cache_path and cache_path.with_name(cache_path.name + ".counts.pkl"),
+        )
 
         df_scores = df_category_scores.merge(df_subset_scores, on="uuid", how="left")
-        overall_df = df_scores.merge(df_feats, on="uuid", how="left").dropna()
+        overall_df = df_scores.merge(df_feats, on="uuid", how="left")
+        # Seed statistics are legitimately NaN (e.g. Overall_std of a single-seed
+        # experiment); only rows missing scores or feature counts are dropped.
+        overall_df = overall_df.dropna(
+            subset=[c for c in overall_df.columns if c not in SEED_STAT_COLUMNS]
+        )
 
     elif experiments_file:
         logging.info("Merging with experiments_file=%s", experiments_file)
@@ -272,17 +340,9 @@ def fetch_evals_rewardbench(
             experiments_file=experiments_file,
         )
 
-        def extract_hash(s: str):
-            m = re.search(r"FEATS_(.*?)_SWAPS", s)
-            return m.group(1) if m else None
-
-        def extract_swaps(s: str):
-            m = re.search(r"SWAPS_(\d+)", s)
-            return int(m.group(1)) if m else None
-
         for df_ in (df_feats, df_category_scores, df_subset_scores):
-            df_["hash"] = df_.index.to_series().apply(extract_hash)
-        df_feats["num_swaps"] = df_feats.index.to_series().apply(extract_swaps)
+            df_["hash"] = parse_experiment_names(df_.index)["hash"]
+        df_feats["num_swaps"] = pd.to_numeric(parse_experiment_names(df_feats.index)["swaps"])
 
         overall_df = (
             pd.merge(df_feats, df_category_scores, on="hash", how="inner")
@@ -317,8 +377,312 @@ def fetch_evals_rewardbench(
     return overall_df
 
 
-def get_category_scores(df_subset: pd.DataFrame) -> pd.DataFrame:
-    """Weighted category + overall averages, tolerant to missing columns."""
+def load_metric_scores(
+    results_dir: Path,
+    experiment_prefix: str = "",
+    workers: int = 32,
+    cache_path: Optional[Path] = None,
+) -> pd.DataFrame:
+    """Per-seed subset scores from the metrics files."""
+    # The cache tracks the whole results_dir so a prefix never looks like deleted files
+    all_files = discover_metric_files(results_dir)
+    discovered = [d for d in all_files if d[0].startswith(experiment_prefix)]
+    if not discovered:
+        raise FileNotFoundError(
+            f"No *.json files starting with '{experiment_prefix}' found in {results_dir}"
+        )
+
+    logging.info(
+        "Found %d metric files for %d experiments matching prefix",
+        len(discovered), len({exp for exp, _, _ in discovered}),
+    )
+
+    index = pd.MultiIndex.from_tuples(
+        [(exp, seed) for exp, seed, _ in discovered], names=["experiment", "seed"]
+    )
+    if cache_path is None:
+        df_seed_scores = load_subset_scores([p for _, _, p in discovered], workers=workers)
+        df_seed_scores.index = index
+        return df_seed_scores
+    return scores_frame(sync_cache(cache_path, results_dir, all_files, discovered, workers), index)
+
+
+def load_outcome_scores(
+    outcomes_path: Path, experiment_prefix: str = "", include_screened: bool = False
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Per-seed subset accuracies and scored-prompt counts from the outcome store.
+
+    Both come from one matrix product of the unpacked (runs × prompts) bits with a
+    (prompts × subsets) indicator. Runs that were only scored on a screening
+    subsample are skipped unless ``include_screened``. Only rmeval.py (adapter
+    mode) writes outcomes; merged-model rewardbench results never reach the store.
+    """
+    from outcomes import OutcomeStore
+
+    store = OutcomeStore(outcomes_path)
+    keys = store.keys(experiment_prefix)
+    if not keys:
+        raise FileNotFoundError(
+            f"No outcomes for experiments starting with '{experiment_prefix}' in {outcomes_path}"
+        )
+    correct, scored = store.outcomes(keys)
+    if not include_screened:
+        full = scored.all(axis=1)
+        if not full.all():
+            logging.info("Skipping %d screened-only runs", int((~full).sum()))
+        keys = [key for key, keep in zip(keys, full) if keep]
+        correct, scored = correct[full], scored[full]
+    logging.info(
+        "Loaded outcomes of %d runs (%d experiments) × %d prompts",
+        len(keys), len({exp for exp, _ in keys}), correct.shape[1],
+    )
+
+    # Subset columns in metrics-file order: rewardbench and rmeval.summarize both
+    # write extra_results sorted by subset name, so the two paths give identical CSVs.
+    names = sorted(set(store.subsets.tolist()))
+    inverse = pd.Index(names).get_indexer(store.subsets)
+    indicator = np.zeros((len(inverse), len(names)), dtype=np.float32)
+    indicator[np.arange(len(inverse)), inverse] = 1
+    # float32 sums of 0/1 are exact; divide in float64 to match the metrics files
+    hits = (correct.astype(np.float32) @ indicator).astype(np.float64)
+    counts = (scored.astype(np.float32) @ indicator).astype(np.float64)
+    accuracy = np.where(counts > 0, hits / np.maximum(counts, 1), np.nan)
+
+    index = pd.MultiIndex.from_tuples(keys, names=["experiment", "seed"])
+    return (
+        pd.DataFrame(accuracy, index=index, columns=names),
+        pd.DataFrame(counts.astype(np.int64), index=index, columns=names),
+    )
+
+
+def discover_metric_files(results_dir: Path, experiment_prefix: str = "") -> List[Tuple[str, str, Path]]:
+    """(experiment, seed, path) for every metrics file, found in one directory walk.
+
+    ``<results_dir>/<exp>.json`` is a single run (seed ""); a file inside a
+    subdirectory belongs to the experiment named by that directory, with the seed
+    taken from ``model<seed>.json``. Hidden directories such as
+    ``.ipynb_checkpoints`` are skipped.
+    """
+    found = []
+    for root, dirs, files in os.walk(results_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        nested = Path(root) != results_dir
+        for name in sorted(files):
+            if not name.endswith(".json") or name.startswith("."):
+                continue
+            stem = name[: -len(".json")]
+            if nested:
+                experiment = Path(root).name
+                m = _SEED_FILE.fullmatch(stem)
+                seed = m.group(1) if m else stem
+            else:
+                experiment, seed = stem, ""
+            if experiment.startswith(experiment_prefix):
+                found.append((experiment, seed, Path(root) / name))
+    return found
+
+
+# Columns added by aggregate_seeds / bootstrap_overall on top of the scores.
+SEED_STAT_COLUMNS = ("Overall_std", "n_seeds", "weight", "Overall_lo", "Overall_hi")
+
+
+def aggregate_seeds(
+    df_seed_subsets: pd.DataFrame, df_seed_categories: pd.DataFrame
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Average per-seed scores per experiment and attach the seed spread.
+
+    Adds ``Overall_std``, ``n_seeds`` and ``weight`` to the category frame.
+    ``weight`` is the inverse variance of the mean Overall score (n / s²), with
+    each experiment's variance shrunk towards the pooled variance so single-seed
+    experiments still get a finite weight; it is normalised to mean 1 and can be
+    used as a regressor sample weight.
+    """
+    subsets = df_seed_subsets.groupby(level="experiment", sort=False).mean()
+    grouped = df_seed_categories.groupby(level="experiment", sort=False)
+    categories = grouped.mean()
+
+    n = grouped.size()
+    var = grouped["Overall"].var(ddof=1)
+    categories["Overall_std"] = np.sqrt(var)
+    categories["n_seeds"] = n
+
+    multi = n > 1
+    if multi.any():
+        pooled = float(((n[multi] - 1) * var[multi]).sum() / (n[multi] - 1).sum())
+        shrunk = ((n - 1) * var.fillna(0) + pooled) / n
+        weight = n / shrunk.where(shrunk > 0, np.nan)
+        weight = weight.fillna(weight.max() if weight.notna().any() else 1.0)
+    else:
+        weight = n.astype(float)
+    categories["weight"] = weight / weight.mean()
+
+    subsets.index.name = categories.index.name = None
+    return subsets, categories
+
+
+def read_subset_metrics(path: Path) -> Dict[str, float]:
+    """Numeric subset scores from one metrics file.
+
+    Only the ``extra_results`` object is decoded; the model/tokenizer paths and other
+    top-level fields are skipped. Files without that key are parsed in full and
+    their top-level numeric entries are used instead.
+    """
+    return parse_subset_metrics(path.read_text())
+
+
+def parse_subset_metrics(text: str) -> Dict[str, float]:
+    metrics = None
+    pos = text.find(_EXTRA_RESULTS_KEY)
+    if pos >= 0:
+        start = text.find(":", pos + len(_EXTRA_RESULTS_KEY)) + 1
+        while start < len(text) and text[start].isspace():
+            start += 1
+        try:
+            metrics, _ = _DECODER.raw_decode(text, start)
+        except ValueError:
+            metrics = None
+    if not isinstance(metrics, dict):
+        raw = json.loads(text)
+        if isinstance(raw, dict) and isinstance(raw.get("extra_results"), dict):
+            metrics = raw["extra_results"]
+        else:
+            metrics = raw
+
+    # Keep only scalar numeric entries — drop paths, model names, etc.
+    return {k: v for k, v in metrics.items() if isinstance(v, (int, float))}
+
+
+def load_subset_scores(metric_files: Sequence[Path], workers: int = 32) -> pd.DataFrame:
+    """Read metrics files on a thread pool into one (files × subsets) float matrix."""
+    # Submit files in chunks: per-future overhead dominates when files are small and local
+    chunk = max(1, min(256, len(metric_files) // (4 * max(1, workers)) or 1))
+    chunks = [metric_files[i:i + chunk] for i in range(0, len(metric_files), chunk)]
+    results: List[Dict[str, float]] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool, tqdm(
+        total=len(metric_files), desc="reading metrics"
+    ) as bar:
+        for part in pool.map(lambda files: [read_subset_metrics(p) for p in files], chunks):
+            results.extend(part)
+            bar.update(len(part))
+
+    return scores_frame(results, [p.stem for p in metric_files])
+
+
+def scores_frame(results: Sequence[Dict[str, float]], index) -> pd.DataFrame:
+    """One row per result dict; columns in first-seen order, missing entries NaN."""
+    columns: Dict[str, int] = {}
+    for metrics in results:
+        for key in metrics:
+            columns.setdefault(key, len(columns))
+    values = np.full((len(results), len(columns)), np.nan)
+    for row, metrics in enumerate(results):
+        values[row, [columns[k] for k in metrics]] = list(metrics.values())
+    return pd.DataFrame(values, index=index, columns=list(columns))
+
+
+def feature_counts_fingerprint(feature_counts_dir: Path, files: Sequence[Path]) -> str:
+    """Hash of the directory and every counts file's name, size and mtime."""
+    h = hashlib.blake2b(str(feature_counts_dir.resolve()).encode(), digest_size=16)
+    for path in files:
+        st = path.stat()
+        h.update(f"{path.name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def load_feature_counts(
+    feature_counts_dir: Path, workers: int = 32, cache_path: Optional[Path] = None
+) -> pd.DataFrame:
+    """All ``*ID__<uuid>__*.json`` feature counts as one (uuid × feature) frame.
+
+    Files are parsed on a thread pool into a list of records and turned into a
+    DataFrame in a single call. With ``cache_path`` the frame is pickled together
+    with the directory fingerprint and reused while no counts file has changed.
+    """
+    files = []
+    for path in sorted(feature_counts_dir.glob("*.json")):
+        uuid = experiment_uuid(path.stem)
+        if uuid:
+            files.append((uuid, path))
+
+    fingerprint = feature_counts_fingerprint(feature_counts_dir, [p for _, p in files])
+    if cache_path is not None and cache_path.exists():
+        try:
+            cached = pd.read_pickle(cache_path)
+            if cached.get("fingerprint") == fingerprint:
+                logging.info("Feature counts unchanged, using cache %s", cache_path)
+                return cached["frame"]
+        except Exception as e:  # corrupt / written by another pandas version
+            logging.warning("Ignoring feature-count cache %s: %s", cache_path, e)
+
+    def read(item):
+        uuid, path = item
+        with open(path) as f:
+            return {"uuid": uuid, **json.load(f)}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        records = list(tqdm(pool.map(read, files), total=len(files), desc="reading feature counts"))
+    df_feats = pd.DataFrame.from_records(records)
+
+    if cache_path is not None:
+        tmp = cache_path.with_name(cache_path.name + ".tmp")
+        pd.to_pickle({"fingerprint": fingerprint, "frame": df_feats}, tmp)
+        os.replace(tmp, cache_path)
+    return df_feats
+
+
+def sync_cache(
+    cache_path: Path,
+    results_dir: Path,
+    all_files: List[Tuple[str, str, Path]],
+    discovered: List[Tuple[str, str, Path]],
+    workers: int = 32,
+) -> List[Dict[str, float]]:
+    """Bring the score cache up to date with results_dir and return the subset scores of ``discovered``.
+
+    Only files whose size/mtime changed are read; of those, only files whose
+    content hash changed are re-parsed.
+    """
+    cache = EvalCache(cache_path, results_dir)
+    try:
+        stale = cache.stale(all_files)
+
+        def read(item):
+            exp, seed, path = item
+            st = os.stat(path)
+            data = path.read_bytes()
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            if digest == cache.cached_hash((exp, seed)):
+                return item, st, digest, None
+            return item, st, digest, parse_subset_metrics(data.decode("utf-8"))
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            read_back = list(tqdm(pool.map(read, stale), total=len(stale), desc="reading changed metrics"))
+
+        changed = [r for r in read_back if r[3] is not None]
+        for (exp, seed, path), st, _, _ in (r for r in read_back if r[3] is None):
+            cache.touch((exp, seed), path, st.st_size, st.st_mtime_ns)
+        for (exp, seed, path), st, digest, subsets in changed:
+            cache.store((exp, seed), path, st.st_size, st.st_mtime_ns, digest, subsets)
+        removed = cache.prune((exp, seed) for exp, seed, _ in all_files)
+        cache.commit()
+        logging.info(
+            "Score cache %s: %d re-scored, %d unchanged content, %d removed, %d cached",
+            cache_path, len(changed), len(read_back) - len(changed), removed,
+            len(all_files) - len(read_back),
+        )
+        return cache.load([(exp, seed) for exp, seed, _ in discovered])
+    finally:
+        cache.close()
+
+
+def get_category_scores(
+    df_subset: pd.DataFrame, example_counts: Optional[Dict[str, int]] = None
+) -> pd.DataFrame:
+    """Weighted category + overall averages, tolerant to missing columns.
+
+    ``example_counts`` overrides entries of ``EXAMPLE_COUNTS``.
+    """
+    counts = {**EXAMPLE_COUNTS, **(example_counts or {})}
 
     category_scores = {}
     missing_any = False
@@ -331,7 +695,7 @@ def get_category_scores(df_subset: pd.DataFrame) -> pd.DataFrame:
             )
             missing_any = True
             continue
-        weights = {k: v for k, v in EXAMPLE_COUNTS.items() if k in present}
+        weights = {k: v for k, v in counts.items() if k in present}
         category_scores[category] = (
             df_subset[present] * pd.Series(weights)
         ).sum(axis=1) / sum(weights.values())
@@ -354,6 +718,86 @@ def get_category_scores(df_subset: pd.DataFrame) -> pd.DataFrame:
     return df_category
 
 
+def overall_weights(
+    subsets: Sequence[str], example_counts: Optional[Dict[str, int]] = None
+) -> pd.Series:
+    """Weight of each subset in ``Overall``, matching ``get_category_scores``.
+
+    Each category present contributes equally; within a category, subsets are
+    weighted by ``EXAMPLE_COUNTS`` (with ``example_counts`` overrides). Subsets
+    outside ``SUBSET_MAPPING`` get 0.
+    """
+    counts = {**EXAMPLE_COUNTS, **(example_counts or {})}
+    present = set(subsets)
+    weights = pd.Series(0.0, index=list(subsets))
+    categories = [[s for s in members if s in present] for members in SUBSET_MAPPING.values()]
+    categories = [members for members in categories if members]
+    for members in categories:
+        total = sum(counts[s] for s in members)
+        for s in members:
+            weights[s] = counts[s] / total / len(categories)
+    return weights
+
+
+def bootstrap_overall(
+    accuracy: pd.DataFrame,
+    n: Union[pd.Series, pd.DataFrame],
+    n_boot: int = 1000,
+    alpha: float = 0.05,
+    seed: int = 0,
+    groups: Optional[Sequence] = None,
+    example_counts: Optional[Dict[str, int]] = None,
+    chunk: int = 256,
+) -> pd.DataFrame:
+    """``Overall`` with a stratified-bootstrap confidence interval per model.
+
+    ``accuracy`` is (models × subsets); ``n`` is the number of prompts each
+    subset was scored on, per subset (Series) or per model and subset (DataFrame).
+    Resampling a subset's n outcomes with replacement is a Binomial(n, acc)
+    draw, so each chunk of models is resampled in one call. With ``groups``
+    (e.g. the experiment of each seed) the resampled scores are averaged per
+    group before taking quantiles. Returns ``Overall``, ``Overall_lo`` and
+    ``Overall_hi`` columns.
+    """
+    weights = overall_weights(list(accuracy.columns), example_counts).to_numpy()
+    # subsets a model was not scored on count as 0, as in get_category_scores
+    p = np.nan_to_num(accuracy.to_numpy(dtype=float))
+    if isinstance(n, pd.DataFrame):
+        counts = n.reindex(index=accuracy.index, columns=accuracy.columns).to_numpy(dtype=np.int64)
+    else:
+        counts = np.broadcast_to(n.reindex(accuracy.columns).to_numpy(dtype=np.int64), p.shape)
+    rng = np.random.default_rng(seed)
+    boot = np.empty((n_boot, len(p)))
+    for start in range(0, len(p), chunk):
+        c = counts[start:start + chunk]
+        draws = rng.binomial(c, p[start:start + chunk], size=(n_boot, *c.shape)) / np.maximum(c, 1)
+        boot[:, start:start + chunk] = draws @ weights
+    point = p @ weights
+    index = accuracy.index
+    if groups is not None:
+        codes, uniques = pd.factorize(np.asarray(groups))
+        index = pd.Index(uniques)
+        mean = np.zeros((len(p), len(index)))
+        mean[np.arange(len(p)), codes] = 1
+        mean /= mean.sum(axis=0)
+        boot, point = boot @ mean, point @ mean
+    lo, hi = np.quantile(boot, [alpha / 2, 1 - alpha / 2], axis=0)
+    return pd.DataFrame({"Overall": point, "Overall_lo": lo, "Overall_hi": hi}, index=index)
+
+
+def parse_experiment_names(names: pd.Index) -> pd.DataFrame:
+    """uuid / hash / swaps columns (NaN where absent), indexed like ``names``."""
+    names = names.to_series()
+    return pd.DataFrame(
+        {field: names.str.extract(pattern, expand=False) for field, pattern in EXPERIMENT_FIELDS.items()}
+    )
+
+
+def experiment_uuid(name: str) -> Optional[str]:
+    m = EXPERIMENT_FIELDS["uuid"].search(name)
+    return m.group(1) if m else None
+
+
 def get_features(
     df: pd.DataFrame,
     col_name: str,
@@ -375,14 +819,18 @@ def get_features(
                 experiment_to_feats[exp_id] = [f.replace("-", "=") for f in features.split("___")]
 
     unique_feats = sorted({f for feats in experiment_to_feats.values() for f in feats})
-    df_feats = pd.DataFrame(
-        [
-            {feat: int(feat in feats) for feat in unique_feats}
-            for feats in experiment_to_feats.values()
-        ],
-        index=list(experiment_to_feats.keys()),
+    column = {feat: i for i, feat in enumerate(unique_feats)}
+    # One-hot matrix filled with a single fancy-indexing assignment
+    lengths = [len(feats) for feats in experiment_to_feats.values()]
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    cols = np.fromiter(
+        (column[f] for feats in experiment_to_feats.values() for f in feats),
+        dtype=np.int64,
+        count=sum(lengths),
     )
-    return df_feats
+    matrix = np.zeros((len(lengths), len(unique_feats)), dtype=np.uint8)
+    matrix[rows, cols] = 1
+    return pd.DataFrame(matrix, index=list(experiment_to_feats.keys()), columns=unique_feats)
 
 
 if __name__ == "__main__":
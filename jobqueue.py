@@ -0,0 +1,448 @@
+"""
+run.py 使用的持久化任务队列（SQLite，WAL 模式）。
+
+每个任务 = (train_dir, exp, stage)，stage 为 train / merge / eval（见 run.py --pipeline），状态流转：
+
+    pending → claimed → running → done
+                              └→ failed
+
+* 领取任务在 BEGIN IMMEDIATE 事务里完成，多个 run.py 进程共用一个队列也不会重复训练；
+* 运行中的任务定期写 heartbeat_at，超过超时时间没有心跳的 claimed/running 任务会被放回 pending；
+* wait_experiments.txt / ready_experiments.txt 仍由 run.py 按队列状态导出，供其它脚本读取。
+
+python jobqueue.py status --db /root/autodl-tmp/HP/train/queue.sqlite
+python jobqueue.py requeue --db ... --state failed
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PENDING = "pending"
+CLAIMED = "claimed"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+STATES = (PENDING, CLAIMED, RUNNING, DONE, FAILED)
+
+TRAIN = "train"
+MERGE = "merge"
+EVAL = "eval"
+STAGES = (TRAIN, MERGE, EVAL)
+
+# 列名 → 类型；新增列只需加在这里，打开旧队列时会自动 ALTER TABLE
+COLUMNS: Dict[str, str] = {
+    "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+    "train_dir": "TEXT NOT NULL",
+    "exp": "TEXT NOT NULL",
+    "state": f"TEXT NOT NULL DEFAULT '{PENDING}'",
+    "priority": "REAL NOT NULL DEFAULT 0",
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "worker": "TEXT",
+    "created_at": "REAL",
+    "claimed_at": "REAL",
+    "started_at": "REAL",
+    "heartbeat_at": "REAL",
+    "finished_at": "REAL",
+    "exit_code": "INTEGER",
+    "error": "TEXT",
+    "failure": "TEXT",       # 失败分类（oom / data / killed / unknown）
+    "not_before": "REAL NOT NULL DEFAULT 0",  # 重试退避：此时间之前不会被领取
+    "config": "TEXT",        # 覆盖默认 <train_dir>/<exp>.yaml 的配置文件（如 OOM 变体）
+    "manifest": "TEXT",      # sweep.py 生成的清单；设置时 YAML 在任务启动时才渲染
+    "work": "REAL",          # 工作量（样本数 × epoch × 种子数），见 runtime.py
+    "est_seconds": "REAL",   # 预测耗时
+    "wall_seconds": "REAL",  # 成功完成时的实际耗时（各次尝试的运行时间之和）
+    "run_seconds": "REAL NOT NULL DEFAULT 0",  # 之前各次尝试（续训、重试、被回收）已运行的时间
+    "stage": f"TEXT NOT NULL DEFAULT '{TRAIN}'",
+}
+UNIQUE_KEY = "UNIQUE(train_dir, exp, stage)"
+
+
+def _elapsed(until: str = "?") -> str:
+    """本次尝试已运行的时间（只有 running 的任务有 started_at）；UPDATE 中引用的是更新前的状态。"""
+    return f"CASE WHEN state = '{RUNNING}' THEN MAX({until} - started_at, 0) ELSE 0 END"
+
+
+@dataclass
+class Job:
+    id: int
+    train_dir: Path
+    exp: str
+    attempts: int = 0
+    config: Optional[str] = None
+    manifest: Optional[str] = None
+    stage: str = TRAIN
+    worker: Optional[str] = None  # 领取该任务的 worker；finish/retry/release 据此确认所有权
+
+    @property
+    def base_yaml_path(self) -> Path:
+        return self.train_dir / f"{self.exp}.yaml"
+
+    @property
+    def yaml_path(self) -> Path:
+        return Path(self.config) if self.config else self.base_yaml_path
+
+    @property
+    def label(self) -> str:
+        label = f"{self.train_dir.name}/{self.exp}"
+        return label if self.stage == TRAIN else f"{label} [{self.stage}]"
+
+
+def worker_id(slot: Optional[str] = None) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{slot}"
+
+
+class JobQueue:
+    def __init__(self, path: os.PathLike, timeout: float = 60.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._tx() as conn:
+            cols = ",\n  ".join(f"{k} {v}" for k, v in COLUMNS.items())
+            conn.execute(f"CREATE TABLE IF NOT EXISTS jobs (\n  {cols},\n  {UNIQUE_KEY}\n)")
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, decl in COLUMNS.items():
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+            sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'jobs'").fetchone()[0]
+            if UNIQUE_KEY not in sql:
+                # 旧队列的唯一键是 (train_dir, exp)：重建表，同一实验的各阶段各占一行
+                names = ", ".join(COLUMNS)
+                conn.execute(f"CREATE TABLE jobs_new (\n  {cols},\n  {UNIQUE_KEY}\n)")
+                conn.execute(f"INSERT INTO jobs_new ({names}) SELECT {names} FROM jobs")
+                conn.execute("DROP TABLE jobs")
+                conn.execute("ALTER TABLE jobs_new RENAME TO jobs")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, priority)")
+
+    # ------------------------------------------------------------------ 连接
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程使用，每个槽位线程各自一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _tx(self):
+        return _Transaction(self.conn)
+
+    # ------------------------------------------------------------------ 写入
+    def enqueue(
+        self,
+        train_dir: Path,
+        exps: Iterable[str],
+        priority: float = 0.0,
+        manifest: Optional[Path] = None,
+    ) -> int:
+        """加入新任务；已存在的任务（包括已完成的）保持原状态，返回新增数量。"""
+        now = time.time()
+        manifest = str(manifest) if manifest is not None else None
+        with self._tx() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (train_dir, exp, priority, created_at, manifest) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(str(train_dir), exp, priority, now, manifest) for exp in exps],
+            )
+            return conn.total_changes - before
+
+    def enqueue_stage(self, train_dir: Path, exp: str, stage: str, config: Path) -> None:
+        """训练完成后加入 merge / eval 任务；该阶段已完成或已失败时（例如重新训练过）重置为 pending。"""
+        self.conn.execute(
+            "INSERT INTO jobs (train_dir, exp, stage, config, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(train_dir, exp, stage) DO UPDATE SET state = ?, config = excluded.config, "
+            "attempts = 0, not_before = 0, worker = NULL, exit_code = NULL, error = NULL, failure = NULL, "
+            "run_seconds = 0 WHERE state IN (?, ?)",
+            (str(train_dir), exp, stage, str(config), time.time(), PENDING, DONE, FAILED),
+        )
+
+    def claim(self, worker: str, stage: str = TRAIN) -> Optional[Job]:
+        """原子地领取一个该阶段的 pending 任务（优先级高者、先入队者优先）。"""
+        jobs = self.claim_many(worker, stage, 1)
+        return jobs[0] if jobs else None
+
+    def claim_many(self, worker: str, stage: str, limit: int) -> List[Job]:
+        """在一个事务中领取至多 limit 个该阶段的 pending 任务，顺序同 claim。"""
+        now = time.time()
+        with self._tx() as conn:
+            ids = [row["id"] for row in conn.execute(
+                "SELECT id FROM jobs WHERE state = ? AND stage = ? AND not_before <= ? "
+                "ORDER BY priority DESC, id LIMIT ?",
+                (PENDING, stage, now, limit),
+            )]
+            conn.executemany(
+                "UPDATE jobs SET state = ?, worker = ?, claimed_at = ?, heartbeat_at = ?, "
+                "attempts = attempts + 1, exit_code = NULL, error = NULL WHERE id = ?",
+                [(CLAIMED, worker, now, now, job_id) for job_id in ids],
+            )
+            return [self.get(job_id) for job_id in ids]
+
+    # start / heartbeat 同样只更新仍归本 worker 的任务：被回收后又被别人领取的任务，
+    # 旧 worker 的心跳不能替新的所有者续命，否则新所有者退出后 reclaim_stale 回收不了
+    def start(self, job: Job) -> None:
+        now = time.time()
+        self.conn.execute(
+            "UPDATE jobs SET state = ?, started_at = ?, heartbeat_at = ? WHERE id = ? AND worker = ? AND state IN (?, ?)",
+            (RUNNING, now, now, job.id, job.worker, CLAIMED, RUNNING),
+        )
+
+    def heartbeat(self, job: Job) -> None:
+        self.conn.execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ? AND state IN (?, ?)",
+            (time.time(), job.id, job.worker, CLAIMED, RUNNING),
+        )
+
+    def finish(
+        self,
+        job: Job,
+        exit_code: int = 0,
+        error: Optional[str] = None,
+        failure: Optional[str] = None,
+        followups: Iterable[Tuple[str, str, Path]] = (),
+    ) -> bool:
+        """返回 False 表示任务已不归本 worker（被回收后又被别人领取），没有更新。
+
+        followups：[(exp, stage, config)]，与完成状态在同一事务中入队（见 enqueue_stage），
+        其它 worker 不会看到上游已完成、下游却还没入队的中间状态。
+        """
+        state = DONE if exit_code == 0 and error is None else FAILED
+        now = time.time()
+        with self._tx() as conn:
+            cur = conn.execute(
+                f"UPDATE jobs SET state = ?, finished_at = ?, exit_code = ?, error = ?, failure = ?, "
+                f"run_seconds = run_seconds + {_elapsed()}, "
+                f"wall_seconds = CASE WHEN ? = ? THEN run_seconds + {_elapsed()} END "
+                "WHERE id = ? AND worker = ? AND state IN (?, ?)",
+                (state, now, exit_code, error, failure, now, state, DONE, now, job.id, job.worker, CLAIMED, RUNNING),
+            )
+            if cur.rowcount == 0:
+                return False
+            for exp, stage, config in followups:
+                self.enqueue_stage(job.train_dir, exp, stage, config)
+        return True
+
+    def retry(
+        self,
+        job: Job,
+        delay: float,
+        exit_code: Optional[int] = None,
+        error: Optional[str] = None,
+        failure: Optional[str] = None,
+        config: Optional[str] = None,
+    ) -> bool:
+        """失败后放回 pending，delay 秒之后才能再次被领取；config 不为空时改用该配置。
+        返回值同 finish。"""
+        now = time.time()
+        cur = self.conn.execute(
+            "UPDATE jobs SET state = ?, worker = NULL, not_before = ?, exit_code = ?, error = ?, "
+            f"failure = ?, config = COALESCE(?, config), run_seconds = run_seconds + {_elapsed()} "
+            "WHERE id = ? AND worker = ? AND state IN (?, ?)",
+            (PENDING, now + delay, exit_code, error, failure, config, now, job.id, job.worker, CLAIMED, RUNNING),
+        )
+        return cur.rowcount > 0
+
+    def next_ready_at(self, stages: Iterable[str] = STAGES) -> Optional[float]:
+        """这些阶段中最早可领取的 pending 任务时间；没有 pending 任务时返回 None。"""
+        stages = list(stages)
+        marks = ",".join("?" * len(stages))
+        row = self.conn.execute(
+            f"SELECT MIN(not_before) AS t FROM jobs WHERE state = ? AND stage IN ({marks})", (PENDING, *stages)
+        ).fetchone()
+        return row["t"]
+
+    def release(self, job: Job, error: Optional[str] = None, refund: bool = False) -> bool:
+        """把已领取的任务放回 pending（例如被中断），不计入失败；refund 时退还本次领取计入的尝试次数。
+        返回值同 finish。"""
+        cur = self.conn.execute(
+            "UPDATE jobs SET state = ?, worker = NULL, error = ?, attempts = MAX(attempts - ?, 0), "
+            f"run_seconds = run_seconds + {_elapsed()} WHERE id = ? AND worker = ? AND state IN (?, ?)",
+            (PENDING, error, int(refund), time.time(), job.id, job.worker, CLAIMED, RUNNING),
+        )
+        return cur.rowcount > 0
+
+    def reclaim_stale(self, heartbeat_timeout: float) -> int:
+        """心跳超时的 claimed/running 任务放回 pending，返回数量。"""
+        cutoff = time.time() - heartbeat_timeout
+        with self._tx() as conn:
+            # 进程已无心跳：本次尝试的运行时间算到最后一次心跳为止
+            cur = conn.execute(
+                "UPDATE jobs SET state = ?, worker = NULL, error = 'stale claim reclaimed', "
+                f"run_seconds = run_seconds + {_elapsed('heartbeat_at')} WHERE state IN (?, ?) AND heartbeat_at < ?",
+                (PENDING, CLAIMED, RUNNING, cutoff),
+            )
+            return cur.rowcount
+
+    def reclaim_orphans(self) -> int:
+        """本机上进程已退出的 claimed/running 任务直接放回 pending，不必等心跳超时。"""
+        host = socket.gethostname()
+        n = 0
+        with self._tx() as conn:
+            rows = conn.execute(
+                "SELECT id, worker FROM jobs WHERE state IN (?, ?)", (CLAIMED, RUNNING)
+            ).fetchall()
+            for row in rows:
+                w_host, _, rest = (row["worker"] or "").partition(":")
+                pid = rest.partition(":")[0]
+                if w_host == host and pid.isdigit() and not _pid_alive(int(pid)):
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, worker = NULL, error = 'orphaned claim reclaimed', "
+                        f"run_seconds = run_seconds + {_elapsed('heartbeat_at')} WHERE id = ? AND worker = ?",
+                        (PENDING, row["id"], row["worker"]),
+                    )
+                    n += 1
+        return n
+
+    def requeue(self, state: str = FAILED, train_dir: Optional[Path] = None) -> int:
+        sql = "UPDATE jobs SET state = ?, worker = NULL, not_before = 0 WHERE state = ?"
+        params: list = [PENDING, state]
+        if train_dir is not None:
+            sql += " AND train_dir = ?"
+            params.append(str(train_dir))
+        return self.conn.execute(sql, params).rowcount
+
+    def set_estimates(self, rows: Iterable[tuple]) -> None:
+        """批量写入 (id, work, est_seconds, priority)；只更新仍在 pending 的任务。"""
+        with self._tx() as conn:
+            conn.executemany(
+                "UPDATE jobs SET work = ?, est_seconds = ?, priority = ? WHERE id = ? AND state = ?",
+                [(work, est, priority, job_id, PENDING) for job_id, work, est, priority in rows],
+            )
+
+    # ------------------------------------------------------------------ 查询
+    def get(self, job_id: int) -> Job:
+        row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(
+            row["id"], Path(row["train_dir"]), row["exp"], row["attempts"], row["config"], row["manifest"],
+            row["stage"], row["worker"],
+        )
+
+    def exps(self, train_dir: Path, states: Iterable[str], stage: str = TRAIN) -> List[str]:
+        states = list(states)
+        marks = ",".join("?" * len(states))
+        rows = self.conn.execute(
+            f"SELECT exp FROM jobs WHERE train_dir = ? AND stage = ? AND state IN ({marks}) ORDER BY id",
+            [str(train_dir), stage, *states],
+        )
+        return [r["exp"] for r in rows]
+
+    def counts(self, train_dir: Optional[Path] = None, stages: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        sql, where, params = "SELECT state, COUNT(*) AS n FROM jobs", [], []
+        if train_dir is not None:
+            where.append("train_dir = ?")
+            params.append(str(train_dir))
+        if stages is not None:
+            stages = list(stages)
+            where.append(f"stage IN ({','.join('?' * len(stages))})")
+            params += stages
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        out = {s: 0 for s in STATES}
+        for row in self.conn.execute(sql + " GROUP BY state", params):
+            out[row["state"]] = row["n"]
+        return out
+
+    def rows(self, states: Optional[Iterable[str]] = None, stage: Optional[str] = None) -> List[sqlite3.Row]:
+        where, params = [], []
+        if stage is not None:
+            where.append("stage = ?")
+            params.append(stage)
+        if states is not None:
+            states = list(states)
+            where.append(f"state IN ({','.join('?' * len(states))})")
+            params += states
+        sql = "SELECT * FROM jobs" + (" WHERE " + " AND ".join(where) if where else "")
+        order = " ORDER BY id" if states is None else " ORDER BY priority DESC, id"
+        return self.conn.execute(sql + order, params).fetchall()
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE … COMMIT：写锁在事务开始时就拿到，保证领取任务是原子的。"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """先写临时文件再 rename，崩溃时不会留下写了一半的文件。"""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+# ---------------------------------------------------------------------- CLI
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="查看 / 维护 run.py 的任务队列",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("status", help="按状态统计任务")
+    p.add_argument("--db", type=Path, required=True)
+    p.add_argument("-v", "--verbose", action="store_true", help="逐个列出任务")
+    p = sub.add_parser("requeue", help="把某个状态的任务放回 pending")
+    p.add_argument("--db", type=Path, required=True)
+    p.add_argument("--state", choices=STATES, default=FAILED)
+    p.add_argument("--train-dir", type=Path, default=None)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+    q = JobQueue(args.db)
+    if args.command == "status":
+        for stage in STAGES:
+            counts = q.counts(stages=(stage,))
+            if stage == TRAIN or any(counts.values()):
+                logging.info("%-5s %s", stage, counts)
+        if args.verbose:
+            for row in q.rows():
+                seconds = row["wall_seconds"] if row["wall_seconds"] is not None else row["est_seconds"]
+                logging.info(
+                    "%-8s %-5s attempts=%d %s/%s %s %s %s",
+                    row["state"], row["stage"], row["attempts"], Path(row["train_dir"]).name, row["exp"],
+                    "" if seconds is None else f"{'wall' if row['wall_seconds'] is not None else 'est'}={seconds:.0f}s",
+                    row["failure"] or "", row["error"] or "",
+                )
+    else:
+        logging.info("已放回 pending：%d 个任务", q.requeue(args.state, args.train_dir and args.train_dir.expanduser().resolve()))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
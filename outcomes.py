@@ -0,0 +1,182 @@
+"""
+逐条评估结果存储：每个 (实验, 种子) 在 rewardbench 每条数据上是否判对，按位压缩、内存映射读取。
+
+    <root>/prompts.json     {"ids": [...], "subsets": [...]}：列顺序，第一次写入时确定
+    <root>/outcomes.bin     每行 2 × ceil(条数 / 8) 字节：correct（chosen 奖励高于 rejected）与
+                            scored（该条已评估；分阶段评估的子样本结果只有部分为 1）两个 np.packbits 平面
+    <root>/outcomes.keys    每行一个 JSON [实验名, 种子]，与 outcomes.bin 的行一一对应
+
+只追加写入（flock 加锁，多个评估进程可同时写）；同一 (实验, 种子) 重新评估时追加新行，读取时以最后一行为准。
+fetch.py --outcomes_path 从这里计算子集准确率、任意权重的 Overall 与 bootstrap 置信区间，不需要 GPU。
+
+python outcomes.py stats --root /root/autodl-tmp/HP/eval_outcomes
+"""
+from __future__ import annotations
+
+import argparse
+import fcntl
+import json
+import logging
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_OUTCOME_ROOT = "/root/autodl-tmp/HP/eval_outcomes"
+_SEED_FILE = re.compile(r"model[_-]?(\d+)")
+_CHUNK_ROWS = 1 << 12
+
+Key = Tuple[str, str]  # (experiment, seed)
+
+
+def result_key(path: Path) -> Key:
+    """结果路径 → (实验, 种子)，与 fetch.discover_metric_files 的约定一致：
+    <results>/<实验名>/model<seed>.json，或 <results>/<实验名>.json（种子为空）。"""
+    m = _SEED_FILE.fullmatch(path.stem)
+    if m:
+        return path.parent.name, m.group(1)
+    return path.stem, ""
+
+
+class OutcomeStore:
+    def __init__(self, root: os.PathLike):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._prompts_path = self.root / "prompts.json"
+        self._bits_path = self.root / "outcomes.bin"
+        self._keys_path = self.root / "outcomes.keys"
+        self.prompt_ids: List[Any] = []
+        self.subsets = np.array([], dtype=str)
+        self._load()
+
+    # ------------------------------------------------------------------ 索引
+    def _load(self) -> None:
+        if self._prompts_path.is_file():
+            prompts = json.loads(self._prompts_path.read_text(encoding="utf-8"))
+            self.prompt_ids, self.subsets = prompts["ids"], np.asarray(prompts["subsets"])
+        self.width = (len(self.prompt_ids) + 7) // 8
+        # 最后一行没有换行符说明写到一半，丢弃
+        lines = self._keys_path.read_bytes().split(b"\n")[:-1] if self._keys_path.is_file() else []
+        size = self._bits_path.stat().st_size if self._bits_path.is_file() else 0
+        # 上次写入中途崩溃时，以两份文件中较短的为准
+        n = min(len(lines), size // (2 * self.width)) if self.width else 0
+        self.row_keys: List[Key] = [tuple(json.loads(line)) for line in lines[:n]]
+        self._keys_size = sum(len(line) + 1 for line in lines[:n])
+        self.latest: Dict[Key, int] = {key: r for r, key in enumerate(self.row_keys)}
+        self._bits: Optional[np.ndarray] = None
+
+    @property
+    def bits(self) -> np.ndarray:
+        """(行数, 2, width) uint8 的只读内存映射；[:, 0] 为 correct，[:, 1] 为 scored。"""
+        if self._bits is None:
+            if not self.row_keys:
+                return np.zeros((0, 2, self.width), dtype=np.uint8)
+            self._bits = np.memmap(
+                self._bits_path, dtype=np.uint8, mode="r", shape=(len(self.row_keys), 2, self.width)
+            )
+        return self._bits
+
+    def __len__(self) -> int:
+        return len(self.latest)
+
+    def keys(self, prefix: str = "") -> List[Key]:
+        return [key for key in self.latest if key[0].startswith(prefix)]
+
+    @contextmanager
+    def _locked(self):
+        with open(self.root / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # 其它进程可能已经追加过
+                self._load()
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # ------------------------------------------------------------------ 写入
+    def add(
+        self,
+        results: Sequence[Tuple[Key, np.ndarray, np.ndarray]],
+        prompt_ids: Sequence[Any],
+        subsets: Sequence[str],
+    ) -> None:
+        """results: [((实验, 种子), correct, scored)]，两个布尔向量按 prompt_ids 的顺序。"""
+        with self._locked():
+            if not self.prompt_ids:
+                tmp = self._prompts_path.with_name(self._prompts_path.name + ".tmp")
+                tmp.write_text(json.dumps({"ids": list(prompt_ids), "subsets": list(subsets)}), encoding="utf-8")
+                os.replace(tmp, self._prompts_path)
+                self._load()
+            column = {pid: j for j, pid in enumerate(self.prompt_ids)}
+            try:
+                cols = np.fromiter((column[pid] for pid in prompt_ids), dtype=np.int64, count=len(prompt_ids))
+            except KeyError as e:
+                raise ValueError(f"{self.root} 中没有评估数据 {e.args[0]!r}：评估集与已有结果不一致") from None
+            rows = np.zeros((len(results), 2, len(self.prompt_ids)), dtype=bool)
+            for r, (_, correct, scored) in enumerate(results):
+                rows[r, 0, cols] = correct
+                rows[r, 1, cols] = scored
+            # 截掉上次崩溃留下的半行；先写数据、后写索引
+            with self._bits_path.open("ab") as f:
+                f.truncate(len(self.row_keys) * 2 * self.width)
+                f.write(np.packbits(rows, axis=2).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with self._keys_path.open("ab") as f:
+                f.truncate(self._keys_size)
+                f.write("".join(json.dumps(list(key), ensure_ascii=False) + "\n" for key, _, _ in results).encode("utf-8"))
+            self._load()
+
+    # ------------------------------------------------------------------ 读取
+    def rows(self, keys: Sequence[Key]) -> np.ndarray:
+        return np.fromiter((self.latest[key] for key in keys), dtype=np.int64, count=len(keys))
+
+    def outcomes(self, keys: Sequence[Key]) -> Tuple[np.ndarray, np.ndarray]:
+        """(correct, scored)：两个 (len(keys) × 条数) 的 uint8 0/1 矩阵，分块解压。"""
+        rows = self.rows(keys)
+        n = len(self.prompt_ids)
+        correct = np.empty((len(rows), n), dtype=np.uint8)
+        scored = np.empty((len(rows), n), dtype=np.uint8)
+        for start in range(0, len(rows), _CHUNK_ROWS):
+            block = np.asarray(self.bits[rows[start:start + _CHUNK_ROWS]])
+            correct[start:start + _CHUNK_ROWS] = np.unpackbits(block[:, 0], axis=1, count=n)
+            scored[start:start + _CHUNK_ROWS] = np.unpackbits(block[:, 1], axis=1, count=n)
+        return correct, scored
+
+
+# ---------------------------------------------------------------------- CLI
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Per-prompt RewardBench outcome store",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("stats", help="存储概况")
+    p.add_argument("--root", type=Path, default=Path(os.getenv("OUTCOME_STORE", DEFAULT_OUTCOME_ROOT)))
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+    store = OutcomeStore(args.root)
+    keys = store.keys()
+    _, scored = store.outcomes(keys)
+    full = int((scored.sum(axis=1) == len(store.prompt_ids)).sum()) if len(keys) else 0
+    logging.info(
+        "%s：%d 条评估数据（%d 个子集），%d 个 (实验, 种子)（%d 个全量、%d 个子样本），%d 行，%.1f KB",
+        args.root, len(store.prompt_ids), len(set(store.subsets.tolist())), len(keys), full, len(keys) - full,
+        len(store.row_keys), store.bits.nbytes / 1024,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
@@ -0,0 +1,158 @@
+"""
+多种子打包训练：一个进程内依次训练同一实验的所有种子。
+
+yamlgenerate.py --packed 为每个实验生成一个描述文件 <output>/packed/<exp>.yaml，
+其中 `seed` / `output_dir` 保留 {seed} 占位符，`packed_seeds` 列出要训练的种子。
+本脚本（由 run.py 自动调用）在同一个解释器里对每个种子调用 LLaMA-Factory 的 run_exp：
+
+* import / CUDA 初始化只做一次，基座模型第二次起从页缓存读取；
+* 所有种子共用同一份 tokenized 数据集（tokenized_path，tokcache.py 的共享缓存），只分词一次；
+  描述文件没有 tokenized_path 时（yamlgenerate.py 未加 --tokenized_root）按 tokcache.py 的规则补上并组装；
+* 已训练完成的种子直接跳过，有 checkpoint 的种子自动续训，重试时不会从头再来。
+
+python packed_worker.py /root/autodl-tmp/HP/train/packed/<exp>.yaml
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import yaml
+
+from pairstore import PairStore
+from tokcache import DEFAULT_DATA_ROOT, DEFAULT_TOKENIZED_ROOT, ensure_from_text
+from yamlgenerate import latest_checkpoint, read_value, use_tokenized_cache
+
+
+def packed_seeds(text: str) -> List[int]:
+    value = read_value(text, "packed_seeds") or ""
+    return [int(s) for s in value.replace("[", "").replace("]", "").split(",") if s.strip()]
+
+
+def render_seed(text: str, seed: int) -> Dict[str, Any]:
+    """把描述文件渲染成单个种子的 LLaMA-Factory 参数字典。"""
+    cfg = yaml.safe_load(text.replace("{seed}", str(seed)))
+    cfg.pop("packed_seeds", None)
+    return cfg
+
+
+def seed_finished(output_dir: Path) -> bool:
+    # run_exp 正常结束时会写出 train_results.json / all_results.json
+    return (output_dir / "all_results.json").is_file()
+
+
+def has_tokenized_path(text: str) -> bool:
+    value = read_value(text, "tokenized_path")
+    return bool(value) and value != "null"
+
+
+def plan(text: str) -> List[Tuple[int, Dict[str, Any]]]:
+    jobs = []
+    for seed in packed_seeds(text):
+        cfg = render_seed(text, seed)
+        cfg["overwrite_cache"] = False
+        jobs.append((seed, cfg))
+    return jobs
+
+
+def train_seed(seed: int, cfg: Dict[str, Any]) -> None:
+    from llamafactory.train.tuner import run_exp
+
+    output_dir = Path(cfg["output_dir"])
+    ckpt = latest_checkpoint(output_dir)
+    if ckpt is not None:
+        logging.info("⏯ seed %d 从 %s 继续训练", seed, ckpt)
+        cfg["resume_from_checkpoint"] = str(ckpt)
+        cfg["overwrite_output_dir"] = False
+
+    tokenized = Path(cfg["tokenized_path"])
+    had_tokenized = tokenized.is_dir()
+    try:
+        run_exp(args=cfg)
+    except SystemExit as e:
+        # 旧版 LLaMA-Factory 首次保存 tokenized 数据集后会直接退出，此时重新启动该种子
+        if e.code not in (0, None) or had_tokenized or not tokenized.is_dir():
+            raise
+        logging.info("tokenized 数据集已保存到 %s，继续训练 seed %d", tokenized, seed)
+        run_exp(args=cfg)
+    finally:
+        release_memory()
+
+
+def release_memory() -> None:
+    gc.collect()
+    try:
+        import torch
+
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="在同一进程内依次训练一个实验的多个种子",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("config", type=Path, help="yamlgenerate.py --packed 生成的描述文件")
+    parser.add_argument(
+        "--tokenized-root",
+        type=Path,
+        default=Path(os.getenv("TOKENIZED_ROOT", DEFAULT_TOKENIZED_ROOT)),
+        help="描述文件没有 tokenized_path 时使用的 tokcache.py 缓存目录 (可用环境变量 TOKENIZED_ROOT 覆盖)",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=os.getenv("PAIR_STORE"),
+        help="同上，组装分词数据集用的 pairstore 目录，默认 <tokenized-root>/pairstore（同 tokcache.py ensure）",
+    )
+    parser.add_argument(
+        "--data-root",
+        type=Path,
+        default=Path(os.getenv("DATA_ROOT", DEFAULT_DATA_ROOT)),
+        help="同上，未使用 pairstore 时读取 {dataset}.json 的目录",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+    text = args.config.read_text(encoding="utf-8")
+    if not has_tokenized_path(text):
+        # 与 yamlgenerate.py --tokenized_root 相同的路径与布局，和其它实验共用 tokcache.py 的缓存；
+        # 有 tokenized_path 的描述文件已由 run.py 在启动前组装好
+        text = use_tokenized_cache(text, read_value(text, "dataset"), args.tokenized_root)
+        store = PairStore(args.store or args.tokenized_root.expanduser().resolve() / "pairstore")
+        try:
+            ensure_from_text(text, store, args.data_root)
+        finally:
+            store.close()
+    jobs = plan(text)
+    if not jobs:
+        logging.error("%s 中没有 packed_seeds", args.config)
+        sys.exit(1)
+
+    for i, (seed, cfg) in enumerate(jobs, start=1):
+        if seed_finished(Path(cfg["output_dir"])):
+            logging.info("(%d/%d) seed %d 已完成，跳过", i, len(jobs), seed)
+            continue
+        logging.info("(%d/%d) ➜ seed %d → %s", i, len(jobs), seed, cfg["output_dir"])
+        train_seed(seed, cfg)
+        logging.info("✓ seed %d 完成", seed)
+    logging.info("全部 %d 个种子完成 🎉", len(jobs))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
@@ -0,0 +1,296 @@
+"""
+内容寻址的偏好对存储（替代 transwaps 目录下每个实验一份完整 JSON）。
+
+不同实验之间绝大多数 (prompt, chosen, rejected) 三元组是相同的，只是被交换的行不同，
+因此每个唯一的三元组只保存一次，每个实验保存为一个紧凑的索引数组 + 标志位：
+
+    <store>/pairs.jsonl          唯一记录（transform_record 的输出，chosen/rejected 按规范顺序）
+    <store>/pairs.offsets        每条记录在 pairs.jsonl 中的偏移（uint64）
+    <store>/pairs.keys           每条记录的 16 字节内容哈希，用于去重
+    <store>/experiments/<exp>.idx  实验 = uint32 索引数组 + 每行 1 字节标志
+
+LLaMA-Factory 需要的 sharegpt JSON 只在训练前通过 materialize 生成，内容与 todpo.py 的输出逐字节一致。
+
+python pairstore.py ingest --store /root/autodl-tmp/data/output/helpsteer2/pairstore \
+  --input_path /root/autodl-tmp/data/output/helpsteer2/swaps exp1 exp2 ...
+python pairstore.py materialize --store ... --output_path .../transwaps exp1
+"""
+from __future__ import annotations
+
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import struct
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from todpo import iter_jsonl, transform_record, write_json_array
+
+_MAGIC = b"HPPS"
+_HEADER = struct.Struct("<4sI")
+_KEY_SIZE = 16
+
+# 每行标志位
+FLIP = 1          # chosen / rejected 相对规范顺序被交换
+SWAPPED = 2       # is_swapped 为真
+SWAPPED_NONE = 4  # is_swapped 为 None
+SWAPPED_RAW = 8   # is_swapped 不是 bool/None，原值保存在记录内
+
+PreparedRow = Tuple[bytes, str, int]
+
+
+def canonicalize(rec: Dict[str, Any]) -> PreparedRow:
+    """把一条转换后的记录拆成 (内容哈希, 规范化 JSON 行, 标志位)。"""
+    rec = dict(rec)
+    swapped = rec.get("is_swapped")
+    if swapped is None:
+        flags = SWAPPED_NONE
+    elif isinstance(swapped, bool):
+        flags = SWAPPED if swapped else 0
+    else:
+        flags = SWAPPED_RAW
+    if not flags & SWAPPED_RAW:
+        # 占位保留键的位置，materialize 时原样回填
+        rec["is_swapped"] = None
+
+    chosen, rejected = rec.get("chosen"), rec.get("rejected")
+    if json.dumps(chosen, ensure_ascii=False, sort_keys=True) > json.dumps(
+        rejected, ensure_ascii=False, sort_keys=True
+    ):
+        rec["chosen"], rec["rejected"] = rejected, chosen
+        flags |= FLIP
+
+    line = json.dumps(rec, ensure_ascii=False)
+    key = hashlib.blake2b(
+        json.dumps(rec, ensure_ascii=False, sort_keys=True).encode("utf-8"),
+        digest_size=_KEY_SIZE,
+    ).digest()
+    return key, line, flags
+
+
+def restore(line: str, flags: int) -> Dict[str, Any]:
+    """canonicalize 的逆过程。"""
+    rec = json.loads(line)
+    if flags & FLIP:
+        rec["chosen"], rec["rejected"] = rec["rejected"], rec["chosen"]
+    if not flags & SWAPPED_RAW:
+        rec["is_swapped"] = None if flags & SWAPPED_NONE else bool(flags & SWAPPED)
+    return rec
+
+
+def prepare_experiment(src: str) -> List[PreparedRow]:
+    """读取一个 swaps JSONL 并规范化每一行；纯函数，可以放在进程池里跑。"""
+    return [canonicalize(transform_record(item)) for item in iter_jsonl(src)]
+
+
+class PairStore:
+    def __init__(self, root: os.PathLike):
+        self.root = Path(root)
+        self.exp_dir = self.root / "experiments"
+        self.exp_dir.mkdir(parents=True, exist_ok=True)
+        self._pairs_path = self.root / "pairs.jsonl"
+        self._offsets_path = self.root / "pairs.offsets"
+        self._keys_path = self.root / "pairs.keys"
+        self._reader = None
+        self._load_index()
+
+    # ------------------------------------------------------------------ 索引
+    def _load_index(self) -> None:
+        self.offsets = array("Q")
+        if self._offsets_path.is_file():
+            self.offsets.frombytes(self._offsets_path.read_bytes())
+        keys = self._keys_path.read_bytes() if self._keys_path.is_file() else b""
+        # 上次写入中途崩溃时，以两份索引中较短的为准
+        n = min(len(self.offsets), len(keys) // _KEY_SIZE)
+        del self.offsets[n:]
+        self.keys: Dict[bytes, int] = {
+            keys[i * _KEY_SIZE:(i + 1) * _KEY_SIZE]: i for i in range(n)
+        }
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @contextmanager
+    def _locked(self):
+        with open(self.root / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # 其它进程可能已经追加过记录
+                if self._offsets_path.is_file() and self._offsets_path.stat().st_size != 8 * len(self):
+                    self._load_index()
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # ------------------------------------------------------------------ 写入
+    def add_experiment(self, name: str, rows: List[PreparedRow]) -> int:
+        """写入一个实验，返回新增的唯一记录数。"""
+        with self._locked():
+            n_before = len(self)
+            idx = array("I")
+            flags = bytearray()
+            new_keys = bytearray()
+            new_offsets = array("Q")
+            with self._pairs_path.open("ab") as pairs:
+                pos = pairs.tell()
+                for key, line, row_flags in rows:
+                    i = self.keys.get(key)
+                    if i is None:
+                        i = len(self.keys)
+                        self.keys[key] = i
+                        data = (line + "\n").encode("utf-8")
+                        pairs.write(data)
+                        new_offsets.append(pos)
+                        new_keys += key
+                        pos += len(data)
+                    idx.append(i)
+                    flags.append(row_flags)
+                pairs.flush()
+                os.fsync(pairs.fileno())
+            # 先落盘记录本身，再追加索引，最后写实验文件；
+            # 截掉上次崩溃留下的、只写进一份索引的尾部，否则新记录会错位
+            with self._offsets_path.open("ab") as f:
+                f.truncate(8 * n_before)
+                new_offsets.tofile(f)
+            with self._keys_path.open("ab") as f:
+                f.truncate(_KEY_SIZE * n_before)
+                f.write(new_keys)
+            self.offsets.extend(new_offsets)
+            self._write_experiment(name, idx, bytes(flags))
+            return len(self) - n_before
+
+    def ingest(self, name: str, src: str) -> int:
+        return self.add_experiment(name, prepare_experiment(src))
+
+    def _write_experiment(self, name: str, idx: array, flags: bytes) -> None:
+        path = self.experiment_path(name)
+        tmp = path.with_suffix(".idx.tmp")
+        with tmp.open("wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(idx)))
+            idx.tofile(f)
+            f.write(flags)
+        os.replace(tmp, path)
+
+    # ------------------------------------------------------------------ 读取
+    def experiment_path(self, name: str) -> Path:
+        return self.exp_dir / f"{name}.idx"
+
+    def has_experiment(self, name: str) -> bool:
+        return self.experiment_path(name).is_file()
+
+    def experiments(self) -> List[str]:
+        return sorted(p.stem for p in self.exp_dir.glob("*.idx"))
+
+    def experiment_size(self, name: str) -> int:
+        """实验行数，只读文件头。"""
+        with self.experiment_path(name).open("rb") as f:
+            magic, n = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"不是 pairstore 实验文件：{self.experiment_path(name)}")
+        return n
+
+    def load_experiment(self, name: str) -> Tuple[array, bytes]:
+        data = self.experiment_path(name).read_bytes()
+        magic, n = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError(f"不是 pairstore 实验文件：{self.experiment_path(name)}")
+        start = _HEADER.size
+        idx = array("I")
+        idx.frombytes(data[start:start + 4 * n])
+        return idx, data[start + 4 * n:start + 5 * n]
+
+    def get_line(self, i: int) -> str:
+        if self._reader is None:
+            self._reader = self._pairs_path.open("rb")
+        self._reader.seek(self.offsets[i])
+        return self._reader.readline().decode("utf-8")
+
+    def iter_records(self, name: str) -> Iterator[Dict[str, Any]]:
+        idx, flags = self.load_experiment(name)
+        for i, row_flags in zip(idx, flags):
+            yield restore(self.get_line(i), row_flags)
+
+    def materialize(self, name: str, output_path: os.PathLike) -> int:
+        """生成 LLaMA-Factory 使用的 sharegpt JSON（与 todpo.py 输出一致）。"""
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = output_path.with_name(output_path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            count = write_json_array(self.iter_records(name), f)
+        os.replace(tmp, output_path)
+        return count
+
+    def ensure_materialized(self, name: str, output_path: os.PathLike) -> bool:
+        """训练前调用：数据集 JSON 不存在或比索引旧时才生成，返回是否生成了文件。"""
+        output_path = Path(output_path)
+        if output_path.is_file() and (
+            output_path.stat().st_mtime_ns >= self.experiment_path(name).stat().st_mtime_ns
+        ):
+            return False
+        count = self.materialize(name, output_path)
+        logging.info("📦 materialize %s（%d 条）→ %s", name, count, output_path)
+        return True
+
+    def close(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+
+# ---------------------------------------------------------------------- CLI
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Content-addressed storage for converted preference datasets",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("ingest", help="把 swaps/*.jsonl 写入存储")
+    p.add_argument("--store", type=Path, required=True)
+    p.add_argument("--input_path", type=Path, required=True, help="包含 {experiment}.jsonl 的目录")
+    p.add_argument("experiments", nargs="+")
+
+    p = sub.add_parser("materialize", help="生成 LLaMA-Factory 的 JSON 数据集")
+    p.add_argument("--store", type=Path, required=True)
+    p.add_argument("--output_path", type=Path, required=True, help="输出目录")
+    p.add_argument("experiments", nargs="*", help="默认全部实验")
+
+    p = sub.add_parser("stats", help="打印存储统计")
+    p.add_argument("--store", type=Path, required=True)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+    store = PairStore(args.store)
+    if args.command == "ingest":
+        for name in args.experiments:
+            added = store.ingest(name, str(args.input_path / f"{name}.jsonl"))
+            logging.info("✓ %s：新增 %d 条唯一记录", name, added)
+    elif args.command == "materialize":
+        for name in args.experiments or store.experiments():
+            count = store.materialize(name, args.output_path / f"{name}.json")
+            logging.info("✓ %s（%d 条）", name, count)
+    else:
+        names = store.experiments()
+        rows = sum(len(store.load_experiment(n)[0]) for n in names)
+        logging.info(
+            "%d 个实验，共 %d 行，唯一记录 %d 条（去重比 %.1fx）",
+            len(names), rows, len(store), rows / max(len(store), 1),
+        )
+    store.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
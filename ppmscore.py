@@ -0,0 +1,215 @@
+"""
+PPM 回归模型批量打分（regressor/linear、regressor/quadratic）。
+
+模型只在启动时加载一次；二次模型按 PolynomialFeatures 的 powers_ 拆成
+常数项 c0、一次项 b 与二次项矩阵 A，打分为
+
+    score(x) = c0 + x·b + xᵀ A x
+
+整批一次矩阵运算完成，不生成 4186 列的多项式展开矩阵。输入特征的列顺序与训练时一致
+（模型的 feature_names_in_，即 overall_scores.csv 中的特征列 / counts/ 里的特征名）。
+
+python ppmscore.py score --model_dir regressor/quadratic \
+  --input /root/autodl-tmp/data/output/helpsteer2/counts --output_path /tmp/ppm_scores.csv
+python ppmscore.py serve --model_dir regressor/quadratic --port 8008
+curl -s localhost:8008/score -d '{"rows": [{"bertscore::min_val=0.0|max_val=0.33": 120}]}'
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import joblib
+import numpy as np
+import pandas as pd
+
+
+class PPMScorer:
+    """加载 model.pkl（及二次模型的 poly.pkl），提供向量化的 score(feature_matrix)。"""
+
+    def __init__(self, model_path: Path, poly_path: Optional[Path] = None):
+        model = joblib.load(model_path)
+        coef = np.asarray(model.coef_, dtype=np.float64).ravel()
+        self.intercept = float(np.ravel(model.intercept_)[0])
+
+        if poly_path is None:
+            self.kind = "linear"
+            names = getattr(model, "feature_names_in_", None)
+            self.linear = coef
+            self.quadratic = None
+        else:
+            poly = joblib.load(poly_path)
+            self.kind = "quadratic"
+            names = getattr(poly, "feature_names_in_", None)
+            powers = np.asarray(poly.powers_)
+            if powers.shape[0] != coef.shape[0]:
+                raise ValueError(f"{model_path} 有 {coef.shape[0]} 个系数，{poly_path} 有 {powers.shape[0]} 项")
+            self.linear, self.quadratic = np.zeros(powers.shape[1]), np.zeros((powers.shape[1],) * 2)
+            for term, w in zip(powers, coef):
+                idx = np.flatnonzero(term)
+                degree = int(term.sum())
+                if degree == 0:
+                    self.intercept += w
+                elif degree == 1:
+                    self.linear[idx[0]] += w
+                elif degree == 2:
+                    i, j = (idx[0], idx[0]) if len(idx) == 1 else (idx[0], idx[1])
+                    self.quadratic[i, j] += w
+                else:
+                    raise ValueError(f"只支持二次多项式，{poly_path} 含 {degree} 次项")
+        n = self.linear.shape[0]
+        self.feature_names: List[str] = list(names) if names is not None else [f"x{i}" for i in range(n)]
+        self._column = {name: i for i, name in enumerate(self.feature_names)}
+
+    @classmethod
+    def from_dir(cls, model_dir: Path) -> "PPMScorer":
+        """regressor/<kind>/ 目录：有 poly.pkl 即按二次模型加载。"""
+        poly = model_dir / "poly.pkl"
+        return cls(model_dir / "model.pkl", poly if poly.exists() else None)
+
+    def score(self, features: Union[np.ndarray, pd.DataFrame], batch_size: int = 1 << 16) -> np.ndarray:
+        """features: (n, n_features)；DataFrame 按列名对齐，缺失的特征按 0 处理。"""
+        X = self.align(features) if isinstance(features, pd.DataFrame) else np.asarray(features, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.shape[1] != len(self.feature_names):
+            raise ValueError(f"特征维数应为 {len(self.feature_names)}，实际为 {X.shape[1]}")
+        out = np.empty(X.shape[0])
+        # 分批：(X @ A) 的中间结果只占 batch × n_features
+        for start in range(0, X.shape[0], batch_size):
+            x = X[start:start + batch_size]
+            s = self.intercept + x @ self.linear
+            if self.quadratic is not None:
+                s += np.einsum("ij,ij->i", x @ self.quadratic, x)
+            out[start:start + batch_size] = s
+        return out
+
+    def align(self, df: pd.DataFrame) -> np.ndarray:
+        missing = [c for c in self.feature_names if c not in df.columns]
+        if missing:
+            logging.warning("输入缺少 %d/%d 个特征，按 0 处理（如 %s）", len(missing), len(self.feature_names), missing[0])
+        return df.reindex(columns=self.feature_names, fill_value=0).to_numpy(dtype=np.float64, na_value=0.0)
+
+    def rows_to_matrix(self, rows: Sequence[Dict[str, float]]) -> np.ndarray:
+        """[{特征名: 值}, ...] → 稠密矩阵；未知特征名报错，避免拼写错误被静默当作 0。"""
+        X = np.zeros((len(rows), len(self.feature_names)))
+        for r, row in enumerate(rows):
+            for name, value in row.items():
+                try:
+                    X[r, self._column[name]] = value
+                except KeyError:
+                    raise KeyError(f"未知特征：{name}") from None
+        return X
+
+
+def load_features(path: Path) -> pd.DataFrame:
+    """counts 目录（每个实验一个 JSON）、CSV（首列为索引）或 JSONL（每行一个 {特征名: 值}）。"""
+    if path.is_dir():
+        from fetch import load_feature_counts
+
+        return load_feature_counts(path).set_index("uuid")
+    if path.suffix == ".csv":
+        return pd.read_csv(path, index_col=0)
+    with path.open("r", encoding="utf-8") as f:
+        return pd.DataFrame.from_records([json.loads(line) for line in f if line.strip()])
+
+
+# ---------------------------------------------------------------------- HTTP
+
+def make_handler(scorer: PPMScorer):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, payload) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/features":
+                self._reply(200, {"kind": scorer.kind, "features": scorer.feature_names})
+            else:
+                self._reply(404, {"error": "GET /features 或 POST /score"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                return self._reply(404, {"error": "POST /score"})
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if "features" in request:
+                    X = np.asarray(request["features"], dtype=np.float64)
+                else:
+                    X = scorer.rows_to_matrix(request["rows"])
+                self._reply(200, {"scores": scorer.score(X).tolist()})
+            except KeyError as e:
+                self._reply(400, {"error": str(e.args[0])})
+            except (ValueError, TypeError) as e:
+                self._reply(400, {"error": str(e)})
+
+        def log_message(self, fmt, *args):
+            logging.debug("%s - " + fmt, self.address_string(), *args)
+
+    return Handler
+
+
+# ---------------------------------------------------------------------- CLI
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Batch scoring with the PPM regressors",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_ in (("score", "给特征文件打分"), ("serve", "启动本地 HTTP 打分服务")):
+        p = sub.add_parser(name, help=help_)
+        p.add_argument("--model_dir", type=Path, default=Path("regressor/quadratic"),
+                       help="含 model.pkl（二次模型另含 poly.pkl）的目录")
+
+    p = sub.choices["score"]
+    p.add_argument("--input", type=Path, required=True, help="counts 目录、CSV 或 JSONL")
+    p.add_argument("--output_path", type=Path, default=None, help="输出 CSV（索引 + score），默认打印到标准输出")
+
+    p = sub.choices["serve"]
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8008)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+    scorer = PPMScorer.from_dir(args.model_dir)
+    logging.info("已加载 %s 模型：%d 个特征", scorer.kind, len(scorer.feature_names))
+
+    if args.command == "serve":
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(scorer))
+        logging.info("打分服务：http://%s:%d/score", args.host, args.port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    df = load_features(args.input)
+    scores = pd.DataFrame({"score": scorer.score(df)}, index=df.index).sort_values("score", ascending=False)
+    if args.output_path:
+        args.output_path.parent.mkdir(parents=True, exist_ok=True)
+        scores.to_csv(args.output_path)
+        logging.info("✅ %d 行 → %s", len(scores), args.output_path)
+    else:
+        scores.to_csv(sys.stdout)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
@@ -0,0 +1,671 @@
+"""
+不合并模型的 RewardBench 评估：基座模型（tulu-2-dpo-7b）只加载一次，LoRA adapter 直接从训练
+output_dir 挂载，评估完卸载再挂下一个，不再把每个 (实验, 种子) 的 13 GB 合并模型写盘再读回。
+
+打分方式与 rewardbench 对 DPO 模型的 ref-free 评估一致：奖励 = 回复部分 token 的平均
+（--ref_free_type sum 时为总和）对数概率，chosen 的奖励高于 rejected 即判对。
+输出 JSON 与 rewardbench 相同（accuracy / num_prompts / model / ref_model / tokenizer /
+chat_template / extra_results），另加 scoring 字段，fetch.py 可以直接读取。
+这与 run.py 合并模式下 rewardbench --model=<合并模型> 的结果不可比：结果目录用 evalroot.py 的
+.scoring 标记打分方式，已有其它方式结果的目录（包括没有标记的旧 eval_results）会被拒绝。
+
+评估集只分词一次，按 (tokenizer, 数据集, template, max_length) 缓存到 --cache_dir，之后的进程直接
+读取 npz。一个进程可以评估任意多个 adapter（--jobs 文件，run.py 的评估 worker 会把同一基座的多个
+评估任务合并成一次调用）；--adapters_per_batch K 时同时挂载 K 个 adapter，每个前向批次里不同的行
+走不同的 adapter（peft 的 adapter_names 混合批），基座权重每批只读一次，由 K 个 adapter 共享。
+
+分阶段评估（--rungs 300 1000）：所有 adapter 先在嵌套的分层子样本上打分（各子集样本数按
+fetch.py 的 SUBSET_MAPPING / EXAMPLE_COUNTS 权重分配），用分层 bootstrap 得到每个实验（种子平均）Overall 的
+置信区间；区间上界不低于“竞争者”（本批最高的区间下界、--contenders_dir 中已有全量结果的实验的最高 Overall）的
+实验进入下一阶段，另按特征计数补选 --coverage 个覆盖回归特征空间的实验，最后只有晋级实验的所有种子跑全量评估；
+同一实验的种子分在不同批次评估时沿用此前的结论：其它种子已有全量结果或在 .screen/ 中晋级过的直接晋级，
+已落选的不再打分，直接记为落选。
+落选模型的子样本结果写到 <结果目录>/.screen/<save_name>.json（fetch.py 不读取以 . 开头的目录）。
+
+某个 adapter 加载或打分出错时只跳过它：错误信息写到 <结果目录>/.errors/<save_name>.json，其余 adapter 照常评估，
+最后以非零退出码结束。
+
+每个 adapter 在每条数据上的对错另写入 --outcomes（outcomes.py），fetch.py --outcomes_path 可以随时按新的
+权重 / 子集重新计算分数或做 bootstrap。
+
+python rmeval.py --base /root/autodl-tmp/model/tulu-2-dpo-7b \
+  --adapter /root/autodl-tmp/HP/data/3812/<实验名> \
+  --output_dir /root/autodl-tmp/HP/eval_results/<实验名> --save_name model3812
+# jobs.jsonl 每行 {"adapter": "<adapter 目录>", "output": "<结果 JSON 路径>"}
+python rmeval.py --base /root/autodl-tmp/model/tulu-2-dpo-7b --jobs jobs.jsonl --adapters_per_batch 4
+python rmeval.py --jobs jobs.jsonl --rungs 300 1000 --contenders_dir /root/autodl-tmp/HP/eval_results \
+  --coverage 2 --feature_counts_dir /root/autodl-tmp/data/output/helpsteer2/counts
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+import traceback
+from collections import defaultdict
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn.functional as F
+
+from evalroot import adapter_scoring, claim_scoring, scoring_of
+from outcomes import DEFAULT_OUTCOME_ROOT, OutcomeStore, result_key
+from tokcache import DEFAULT_TOKENIZED_ROOT
+
+DEFAULT_BASE = "/root/autodl-tmp/model/tulu-2-dpo-7b"
+DEFAULT_DATASET = "allenai/reward-bench"
+# LLaMA-Factory 的 template 名 → 对话格式；其它模板使用 tokenizer 自带的 chat_template
+TULU_TEMPLATES = {"tulu", "tulu2"}
+ADAPTER_PREFIX = "eval"
+# peft 混合批中表示“不加 adapter”的名字
+BASE_ADAPTER = "__base__"
+EVAL_CACHE_VERSION = "2"
+SCREEN_DIR = ".screen"
+# 加载或打分出错的 adapter 在 <结果目录>/.errors/<save_name>.json 留下错误信息，其余 adapter 照常评估
+ERROR_DIR = ".errors"
+# 分层子样本中每个子集至少抽取的条数
+MIN_PER_SUBSET = 4
+
+
+def format_prompt(tokenizer, prompt: str, template: Optional[str]) -> str:
+    if template in TULU_TEMPLATES:
+        return f"<|user|>\n{prompt}\n<|assistant|>\n"
+    return tokenizer.apply_chat_template(
+        [{"role": "user", "content": prompt}], tokenize=False, add_generation_prompt=True
+    )
+
+
+def load_eval_set(dataset: str, split: str) -> List[Dict[str, str]]:
+    from datasets import load_dataset
+
+    ds = load_dataset(dataset, split=split)
+    return [
+        {"id": row.get("id"), "subset": row["subset"], "prompt": row["prompt"],
+         "chosen": row["chosen"], "rejected": row["rejected"]}
+        for row in ds
+    ]
+
+
+def tokenize_pairs(
+    tokenizer, rows: Sequence[Dict[str, str]], template: Optional[str], max_length: int
+) -> List[Tuple[List[int], int]]:
+    """每条数据两个序列（chosen、rejected）：(token ids, 回复起始位置)。"""
+    out = []
+    for row in rows:
+        prefix = format_prompt(tokenizer, row["prompt"], template)
+        start = len(tokenizer(prefix, add_special_tokens=True)["input_ids"])
+        for response in (row["chosen"], row["rejected"]):
+            ids = tokenizer(prefix + response + tokenizer.eos_token, add_special_tokens=True)["input_ids"]
+            out.append((ids[:max_length], min(start, max_length - 1)))
+    return out
+
+
+def eval_cache_key(tokenizer, dataset: str, split: str, template: Optional[str], max_length: int) -> str:
+    """决定分词结果的参数：tokenizer（路径、词表大小、chat_template）、数据集、模板与截断长度。"""
+    text = json.dumps([
+        EVAL_CACHE_VERSION, str(tokenizer.name_or_path), len(tokenizer), tokenizer.chat_template or "",
+        dataset, split, template, max_length,
+    ])
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def tokenized_eval_set(
+    tokenizer, dataset: str, split: str, template: Optional[str], max_length: int, cache_dir: Optional[Path]
+) -> Tuple[List[Any], List[str], List[Tuple[np.ndarray, int]]]:
+    """(每条数据的 id, 每条数据的 subset, tokenize_pairs 的序列)；命中缓存时不再加载数据集和分词。"""
+    path = None
+    if cache_dir is not None:
+        path = cache_dir / f"{eval_cache_key(tokenizer, dataset, split, template, max_length)}.npz"
+        if path.is_file():
+            with np.load(path) as z:
+                ids, offsets, starts = z["ids"], z["offsets"], z["starts"]
+                prompt_ids, subsets = z["prompt_ids"].tolist(), z["subsets"].tolist()
+            logging.info("读取已分词的评估集：%s", path)
+            return prompt_ids, subsets, [(ids[offsets[i]:offsets[i + 1]], int(starts[i])) for i in range(len(starts))]
+
+    rows = load_eval_set(dataset, split)
+    subsets = [row["subset"] for row in rows]
+    # 没有 id 列的数据集用行号
+    prompt_ids = [i if row["id"] is None else row["id"] for i, row in enumerate(rows)]
+    pairs = tokenize_pairs(tokenizer, rows, template, max_length)
+    offsets = np.zeros(len(pairs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(ids) for ids, _ in pairs])
+    ids = np.fromiter((t for seq, _ in pairs for t in seq), dtype=np.int32, count=int(offsets[-1]))
+    starts = np.array([start for _, start in pairs], dtype=np.int32)
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(
+            tmp, ids=ids, offsets=offsets, starts=starts, prompt_ids=np.array(prompt_ids), subsets=np.array(subsets)
+        )
+        os.replace(tmp, path)
+        logging.info("评估集分词结果已缓存：%s", path)
+    return prompt_ids, subsets, [(ids[offsets[i]:offsets[i + 1]], int(starts[i])) for i in range(len(starts))]
+
+
+class AdapterScorer:
+    """常驻显存的基座模型 + 可热切换的 LoRA adapter。"""
+
+    def __init__(self, base: str, dtype: str = "fp16", batch_size: int = 8):
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        self.base = base
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(base, trust_remote_code=True)
+        if self.tokenizer.pad_token_id is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        torch_dtype = {"fp16": torch.float16, "bf16": torch.bfloat16, "fp32": torch.float32}[dtype]
+        self.model = AutoModelForCausalLM.from_pretrained(
+            base, torch_dtype=torch_dtype, device_map="auto", trust_remote_code=True
+        )
+        self.model.eval()
+        self.loaded: List[str] = []
+
+    def use_adapters(self, adapters: Sequence[Optional[str]]) -> List[str]:
+        """挂载一组 adapter（替换上一组），返回各自在 peft 中的名字；None 表示直接评估基座模型。"""
+        from peft import PeftModel
+
+        for name in self.loaded:
+            # 上一组中加载失败的 adapter 可能没有注册
+            if isinstance(self.model, PeftModel) and name in self.model.peft_config:
+                self.model.delete_adapter(name)
+        self.loaded = []
+        names = []
+        for k, adapter in enumerate(adapters):
+            if adapter is None:
+                names.append(BASE_ADAPTER)
+                continue
+            name = f"{ADAPTER_PREFIX}{k}"
+            self.loaded.append(name)
+            if isinstance(self.model, PeftModel):
+                self.model.load_adapter(adapter, adapter_name=name)
+            else:
+                self.model = PeftModel.from_pretrained(self.model, adapter, adapter_name=name)
+            names.append(name)
+        if len(names) == 1 and self.loaded:
+            self.model.set_adapter(names[0])
+        self.model.eval()
+        return names
+
+    @torch.inference_mode()
+    def rewards(
+        self,
+        sequences: Sequence[Tuple[Sequence[int], int]],
+        ref_free_type: str = "avg",
+        names: Optional[Sequence[str]] = None,
+    ) -> np.ndarray:
+        """(adapter 数, 序列数)：每个 adapter 下每个序列回复部分的平均（或总）对数概率。
+
+        按长度分批，减少 padding；挂载多个 adapter 时同一批序列复制 K 份，每份走各自的 adapter，
+        每批总行数仍为 batch_size。
+        """
+        from peft import PeftModel
+
+        names = list(names or [self.loaded[0] if self.loaded else BASE_ADAPTER])
+        k = len(names)
+        step = max(1, self.batch_size // k)
+        kwargs = {}
+        context = nullcontext()
+        if k == 1 and names[0] == BASE_ADAPTER and isinstance(self.model, PeftModel):
+            context = self.model.disable_adapter()
+
+        order = sorted(range(len(sequences)), key=lambda i: len(sequences[i][0]))
+        out = np.zeros((k, len(sequences)))
+        device = next(self.model.parameters()).device
+        pad = self.tokenizer.pad_token_id
+        with context:
+            for b in range(0, len(order), step):
+                idx = order[b:b + step]
+                batch = [sequences[i] for i in idx]
+                width = max(len(ids) for ids, _ in batch)
+                input_ids = torch.full((len(batch), width), pad, dtype=torch.long)
+                attention = torch.zeros((len(batch), width), dtype=torch.long)
+                labels = torch.full((len(batch), width), -100, dtype=torch.long)
+                for r, (ids, start) in enumerate(batch):
+                    input_ids[r, :len(ids)] = torch.as_tensor(ids)
+                    attention[r, :len(ids)] = 1
+                    labels[r, start:len(ids)] = input_ids[r, start:len(ids)]
+                if k > 1:
+                    input_ids, attention, labels = input_ids.repeat(k, 1), attention.repeat(k, 1), labels.repeat(k, 1)
+                    kwargs["adapter_names"] = [name for name in names for _ in idx]
+                input_ids, attention, labels = input_ids.to(device), attention.to(device), labels.to(device)
+                logits = self.model(input_ids=input_ids, attention_mask=attention, **kwargs).logits[:, :-1]
+                target = labels[:, 1:]
+                # cross_entropy 逐 token 计算，不生成 (batch × 长度 × 词表) 的 log_softmax 副本
+                nll = F.cross_entropy(
+                    logits.float().reshape(-1, logits.size(-1)), target.reshape(-1), ignore_index=-100, reduction="none"
+                ).view(target.shape)
+                mask = target != -100
+                logp = -(nll * mask).sum(-1)
+                if ref_free_type == "avg":
+                    logp = logp / mask.sum(-1).clamp(min=1)
+                out[:, idx] = logp.view(k, len(idx)).cpu().numpy()
+        return out
+
+
+def summarize(subsets: Sequence[str], rewards: Sequence[float]) -> Tuple[float, Dict[str, float]]:
+    """(总体准确率, 各子集准确率)；rewards 按 tokenize_pairs 的顺序（chosen, rejected 交替）。"""
+    per_subset: Dict[str, List[int]] = defaultdict(list)
+    for i, subset in enumerate(subsets):
+        per_subset[subset].append(int(rewards[2 * i] > rewards[2 * i + 1]))
+    correct = sum(sum(v) for v in per_subset.values())
+    return correct / max(len(subsets), 1), {k: sum(v) / len(v) for k, v in sorted(per_subset.items())}
+
+
+def write_results(
+    path: Path, accuracy: float, extra: Dict[str, float], n: int, model: str, base: str, template: Optional[str],
+    scoring: str,
+) -> None:
+    result = {
+        "accuracy": accuracy,
+        "num_prompts": n,
+        "model": model,
+        "ref_model": None,
+        "tokenizer": base,
+        "chat_template": template,
+        "scoring": scoring,
+        "extra_results": extra,
+    }
+    write_json(path, result)
+
+
+def write_json(path: Path, obj) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(obj), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def record_outcomes(
+    store: Optional[OutcomeStore],
+    jobs: Sequence[Tuple[str, Path]],
+    which: Sequence[int],
+    rewards: np.ndarray,
+    prompt_ids: Sequence[Any],
+    subsets: Sequence[str],
+) -> None:
+    """把 which 中各 adapter 的逐条对错写入 outcomes 存储；只在子样本上评估过的，其余条目记为未评估。"""
+    if store is None or not len(which):
+        return
+    chosen, rejected = rewards[list(which), 0::2], rewards[list(which), 1::2]
+    scored = ~(np.isnan(chosen) | np.isnan(rejected))
+    correct = scored & (chosen > rejected)
+    store.add(
+        [(result_key(jobs[j][1]), correct[r], scored[r]) for r, j in enumerate(which)], prompt_ids, subsets
+    )
+
+
+# ---------------------------------------------------------------------- 分阶段评估
+
+def screen_path(path: Path) -> Path:
+    return path.parent / SCREEN_DIR / path.name
+
+
+def error_path(path: Path) -> Path:
+    return path.parent / ERROR_DIR / path.name
+
+
+def stratified_indices(subsets: Sequence[str], size: int, seed: int = 0) -> np.ndarray:
+    """按子集分层抽取约 size 条数据的下标（升序）。
+
+    各子集的样本数与其在 Overall 中的权重成正比（至少 MIN_PER_SUBSET 条，不在 SUBSET_MAPPING 中的
+    子集不抽）；子集内取固定种子随机排列的前缀，size 增大时样本嵌套，已算过的奖励可以复用。
+    """
+    from fetch import overall_weights
+
+    names, inverse = np.unique(np.asarray(subsets), return_inverse=True)
+    weights = overall_weights(list(names)).to_numpy()
+    rng = np.random.default_rng(seed)
+    chosen = []
+    for k in range(len(names)):
+        members = rng.permutation(np.flatnonzero(inverse == k))
+        if weights[k] > 0:
+            chosen.append(members[:max(MIN_PER_SUBSET, int(round(size * weights[k])))])
+    return np.sort(np.concatenate(chosen)) if chosen else np.arange(len(subsets))
+
+
+def score_jobs(
+    scorer: AdapterScorer,
+    jobs: Sequence[Tuple[str, Path]],
+    which: Sequence[int],
+    sequences: Sequence[Tuple[Sequence[int], int]],
+    prompts: np.ndarray,
+    rewards: np.ndarray,
+    adapters_per_batch: int,
+    ref_free_type: str,
+    failed: Dict[int, str],
+) -> None:
+    """为 which 中的 adapter 补齐 prompts 对应序列的奖励（rewards 中已有的值不重算）。
+
+    加载或打分出错的 adapter 记入 failed（下标 → 错误信息）并写出错误文件，不影响其余 adapter。
+    """
+    seq = np.stack([2 * prompts, 2 * prompts + 1], axis=1).ravel()
+    which = [j for j in which if j not in failed]
+    for g in range(0, len(which), adapters_per_batch):
+        chunk = list(which[g:g + adapters_per_batch])
+        need = seq[np.isnan(rewards[np.ix_(chunk, seq)]).any(axis=0)]
+        if not len(need):
+            continue
+        start = time.time()
+        try:
+            names = scorer.use_adapters([jobs[j][0] for j in chunk])
+            rewards[np.ix_(chunk, need)] = scorer.rewards([sequences[i] for i in need], ref_free_type, names)
+        except Exception as e:
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            if len(chunk) > 1:
+                logging.warning("%d 个 adapter 的混合批次出错（%s），逐个重试", len(chunk), e)
+                score_jobs(scorer, jobs, chunk, sequences, prompts, rewards, 1, ref_free_type, failed)
+                continue
+            adapter, path = jobs[chunk[0]]
+            failed[chunk[0]] = f"{type(e).__name__}: {e}"
+            write_json(error_path(path), {"model": adapter, "error": failed[chunk[0]], "traceback": traceback.format_exc()})
+            logging.error("✗ %s：%s → %s", adapter, failed[chunk[0]], error_path(path))
+            continue
+        logging.info(
+            "%d 个 adapter × %d 个序列（%.0f 秒）：%s", len(chunk), len(need), time.time() - start,
+            ", ".join(jobs[j][0] for j in chunk),
+        )
+
+
+def best_full_overall(contenders_dir: Optional[Path], exclude: Set[Path]) -> Optional[float]:
+    """contenders_dir 中已有全量结果的实验（种子平均）的最高 Overall（本次要重写的结果除外）。"""
+    if contenders_dir is None:
+        return None
+    from fetch import discover_metric_files, get_category_scores, read_subset_metrics, scores_frame
+
+    files = [(exp, seed, path) for exp, seed, path in discover_metric_files(contenders_dir) if path.resolve() not in exclude]
+    if not files:
+        return None
+    frame = scores_frame(
+        [read_subset_metrics(path) for _, _, path in files],
+        pd.MultiIndex.from_tuples([(exp, seed) for exp, seed, _ in files]),
+    )
+    return float(get_category_scores(frame)["Overall"].groupby(level=0).mean().max())
+
+
+def experiment_of(path: Path) -> str:
+    """<eval-root>/<实验名>/model<seed>.json → 实验名。"""
+    return path.parent.name
+
+
+def sibling_verdict(path: Path, ours: Set[Path]) -> Optional[Tuple[bool, Path]]:
+    """同一实验其它种子（不在本批中）此前的结论：(是否晋级, 依据的结果文件)；还没有结论时返回 None。
+
+    有全量结果或 .screen/ 中晋级过即为晋级，否则以 .screen/ 中的落选结论为准。
+    """
+    for p in sorted(path.parent.glob("*.json")):
+        if p.resolve() not in ours:
+            return True, p
+    dropped = None
+    for p in sorted((path.parent / SCREEN_DIR).glob("*.json")):
+        if (path.parent / p.name).resolve() in ours:
+            continue
+        try:
+            promoted = json.loads(p.read_text(encoding="utf-8"))["screen"]["promoted"]
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+        if promoted:
+            return True, p
+        dropped = dropped or p
+    return None if dropped is None else (False, dropped)
+
+
+def coverage_picks(
+    candidates: Sequence[str],
+    covered: Sequence[str],
+    counts: Optional[pd.DataFrame],
+    k: int,
+) -> List[str]:
+    """从落选实验中按最远点采样补选 k 个：特征计数（按列标准化）离已覆盖实验最远的优先。"""
+    if not k or counts is None or not len(candidates):
+        return []
+    from fetch import experiment_uuid
+
+    def vector(exp: str) -> Optional[np.ndarray]:
+        uuid = experiment_uuid(exp)
+        return X[row[uuid]] if uuid in row else None
+
+    X = counts.to_numpy(dtype=float)
+    X = (X - X.mean(axis=0)) / np.where(X.std(axis=0) > 0, X.std(axis=0), 1.0)
+    row = {uuid: r for r, uuid in enumerate(counts.index)}
+    cand = [(exp, vector(exp)) for exp in candidates]
+    cand = [(exp, v) for exp, v in cand if v is not None]
+    if not cand:
+        logging.warning("落选实验都没有特征计数，跳过覆盖补选")
+        return []
+    points = np.stack([v for _, v in cand])
+    anchors = [v for v in map(vector, covered) if v is not None] or [np.zeros(X.shape[1])]
+    nearest = np.min([np.linalg.norm(points - a, axis=1) for a in anchors], axis=0)
+    picks = []
+    for _ in range(min(k, len(cand))):
+        i = int(np.argmax(nearest))
+        if nearest[i] <= 0:
+            break
+        picks.append(cand[i][0])
+        nearest = np.minimum(nearest, np.linalg.norm(points - points[i], axis=1))
+    return picks
+
+
+def successive_halving(
+    scorer: AdapterScorer,
+    jobs: Sequence[Tuple[str, Path]],
+    subsets: Sequence[str],
+    sequences: Sequence[Tuple[Sequence[int], int]],
+    rewards: np.ndarray,
+    args,
+    failed: Dict[int, str],
+    counts: Optional[pd.DataFrame] = None,
+) -> List[int]:
+    """依次在 --rungs 大小的分层子样本上按实验筛选，返回晋级全量评估的 job 下标（出错的 adapter 不在其中）。
+
+    置信区间按实验计算（各种子的 bootstrap 结果取平均），同一实验的种子一起晋级或落选，
+    不会因为挑出运气好的种子而高估实验的 Overall。
+    """
+    from fetch import bootstrap_overall, discover_metric_files
+
+    ours = {path.resolve() for _, path in jobs}
+    experiment = [experiment_of(path) for _, path in jobs]
+    scoring = adapter_scoring(args.ref_free_type, args.chat_template)
+    # 同一实验的种子可能分在不同批次：沿用其它种子此前的结论，保证一个实验的种子要么都跑全量、要么都落选
+    verdict: Dict[str, Optional[Tuple[bool, Path]]] = {}
+    for j, (_, path) in enumerate(jobs):
+        if experiment[j] not in verdict:
+            verdict[experiment[j]] = sibling_verdict(path, ours)
+    promoted = [j for j in range(len(jobs)) if verdict[experiment[j]] and verdict[experiment[j]][0]]
+    alive = [j for j in range(len(jobs)) if verdict[experiment[j]] is None]
+    for j in range(len(jobs)):
+        if verdict[experiment[j]] and not verdict[experiment[j]][0]:
+            adapter, path = jobs[j]
+            write_json(screen_path(path), {
+                "model": adapter,
+                "scoring": scoring,
+                "screen": {"promoted": False, "coverage": False, "decided_by": str(verdict[experiment[j]][1])},
+            })
+    n_dropped = len(jobs) - len(promoted) - len(alive)
+    if promoted or n_dropped:
+        logging.info(
+            "沿用同一实验其它种子此前的结论：%d 个模型直接晋级，%d 个直接落选（结论见 %s/）", len(promoted), n_dropped, SCREEN_DIR,
+        )
+    full_best = best_full_overall(args.contenders_dir, ours)
+    # 已有全量结果的实验视为已覆盖
+    covered = sorted({exp for exp, _, _ in discover_metric_files(args.contenders_dir)}) if args.contenders_dir else []
+    labels = np.asarray(subsets)
+    for size in sorted(args.rungs):
+        prompts = stratified_indices(subsets, size, args.sample_seed)
+        if len(prompts) >= len(subsets) or (len({experiment[j] for j in alive}) <= 1 and full_best is None):
+            break
+        score_jobs(scorer, jobs, alive, sequences, prompts, rewards, args.adapters_per_batch, args.ref_free_type, failed)
+        alive = [j for j in alive if j not in failed]
+        if not alive:
+            break
+        correct = rewards[np.ix_(alive, 2 * prompts)] > rewards[np.ix_(alive, 2 * prompts + 1)]
+        by_subset = pd.DataFrame(correct.T, index=labels[prompts]).groupby(level=0)
+        accuracy = by_subset.mean().T
+        accuracy.index = alive
+        ci = bootstrap_overall(
+            accuracy, by_subset.size(), args.n_boot, args.alpha, args.sample_seed,
+            groups=[experiment[j] for j in alive],
+        )
+        bar = max(ci["Overall_lo"].max(), -np.inf if full_best is None else full_best)
+        keep = ci.index[ci["Overall_hi"] >= bar].tolist()
+        extra = coverage_picks([exp for exp in ci.index if exp not in keep], covered + keep, counts, args.coverage)
+        for r, j in enumerate(alive):
+            adapter, path = jobs[j]
+            exp = experiment[j]
+            result = {
+                "accuracy": float(correct[r].mean()),
+                "num_prompts": int(len(prompts)),
+                "model": adapter,
+                "scoring": scoring,
+                "extra_results": {k: float(v) for k, v in accuracy.loc[j].items()},
+                # overall / ci 为整个实验（本批中该实验所有种子的平均）
+                "screen": {
+                    "rung": size,
+                    "overall": float(ci.at[exp, "Overall"]),
+                    "ci": [float(ci.at[exp, "Overall_lo"]), float(ci.at[exp, "Overall_hi"])],
+                    "bar": float(bar),
+                    "promoted": exp in keep or exp in extra,
+                    "coverage": exp in extra,
+                },
+            }
+            write_json(screen_path(path), result)
+        logging.info(
+            "子样本 %d 条：%d 个实验（%d 个模型）中 %d 个进入下一阶段（门槛 %.4f%s）",
+            len(prompts), len(ci), len(alive), len(keep) + len(extra), bar,
+            f"，其中 {len(extra)} 个为覆盖补选" if extra else "",
+        )
+        alive = [j for j in alive if experiment[j] in keep or experiment[j] in extra]
+    return sorted(promoted + alive)
+
+
+# ---------------------------------------------------------------------- CLI
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="RewardBench evaluation of LoRA adapters on a resident base model",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--base", default=os.getenv("BASE_MODEL", DEFAULT_BASE), help="基座模型")
+    parser.add_argument("--adapter", nargs="+", default=[], help="LoRA adapter 目录（训练的 output_dir），可传多个")
+    parser.add_argument("--output_dir", type=Path, default=None, help="结果目录")
+    parser.add_argument("--save_name", nargs="+", default=[], help="与 --adapter 一一对应，结果写到 <output_dir>/<save_name>.json")
+    parser.add_argument("--jobs", type=Path, default=None,
+                        help="JSONL，每行 {\"adapter\": ..., \"output\": <结果 JSON 路径>}；与 --adapter 可同时使用")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET)
+    parser.add_argument("--split", default="filtered")
+    parser.add_argument("--chat_template", default="tulu2", help="tulu / tulu2，或其它值使用 tokenizer 的 chat_template")
+    parser.add_argument("--ref_free_type", choices=("avg", "sum"), default="avg")
+    parser.add_argument("--batch_size", type=int, default=8, help="每次前向的总行数（多个 adapter 共享）")
+    parser.add_argument("--adapters_per_batch", type=int, default=1,
+                        help="同时挂载的 adapter 数，>1 时用 peft 的混合 adapter 批次共享基座前向")
+    parser.add_argument("--max_length", type=int, default=2048)
+    parser.add_argument("--dtype", choices=("fp16", "bf16", "fp32"), default="fp16")
+    parser.add_argument("--cache_dir", type=Path,
+                        default=Path(os.getenv("TOKENIZED_ROOT", DEFAULT_TOKENIZED_ROOT)) / "rewardbench",
+                        help="已分词评估集的缓存目录")
+    parser.add_argument("--no_cache", action="store_true", help="不读写分词缓存")
+    parser.add_argument("--outcomes", type=Path, default=Path(os.getenv("OUTCOME_STORE", DEFAULT_OUTCOME_ROOT)),
+                        help="逐条评估结果存储（outcomes.py），fetch.py --outcomes_path 读取")
+    parser.add_argument("--no_outcomes", action="store_true", help="不写逐条评估结果")
+    parser.add_argument("--rungs", type=int, nargs="*", default=[],
+                        help="分阶段评估的子样本大小（条数，从小到大），最后晋级者跑全量；默认不分阶段")
+    parser.add_argument("--contenders_dir", type=Path, default=None,
+                        help="已有全量结果的目录（eval_results 布局），其中最高的 Overall 作为晋级门槛之一")
+    parser.add_argument("--coverage", type=int, default=0, help="每一阶段按特征计数额外补选的落选模型数")
+    parser.add_argument("--feature_counts_dir", type=Path, default=None, help="--coverage 使用的特征计数目录（counts/）")
+    parser.add_argument("--n_boot", type=int, default=1000, help="bootstrap 重采样次数")
+    parser.add_argument("--alpha", type=float, default=0.05, help="置信区间为 1 - alpha")
+    parser.add_argument("--sample_seed", type=int, default=0, help="分层子样本与 bootstrap 的随机种子")
+    return parser.parse_args()
+
+
+def load_jobs(args) -> List[Tuple[str, Path]]:
+    """(adapter, 结果路径) 列表：--adapter / --save_name 在前，--jobs 文件在后。"""
+    if len(args.adapter) != len(args.save_name):
+        raise SystemExit("--adapter 与 --save_name 的数量必须相同")
+    if args.adapter and args.output_dir is None:
+        raise SystemExit("使用 --adapter 时必须指定 --output_dir")
+    jobs = [(adapter, args.output_dir / f"{name}.json") for adapter, name in zip(args.adapter, args.save_name)]
+    if args.jobs is not None:
+        with args.jobs.open("r", encoding="utf-8") as f:
+            jobs += [(rec["adapter"], Path(rec["output"])) for rec in map(json.loads, f) if rec]
+    if not jobs:
+        raise SystemExit("没有要评估的 adapter：使用 --adapter/--save_name 或 --jobs")
+    return jobs
+
+
+def main() -> None:
+    args = get_args()
+    jobs = load_jobs(args)
+    args.adapters_per_batch = max(1, args.adapters_per_batch)
+    scoring = adapter_scoring(args.ref_free_type, args.chat_template)
+    try:
+        # <结果根目录>/<实验名>/model<seed>.json
+        for root in sorted({path.parent.parent for _, path in jobs}):
+            claim_scoring(root, scoring)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if args.contenders_dir is not None and scoring_of(args.contenders_dir) not in (None, scoring):
+        raise SystemExit(
+            f"--contenders_dir {args.contenders_dir} 中的结果用 {scoring_of(args.contenders_dir)} 打分，不能作为晋级门槛"
+        )
+
+    start = time.time()
+    scorer = AdapterScorer(args.base, args.dtype, args.batch_size)
+    prompt_ids, subsets, sequences = tokenized_eval_set(
+        scorer.tokenizer, args.dataset, args.split, args.chat_template, args.max_length,
+        None if args.no_cache else args.cache_dir,
+    )
+    logging.info("已加载 %s 与 %d 条评估数据（%.0f 秒），%d 个 adapter", args.base, len(subsets), time.time() - start, len(jobs))
+
+    # 每个 adapter 每个序列的奖励，NaN 表示还没算；分阶段评估时子样本上算过的不再重算
+    rewards = np.full((len(jobs), len(sequences)), np.nan)
+    failed: Dict[int, str] = {}
+    promoted = list(range(len(jobs)))
+    if args.rungs:
+        counts = None
+        if args.coverage and args.feature_counts_dir is not None:
+            from fetch import load_feature_counts
+
+            counts = load_feature_counts(args.feature_counts_dir).set_index("uuid")
+        promoted = successive_halving(scorer, jobs, subsets, sequences, rewards, args, failed, counts)
+
+    store = None if args.no_outcomes else OutcomeStore(args.outcomes)
+    everything = np.arange(len(subsets))
+    for g in range(0, len(promoted), args.adapters_per_batch):
+        chunk = promoted[g:g + args.adapters_per_batch]
+        score_jobs(
+            scorer, jobs, chunk, sequences, everything, rewards, args.adapters_per_batch, args.ref_free_type, failed
+        )
+        chunk = [j for j in chunk if j not in failed]
+        for j in chunk:
+            adapter, path = jobs[j]
+            accuracy, extra = summarize(subsets, rewards[j])
+            write_results(path, accuracy, extra, len(subsets), adapter, args.base, args.chat_template, scoring)
+            error_path(path).unlink(missing_ok=True)
+            logging.info("✓ %s：accuracy %.4f → %s", adapter, accuracy, path)
+        record_outcomes(store, jobs, chunk, rewards, prompt_ids, subsets)
+    screened = sorted(set(range(len(jobs))) - set(promoted) - set(failed))
+    # 沿用其它种子结论而落选的模型没有打过分，不写逐条结果
+    record_outcomes(store, jobs, [j for j in screened if not np.isnan(rewards[j]).all()], rewards, prompt_ids, subsets)
+    if screened:
+        logging.info("%d/%d 个 adapter 未进入全量评估，子样本结果见各结果目录下的 %s/", len(screened), len(jobs), SCREEN_DIR)
+    if failed:
+        raise SystemExit(f"{len(failed)}/{len(jobs)} 个 adapter 评估失败，错误信息见各结果目录下的 {ERROR_DIR}/")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
@@ -3,19 +3,81 @@
 python /root/autodl-tmp/HP/run.py --train-dir /root/autodl-tmp/HP/train/3812
 python /root/autodl-tmp/HP/run.py --train-dir /root/autodl-tmp/HP/train/8280
 python /root/autodl-tmp/HP/run.py --train-dir /root/autodl-tmp/HP/train/9864
+
+# 多卡并行：一次性排空多个目录，每张卡一个任务
+python /root/autodl-tmp/HP/run.py --devices 0,1,2,3 \
+  --train-dir /root/autodl-tmp/HP/train/3812 /root/autodl-tmp/HP/train/8280 /root/autodl-tmp/HP/train/9864
+
+# 本地无 GPU 时用桩命令测试调度逻辑
+python run.py --devices 0,1 --train-cmd "sleep 1" --train-dir train/3812
+
+# 任务状态保存在 SQLite 队列中（默认 <train-dir 公共父目录>/queue.sqlite），
+# 多个 run.py 进程可以同时消费同一个队列：
+python jobqueue.py status --db /root/autodl-tmp/HP/train/queue.sqlite -v
+
+# 失败策略：最多尝试 3 次（指数退避），仍失败的写入 dead_experiments.txt 并继续后面的任务；
+# OOM 失败会改用 per_device_train_batch_size 减半、gradient_accumulation_steps 加倍的 YAML 重试
+python run.py --max-attempts 3 --retry-backoff 60 --on-failure continue --train-dir ...
+
+# 被抢占的任务重新启动时自动从 output_dir 下最新的 checkpoint-* 继续；
+# 长任务可以用更密的保存间隔减少损失
+python run.py --save-steps 200 --save-total-limit 2 --train-dir ...
+
+# 默认按预测耗时从长到短领取任务并输出 ETA；--order fifo 按入队顺序
+python run.py --order fifo --train-dir ...
+
+# 参数扫描：sweep.py 生成的清单，YAML 在任务启动时才渲染
+python run.py --manifest /root/autodl-tmp/HP/sweeps/lr.jsonl --devices 0,1,2,3
+
+# YAML 设置了 tokenized_path（yamlgenerate.py --tokenized_root）时，训练前先用 tokcache.py 组装分词数据集
+
+# 流水线：训练完成后自动入队 LoRA 合并与 rewardbench 评估，各阶段独立的 worker 池，
+# 与后续训练重叠进行；结果写到 <eval-root>/<实验名>/model<seed>.json（fetch.py 读取的布局）
+python run.py --pipeline 1 --devices 0,1,2 --eval-devices 3 --merge-workers 2 --train-dir ...
+
+# 不写合并模型：评估时把 LoRA adapter 直接挂到常驻的基座模型上（rmeval.py）；
+# 评估 worker 一次最多领取 --eval-batch 个任务，同一基座的 adapter 在一个 rmeval.py 进程中依次评估
+python run.py --pipeline 1 --eval-mode adapter --eval-batch 12 --devices 0,1,2 --eval-devices 3 --train-dir ...
+
+# 分阶段评估：先在 300 / 1000 条分层子样本上筛选，只有置信区间与最优者重叠的模型跑全量
+python run.py --pipeline 1 --eval-mode adapter --eval-batch 20 --eval-rungs "300 1000" --train-dir ...
 """
 from __future__ import annotations
 
 import argparse
+import json
 import logging
 import os
+import re
+import shlex
 import subprocess
 import sys
+import threading
+import time
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
+
+from evalroot import ADAPTER_SCORING_PREFIX, MERGED_SCORING, claim_scoring, scoring_of
+from jobqueue import (
+    CLAIMED, DONE, EVAL, FAILED, MERGE, PENDING, RUNNING, STAGES, TRAIN, Job, JobQueue, atomic_write_text, worker_id,
+)
+from runtime import RuntimeModel, dataset_rows, format_duration, job_work, simulate_makespan
+from sweep import load_manifest, manifest_train_dir, render_job
+from yamlgenerate import apply_overrides, latest_checkpoint, read_value
 
 # -------------------- CLI / ENV 处理 --------------------
 DEFAULT_TRAIN_DIR = "/root/autodl-tmp/HP/train"
+DEFAULT_TRAIN_CMD = "llamafactory-cli train {cfg}"
+DEFAULT_MERGE_CMD = "llamafactory-cli export {cfg}"
+DEFAULT_EVAL_CMD = "rewardbench --model={model} --output_dir {output_dir} --save_name {save_name}"
+DEFAULT_ADAPTER_EVAL_CMD = (
+    f"{sys.executable} {Path(__file__).resolve().parent / 'rmeval.py'} --base {{base}} --adapter {{model}} "
+    "--output_dir {output_dir} --save_name {save_name} --chat_template {template}"
+)
+DEFAULT_BATCH_EVAL_CMD = (
+    f"{sys.executable} {Path(__file__).resolve().parent / 'rmeval.py'} --base {{base}} "
+    "--chat_template {template} --jobs {jobs}"
+)
 
 def str2bool(v: str | bool) -> bool:
     if isinstance(v, bool):
@@ -29,8 +91,17 @@ parser = argparse.ArgumentParser(
 parser.add_argument(
     "--train-dir",
     type=Path,
-    default=os.getenv("TRAIN_DIR", DEFAULT_TRAIN_DIR),
-    help="训练相关文件所在根目录 (可用环境变量 TRAIN_DIR 覆盖)",
+    nargs="+",
+    default=None,
+    help=f"训练相关文件所在根目录，可传多个；未指定且没有 --manifest 时为 {DEFAULT_TRAIN_DIR} "
+         "(可用环境变量 TRAIN_DIR 覆盖)",
+)
+parser.add_argument(
+    "--manifest",
+    type=Path,
+    nargs="+",
+    default=[Path(p) for p in os.getenv("MANIFEST", "").split(os.pathsep) if p],
+    help="sweep.py 生成的任务清单，YAML 在任务启动时渲染到 <清单目录>/<清单名>/",
 )
 parser.add_argument(
     "--strict",
@@ -38,21 +109,238 @@ parser.add_argument(
     default=str2bool(os.getenv("STRICT", "1")),
     help="严格模式：缺失 YAML 时立即退出 (0/1, true/false)",
 )
+parser.add_argument(
+    "--devices",
+    default=os.getenv("DEVICES"),
+    help="设备槽位，逗号分隔，一个槽位用多张卡时用 + 连接，如 0,1,2,3 或 0+1,2+3；"
+         "默认按 CUDA_VISIBLE_DEVICES / nvidia-smi 自动检测，每张卡一个槽位",
+)
+parser.add_argument(
+    "--train-cmd",
+    default=os.getenv("TRAIN_CMD", DEFAULT_TRAIN_CMD),
+    help="训练命令模板，{cfg} 会被替换为 YAML 路径；可替换为桩命令在无 GPU 环境下测试",
+)
+parser.add_argument(
+    "--packed-cmd",
+    default=os.getenv(
+        "PACKED_CMD", f"{sys.executable} {Path(__file__).resolve().parent / 'packed_worker.py'} {{cfg}}"
+    ),
+    help="多种子打包任务（YAML 含 packed_seeds，见 yamlgenerate.py --packed）使用的命令模板",
+)
+parser.add_argument(
+    "--queue-db",
+    type=Path,
+    default=os.getenv("QUEUE_DB"),
+    help="任务队列 SQLite 文件，默认为各 --train-dir 公共父目录下的 queue.sqlite",
+)
+parser.add_argument(
+    "--heartbeat-timeout",
+    type=float,
+    default=float(os.getenv("HEARTBEAT_TIMEOUT", "600")),
+    help="超过该秒数没有心跳的已领取任务会被其它 worker 重新领取",
+)
+parser.add_argument(
+    "--max-attempts",
+    type=int,
+    default=int(os.getenv("MAX_ATTEMPTS", "1")),
+    help="每个实验最多尝试次数（含第一次）；数据错误不重试",
+)
+parser.add_argument(
+    "--retry-backoff",
+    type=float,
+    default=float(os.getenv("RETRY_BACKOFF", "60")),
+    help="重试前等待的秒数，第 n 次重试等待 backoff * 2^(n-1)",
+)
+parser.add_argument(
+    "--on-failure",
+    choices=("abort", "continue"),
+    default=os.getenv("ON_FAILURE", "abort"),
+    help="重试用尽后：abort 停止派发新任务并以非零退出；continue 记入 dead_experiments.txt 后继续",
+)
+parser.add_argument(
+    "--resume",
+    type=str2bool,
+    default=str2bool(os.getenv("RESUME", "1")),
+    help="启动前检查 output_dir 下最新的 checkpoint-*，存在时从该 checkpoint 继续训练",
+)
+parser.add_argument(
+    "--save-steps",
+    type=int,
+    default=int(os.getenv("SAVE_STEPS")) if os.getenv("SAVE_STEPS") else None,
+    help="覆盖 YAML 中的 save_steps（只会调小），让长任务更频繁地保存 checkpoint",
+)
+parser.add_argument(
+    "--save-total-limit",
+    type=int,
+    default=None,
+    help="最多保留的 checkpoint 数量，配合 --save-steps 控制磁盘占用",
+)
+parser.add_argument(
+    "--pair-store",
+    type=Path,
+    default=os.getenv("PAIR_STORE"),
+    help="pairstore 目录；设置后在训练前按需生成数据集 JSON (可用环境变量 PAIR_STORE 覆盖)",
+)
+parser.add_argument(
+    "--data-root",
+    type=Path,
+    default=os.getenv("DATA_ROOT", "/root/autodl-tmp/data/output/helpsteer2/transwaps"),
+    help="dataset_info.json 中登记的数据集目录，配合 --pair-store 使用",
+)
+parser.add_argument(
+    "--order",
+    choices=("lpt", "fifo"),
+    default=os.getenv("ORDER", "lpt"),
+    help="领取顺序：lpt 按预测耗时从长到短（减少多卡末尾空等），fifo 按入队顺序",
+)
+parser.add_argument(
+    "--pipeline",
+    type=str2bool,
+    default=str2bool(os.getenv("PIPELINE", "0")),
+    help="训练成功后自动入队合并（LoRA）与评估任务，由各自的 worker 池与训练并行执行",
+)
+parser.add_argument(
+    "--merge-workers",
+    type=int,
+    default=int(os.getenv("MERGE_WORKERS", "2")),
+    help="同时进行的合并任务数（CPU / 磁盘密集，不占 GPU）",
+)
+parser.add_argument(
+    "--eval-devices",
+    default=os.getenv("EVAL_DEVICES"),
+    help="评估专用的设备槽位，格式同 --devices；未指定时由训练槽位优先领取评估任务",
+)
+parser.add_argument(
+    "--merge-cmd",
+    default=os.getenv("MERGE_CMD", DEFAULT_MERGE_CMD),
+    help="合并命令模板，{cfg} 为生成的 export YAML",
+)
+parser.add_argument(
+    "--eval-cmd",
+    default=os.getenv("EVAL_CMD", DEFAULT_EVAL_CMD),
+    help="评估命令模板，可用 {model} {output_dir} {save_name}；须写出 {output_dir}/{save_name}.json",
+)
+parser.add_argument(
+    "--eval-mode",
+    choices=("merged", "adapter"),
+    default=os.getenv("EVAL_MODE", "merged"),
+    help="merged：先合并 LoRA 再用 --eval-cmd 评估；adapter：跳过合并，用 --adapter-eval-cmd 直接评估 adapter",
+)
+parser.add_argument(
+    "--adapter-eval-cmd",
+    default=os.getenv("ADAPTER_EVAL_CMD", DEFAULT_ADAPTER_EVAL_CMD),
+    help="--eval-mode adapter 的评估命令模板，额外可用 {base}（基座模型）与 {template}",
+)
+parser.add_argument(
+    "--eval-batch",
+    type=int,
+    default=int(os.getenv("EVAL_BATCH", "8")),
+    help="adapter 评估时一个 worker 一次最多领取的评估任务数，同一基座与模板的任务合并为一次 --batch-eval-cmd 调用",
+)
+parser.add_argument(
+    "--batch-eval-cmd",
+    default=os.getenv("BATCH_EVAL_CMD", DEFAULT_BATCH_EVAL_CMD),
+    help="合并评估的命令模板，可用 {base} {template} {jobs}；{jobs} 为每行 {\"adapter\", \"output\"} 的 JSONL",
+)
+parser.add_argument(
+    "--eval-rungs",
+    default=os.getenv("EVAL_RUNGS", ""),
+    help="adapter 评估分阶段筛选的子样本大小，如 \"300 1000\"；传给 rmeval.py --rungs，"
+    "以 --eval-root 中已有的全量结果为竞争者，落选模型只写 <eval-root>/<实验名>/.screen/ 下的子样本结果",
+)
+parser.add_argument(
+    "--eval-coverage",
+    type=int,
+    default=int(os.getenv("EVAL_COVERAGE", "0")),
+    help="分阶段评估每一阶段按特征计数额外补选的落选实验数（rmeval.py --coverage），需配合 --eval-feature-counts-dir",
+)
+parser.add_argument(
+    "--eval-feature-counts-dir",
+    type=Path,
+    default=os.getenv("EVAL_FEATURE_COUNTS_DIR") or None,
+    help="--eval-coverage 使用的特征计数目录（counts/，rmeval.py --feature_counts_dir）",
+)
+parser.add_argument(
+    "--merged-root",
+    type=Path,
+    default=os.getenv("MERGED_ROOT", "/root/autodl-tmp/data/result/merged_model"),
+    help="合并后的模型保存到 <merged-root>/<实验名>/model<seed>",
+)
+parser.add_argument(
+    "--eval-root",
+    type=Path,
+    default=os.getenv("EVAL_ROOT", "/root/autodl-tmp/HP/eval_results"),
+    help="评估结果保存到 <eval-root>/<实验名>/model<seed>.json",
+)
 args = parser.parse_args()
+if args.eval_coverage and args.eval_feature_counts_dir is None:
+    parser.error("--eval-coverage 需要 --eval-feature-counts-dir")
+try:
+    # rmeval.py --rungs 只接受正整数，格式错误在这里报出，而不是让每个评估任务失败重试
+    _rungs = [int(v) for v in args.eval_rungs.split()]
+    if any(v <= 0 for v in _rungs):
+        raise ValueError
+except ValueError:
+    parser.error(f"--eval-rungs 应为空格分隔的正整数，如 \"300 1000\"：{args.eval_rungs!r}")
 
-TRAIN_DIR: Path = args.train_dir.expanduser().resolve()
-WAIT_FILE: Path = TRAIN_DIR / "wait_experiments.txt"
-READY_FILE: Path = TRAIN_DIR / "ready_experiments.txt"
+MANIFESTS: List[Path] = [m.expanduser().resolve() for m in args.manifest]
+if args.train_dir is None:
+    args.train_dir = [] if MANIFESTS else [Path(os.getenv("TRAIN_DIR", DEFAULT_TRAIN_DIR))]
+TRAIN_DIRS: List[Path] = [d.expanduser().resolve() for d in args.train_dir]
+# 清单任务的 YAML / 日志 / wait、ready 列表所在目录
+ALL_DIRS: List[Path] = TRAIN_DIRS + [manifest_train_dir(m) for m in MANIFESTS]
+QUEUE_DB: Path = (
+    args.queue_db.expanduser().resolve()
+    if args.queue_db
+    else Path(os.path.commonpath(ALL_DIRS)) / "queue.sqlite"
+)
+if len(ALL_DIRS) == 1 and not args.queue_db:
+    QUEUE_DB = ALL_DIRS[0] / "queue.sqlite"
+HEARTBEAT_TIMEOUT: float = args.heartbeat_timeout
+HEARTBEAT_INTERVAL: float = max(1.0, min(30.0, HEARTBEAT_TIMEOUT / 4))
 STRICT: bool = args.strict
+TRAIN_CMD: str = args.train_cmd
+PACKED_CMD: str = args.packed_cmd
+MAX_ATTEMPTS: int = max(1, args.max_attempts)
+RETRY_BACKOFF: float = args.retry_backoff
+ON_FAILURE: str = args.on_failure
+ORDER: str = args.order
+RESUME: bool = args.resume
+SAVE_STEPS: Optional[int] = args.save_steps
+SAVE_TOTAL_LIMIT: Optional[int] = args.save_total_limit
+DATA_ROOT: Path = args.data_root.expanduser().resolve()
+PIPELINE: bool = args.pipeline
+MERGE_WORKERS: int = max(1, args.merge_workers)
+MERGE_CMD: str = args.merge_cmd
+EVAL_CMD: str = args.eval_cmd
+EVAL_MODE: str = args.eval_mode
+ADAPTER_EVAL_CMD: str = args.adapter_eval_cmd
+EVAL_BATCH: int = max(1, args.eval_batch)
+BATCH_EVAL_CMD: str = args.batch_eval_cmd
+EVAL_RUNGS: List[str] = [str(v) for v in _rungs]
+EVAL_COVERAGE: int = args.eval_coverage
+EVAL_FEATURE_COUNTS_DIR: Optional[Path] = args.eval_feature_counts_dir
+MERGED_ROOT: Path = args.merged_root.expanduser().resolve()
+EVAL_ROOT: Path = args.eval_root.expanduser().resolve()
+PAIR_STORE = None
+if args.pair_store is not None:
+    from pairstore import PairStore
+
+    PAIR_STORE = PairStore(args.pair_store.expanduser().resolve())
+_STORE_LOCK = threading.Lock()
+TOKCACHE_SCRIPT = Path(__file__).resolve().parent / "tokcache.py"
+# rmeval.py 分阶段评估中落选模型的结果目录、单个 adapter 出错时的错误信息目录（与 rmeval 一致）
+SCREEN_DIR = ".screen"
+ERROR_DIR = ".errors"
 
 # --------------------- 工具函数 ---------------------
 
-def load_wait_list(path: Path) -> List[str]:
+def load_wait_list(path: Path, allow_empty: bool = False) -> List[str]:
     if not path.is_file():
         logging.error("找不到 wait_experiments: %s", path)
         sys.exit(1)
     lines = [l.strip() for l in path.read_text(encoding="utf-8").splitlines() if l.strip()]
-    if not lines:
+    if not lines and not allow_empty:
         logging.error("wait_experiments 为空：%s", path)
         sys.exit(1)
     return lines
@@ -60,7 +348,7 @@ def load_wait_list(path: Path) -> List[str]:
 
 def save_wait_list(path: Path, remaining: List[str]) -> None:
     txt = "\n".join(remaining) + ("\n" if remaining else "")
-    path.write_text(txt, encoding="utf-8")
+    atomic_write_text(path, txt)
 
 
 def append_ready(path: Path, exp: str) -> None:
@@ -69,45 +357,758 @@ def append_ready(path: Path, exp: str) -> None:
         fp.write(f"{exp}\n")
 
 
-def run_yaml(cfg_path: Path, idx: int, total: int) -> bool:
-    logging.info("(%d/%d) ➜ %s", idx, total, cfg_path.name)
-    cmd = ["llamafactory-cli", "train", str(cfg_path)]
-    result = subprocess.run(cmd)
-    if result.returncode == 0:
-        logging.info("✓ 完成 %s", cfg_path.name)
+def detect_devices() -> List[str]:
+    """可用 GPU 列表：优先 CUDA_VISIBLE_DEVICES，其次 nvidia-smi -L。"""
+    visible = os.getenv("CUDA_VISIBLE_DEVICES")
+    if visible:
+        return [d.strip() for d in visible.split(",") if d.strip()]
+    try:
+        out = subprocess.run(
+            ["nvidia-smi", "-L"], capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return []
+    return [str(i) for i, line in enumerate(l for l in out.splitlines() if l.startswith("GPU "))]
+
+
+def parse_slots(spec: Optional[str]) -> List[Optional[str]]:
+    """把 --devices 解析为槽位列表，每个元素是该槽位的 CUDA_VISIBLE_DEVICES。"""
+    if spec:
+        slots = [s.strip().replace("+", ",") for s in spec.split(",") if s.strip()]
+    else:
+        slots = detect_devices()
+    # 没有检测到 GPU：单槽位，不设置 CUDA_VISIBLE_DEVICES
+    return slots or [None]
+
+
+def export_lists(q: JobQueue, train_dir: Path) -> None:
+    """按队列状态重写 wait_experiments.txt（未完成的任务），原子替换；失败的任务在 dead_experiments.txt。"""
+    save_wait_list(
+        train_dir / "wait_experiments.txt",
+        q.exps(train_dir, (PENDING, CLAIMED, RUNNING)),
+    )
+
+
+_MANIFEST_CACHE: dict = {}
+_MANIFEST_LOCK = threading.Lock()
+
+
+def render_manifest_yaml(job: Job) -> Optional[str]:
+    """按清单渲染任务的 YAML 文本；清单不可读或已没有该任务时返回 None。"""
+    path = Path(job.manifest)
+    with _MANIFEST_LOCK:
+        try:
+            mtime = path.stat().st_mtime_ns
+            cached = _MANIFEST_CACHE.get(path)
+            if cached is None or cached[0] != mtime:
+                cached = _MANIFEST_CACHE[path] = (mtime, *load_manifest(path))
+        except (OSError, ValueError) as e:
+            logging.error("无法读取清单 %s：%s", path, e)
+            return None
+    _, header, jobs = cached
+    if job.exp not in jobs:
+        logging.error("清单 %s 中已没有任务 %s", path, job.exp)
+        return None
+    return render_job(header, jobs[job.exp])
+
+
+def render_manifest_job(job: Job) -> bool:
+    """清单任务在启动时才渲染 YAML（清单修改后，尚未启动的任务使用新内容）。"""
+    if not job.manifest:
+        return True
+    text = render_manifest_yaml(job)
+    if text is None:
+        return False
+    job.base_yaml_path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(job.base_yaml_path, text)
+    return True
+
+
+def ensure_dataset(job: Job) -> bool:
+    """从 pairstore 按需生成该实验的数据集 JSON；未启用 pairstore 时什么都不做。"""
+    if PAIR_STORE is None:
+        return True
+    # 清单任务名不等于数据集名，以 YAML 中的 dataset 为准
+    exp = read_value(job.yaml_path.read_text(encoding="utf-8"), "dataset") or job.exp
+    with _STORE_LOCK:
+        if not PAIR_STORE.has_experiment(exp):
+            logging.error("pairstore 中没有实验 %s", exp)
+            return False
+        PAIR_STORE.ensure_materialized(exp, DATA_ROOT / f"{exp}.json")
+    return True
+
+
+def ensure_tokenized(job: Job, log_path: Path, on_tick: Callable[[], None], echo: bool) -> bool:
+    """YAML 使用共享分词缓存（tokenized_path）时，先用 tokcache.py 组装该实验的分词数据集。
+
+    在子进程里运行：分词会 fork 多个进程，且不应占用调度器进程的内存。
+    """
+    tokenized_path = read_value(job.yaml_path.read_text(encoding="utf-8"), "tokenized_path")
+    if not tokenized_path or tokenized_path == "null":
+        return True
+    cmd = [sys.executable, str(TOKCACHE_SCRIPT), "ensure", str(job.yaml_path), "--data-root", str(DATA_ROOT)]
+    if PAIR_STORE is not None:
+        cmd += ["--store", str(PAIR_STORE.root)]
+    returncode = run_command(cmd, None, log_path, on_tick, echo)
+    if returncode != 0:
+        logging.error("✗ %s 分词数据集准备失败（退出码 %d），见 %s", job.label, returncode, log_path)
+    return returncode == 0
+
+
+# --------------------- 耗时预测与调度顺序 ---------------------
+_SEED_SUFFIX = re.compile(r"__seed\d+$")
+
+
+def job_yaml_text(job: Job) -> Optional[str]:
+    if job.yaml_path.is_file():
+        return job.yaml_path.read_text(encoding="utf-8")
+    if job.manifest:
+        return render_manifest_yaml(job)
+    return None
+
+
+def estimate_work(job: Job) -> float:
+    text = job_yaml_text(job)
+    if text is None:
+        return 0.0
+    dataset = read_value(text, "dataset") or job.exp
+    with _STORE_LOCK:
+        rows = dataset_rows(dataset, DATA_ROOT, PAIR_STORE)
+    return job_work(text, rows)
+
+
+def plan_queue(q: JobQueue, n_slots: int) -> None:
+    """估计 pending 任务耗时，按 --order 设置优先级，并输出剩余时间估计。"""
+    # 同一实验不同种子的耗时几乎相同：历史记录按去掉种子后的任务名归类
+    model = RuntimeModel(
+        (_SEED_SUFFIX.sub("", r["exp"]), r["work"], r["wall_seconds"])
+        for r in q.rows((DONE,), stage=TRAIN) if r["wall_seconds"]
+    )
+    pending = []
+    updates = []
+    for r in q.rows((PENDING,), stage=TRAIN):
+        work = r["work"]
+        if work is None:
+            work = estimate_work(q.get(r["id"]))
+        est = model.predict(_SEED_SUFFIX.sub("", r["exp"]), work)
+        # fifo 清掉之前 lpt 设置的优先级，按入队顺序（id）领取
+        priority = 0.0 if ORDER == "fifo" else (est if est is not None else work)
+        updates.append((r["id"], work, est, priority))
+        pending.append((-priority, r["id"], est))
+    q.set_estimates(updates)
+
+    now = time.time()
+    running = []
+    for r in q.rows((CLAIMED, RUNNING), stage=TRAIN):
+        est = r["est_seconds"]
+        if est is None and r["work"] is not None:
+            est = model.predict(_SEED_SUFFIX.sub("", r["exp"]), r["work"])
+        running.append(None if est is None else max(0.0, est - (now - (r["started_at"] or now))))
+    pending.sort()
+    costs = [est for _, _, est in pending]
+    if not costs and not running:
+        return
+    if None in costs or None in running:
+        logging.info("暂无足够的历史耗时，按工作量排序（%d 个待训练任务）", len(costs))
+        return
+    eta = simulate_makespan(running, costs, n_slots)
+    logging.info(
+        "⏱ 预计剩余 %s（%d 个待训练、%d 个运行中，%d 个槽位；耗时模型基于 %d 个已完成任务），预计 %s 完成",
+        format_duration(eta), len(costs), len(running), n_slots, model.n,
+        time.strftime("%m-%d %H:%M", time.localtime(now + eta)),
+    )
+
+
+# --------------------- checkpoint 续训 ---------------------
+def prepare_launch_config(job: Job) -> Path:
+    """按需生成本次启动使用的 YAML：续训 checkpoint、save_steps 等覆盖项；无需覆盖时返回原文件。"""
+    text = job.yaml_path.read_text(encoding="utf-8")
+    overrides = {}
+    if SAVE_STEPS is not None:
+        current = read_value(text, "save_steps")
+        if current is None or not current.isdigit() or int(current) > SAVE_STEPS:
+            overrides["save_steps"] = SAVE_STEPS
+    if SAVE_TOTAL_LIMIT is not None:
+        overrides["save_total_limit"] = SAVE_TOTAL_LIMIT
+    output_dir = read_value(text, "output_dir")
+    if RESUME and output_dir:
+        ckpt = latest_checkpoint(Path(output_dir))
+        if ckpt is not None:
+            logging.info("⏯ %s 从 %s 继续训练", job.label, ckpt)
+            overrides["resume_from_checkpoint"] = str(ckpt)
+            overrides["overwrite_output_dir"] = False
+    if not overrides:
+        return job.yaml_path
+    launch = job.train_dir / "variants" / f"{job.yaml_path.stem}.launch.yaml"
+    launch.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(launch, apply_overrides(text, overrides))
+    return launch
+
+
+# --------------------- 合并 / 评估阶段 ---------------------
+def seed_runs(text: str) -> List[Tuple[str, str]]:
+    """训练 YAML 产出的 (seed, output_dir)；打包任务每个种子一个。"""
+    output_dir = read_value(text, "output_dir") or ""
+    packed = read_value(text, "packed_seeds")
+    if packed is not None:
+        seeds = [s.strip() for s in packed.strip("[]").split(",") if s.strip()]
+        return [(seed, output_dir.replace("{seed}", seed)) for seed in seeds]
+    return [(read_value(text, "seed") or "0", output_dir)]
+
+
+def stage_config_path(job: Job, name: str, stage: str) -> Path:
+    return job.train_dir / "stages" / f"{name}.{stage}.yaml"
+
+
+def write_followups(job: Job) -> List[Tuple[str, str, Path]]:
+    """训练成功后为每个种子生成 export / eval 配置，返回待入队的 [(任务名, 阶段, 配置)]。
+
+    全参数微调，或 --eval-mode adapter 下的 LoRA，跳过合并直接评估 output_dir。
+    """
+    text = job.yaml_path.read_text(encoding="utf-8")
+    experiment = _SEED_SUFFIX.sub("", job.exp)
+    lora = (read_value(text, "finetuning_type") or "lora") == "lora"
+    adapter = lora and EVAL_MODE == "adapter"
+    merge = lora and not adapter
+    followups = []
+    for seed, output_dir in seed_runs(text):
+        name = f"{experiment}__seed{seed}"
+        model = MERGED_ROOT / experiment / f"model{seed}" if merge else Path(output_dir)
+        eval_cfg = stage_config_path(job, name, EVAL)
+        eval_cfg.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(eval_cfg, (
+            "### eval\n"
+            f"model: {model}\n"
+            f"adapter: {str(adapter).lower()}\n"
+            f"base: {read_value(text, 'model_name_or_path')}\n"
+            f"template: {read_value(text, 'template')}\n"
+            f"output_dir: {EVAL_ROOT / experiment}\n"
+            f"save_name: model{seed}\n"
+        ))
+        if not merge:
+            followups.append((name, EVAL, eval_cfg))
+            continue
+        merge_cfg = stage_config_path(job, name, MERGE)
+        atomic_write_text(merge_cfg, (
+            "### model\n"
+            f"model_name_or_path: {read_value(text, 'model_name_or_path')}\n"
+            f"adapter_name_or_path: {output_dir}\n"
+            f"template: {read_value(text, 'template')}\n"
+            "finetuning_type: lora\n"
+            "trust_remote_code: true\n"
+            "\n### export\n"
+            f"export_dir: {model}\n"
+            "export_size: 5\n"
+            "export_device: cpu\n"
+            "export_legacy_format: false\n"
+        ))
+        followups.append((name, MERGE, merge_cfg))
+    return followups
+
+
+def eval_values(job: Job) -> Dict[str, Optional[str]]:
+    text = job.yaml_path.read_text(encoding="utf-8")
+    return {key: read_value(text, key) for key in ("model", "adapter", "base", "template", "output_dir", "save_name")}
+
+
+def run_stage(
+    job: Job,
+    device: Optional[str],
+    log_path: Path,
+    on_tick: Callable[[], None],
+    echo: bool,
+) -> int:
+    """执行一个合并或评估任务；命令成功但没有产出预期文件时按失败处理。"""
+    text = job.yaml_path.read_text(encoding="utf-8")
+    if job.stage == MERGE:
+        cmd = [part.format(cfg=job.yaml_path) for part in shlex.split(MERGE_CMD)]
+        # export_device: cpu，不占用训练中的 GPU
+        env = {**os.environ, "CUDA_VISIBLE_DEVICES": ""}
+        expected = Path(read_value(text, "export_dir")) / "config.json"
+    else:
+        values = eval_values(job)
+        Path(values["output_dir"]).mkdir(parents=True, exist_ok=True)
+        template = ADAPTER_EVAL_CMD if values["adapter"] == "true" else EVAL_CMD
+        cmd = [part.format(**values) for part in shlex.split(template)]
+        env = None if device is None else {**os.environ, "CUDA_VISIBLE_DEVICES": device}
+        expected = Path(values["output_dir"]) / f"{values['save_name']}.json"
+    logging.info("➜ %s%s", job.label, f" [GPU {device}]" if device and job.stage == EVAL else "")
+    returncode = run_command(cmd, env, log_path, on_tick, echo)
+    if returncode == 0 and not expected.is_file():
+        logging.error("✗ %s 命令成功但没有生成 %s", job.label, expected)
+        return 1
+    if returncode == 0:
+        logging.info("✓ 完成 %s → %s", job.label, expected.parent if job.stage == MERGE else expected)
+    else:
+        logging.error("✗ %s 失败（退出码 %d）", job.label, returncode)
+    return returncode
+
+
+def run_stage_logged(
+    job: Job, device: Optional[str], on_tick: Callable[[], None], echo: bool
+) -> Tuple[int, Optional[str]]:
+    """run_stage，失败时按本次写入的日志分类：(退出码, 失败类型)。"""
+    log_path = job.train_dir / "logs" / f"{job.exp}.{job.stage}.log"
+    log_start = log_path.stat().st_size if log_path.is_file() else 0
+    if job.stage == EVAL:
+        values = eval_values(job)
+        if values["adapter"] != "true":
+            # rmeval.py 的结果另行标记，见 evalroot.py
+            try:
+                claim_scoring(Path(values["output_dir"]).parent, MERGED_SCORING)
+            except ValueError as e:
+                logging.error("✗ %s：%s", job.label, e)
+                return 1, DATA
+    returncode = run_stage(job, device, log_path, on_tick, echo)
+    if returncode == 0:
+        return 0, None
+    return returncode, classify_failure(returncode, read_log_tail(log_path, log_start))
+
+
+def run_eval_batch(
+    jobs: List[Job], device: Optional[str], on_tick: Callable[[], None], echo: bool
+) -> List[Tuple[Job, Optional[int], Optional[str]]]:
+    """一次领取的多个评估任务：同一基座与模板的 adapter 评估合并为一次 BATCH_EVAL_CMD 调用
+    （评估集只分词一次、基座只加载一次），其余逐个执行。返回每个任务的 (任务, 退出码, 失败类型)；
+    退出码为 None 表示进程在评估到该任务之前就退出了，应放回队列且不计入尝试次数。"""
+    groups: Dict[Tuple[Optional[str], Optional[str]], List[Tuple[Job, Dict[str, Optional[str]]]]] = {}
+    results = []
+    for job in jobs:
+        values = eval_values(job)
+        if values["adapter"] == "true":
+            groups.setdefault((values["base"], values["template"]), []).append((job, values))
+        else:
+            results.append((job, *run_stage_logged(job, device, on_tick, echo)))
+    for (base, template), group in groups.items():
+        if len(group) == 1 and not EVAL_RUNGS:
+            results.append((group[0][0], *run_stage_logged(group[0][0], device, on_tick, echo)))
+            continue
+        first = group[0][0]
+        expected = [Path(v["output_dir"]) / f"{v['save_name']}.json" for _, v in group]
+        jobs_path = first.train_dir / "stages" / f"{first.exp}.evalbatch.jsonl"
+        jobs_path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(jobs_path, "".join(
+            json.dumps({"adapter": v["model"], "output": str(path)}, ensure_ascii=False) + "\n"
+            for (_, v), path in zip(group, expected)
+        ))
+        cmd = [part.format(base=base, template=template, jobs=jobs_path) for part in shlex.split(BATCH_EVAL_CMD)]
+        if EVAL_RUNGS:
+            cmd += ["--rungs", *EVAL_RUNGS, "--contenders_dir", str(EVAL_ROOT)]
+            if EVAL_COVERAGE:
+                cmd += ["--coverage", str(EVAL_COVERAGE), "--feature_counts_dir", str(EVAL_FEATURE_COUNTS_DIR)]
+        env = None if device is None else {**os.environ, "CUDA_VISIBLE_DEVICES": device}
+        log_path = first.train_dir / "logs" / f"{first.exp}.evalbatch.log"
+        log_start = log_path.stat().st_size if log_path.is_file() else 0
+        logging.info(
+            "➜ 合并评估 %d 个 adapter（%s 等）%s", len(group), first.label, f" [GPU {device}]" if device else "",
+        )
+        started = time.time()
+        returncode = run_command(cmd, env, log_path, on_tick, echo)
+        failure = None if returncode == 0 else classify_failure(returncode, read_log_tail(log_path, log_start))
+
+        def fresh(p: Path) -> bool:
+            return p.is_file() and p.stat().st_mtime >= started
+
+        outcomes = []
+        for (job, _), path in zip(group, expected):
+            # 进程中途失败时，已写出结果的 adapter 仍算完成；旧的结果文件不算。
+            # 分阶段评估中落选的模型只有 .screen/ 下的子样本结果，同样算完成
+            done = path if fresh(path) else None
+            screened = path.parent / SCREEN_DIR / path.name
+            if done is None and fresh(screened):
+                # 已晋级但全量评估没有完成的不算
+                done = None if json.loads(screened.read_text(encoding="utf-8"))["screen"]["promoted"] else screened
+            error = path.parent / ERROR_DIR / path.name
+            outcomes.append((job, path, done, error if fresh(error) else None))
+        # 有 adapter 完成或单独出错，说明进程正常启动过；其余没有任何产出的是没轮到的
+        started_ok = any(done or error for _, _, done, error in outcomes)
+        for job, path, done, error in outcomes:
+            if done is not None:
+                logging.info("✓ 完成 %s → %s", job.label, done)
+                results.append((job, 0, None))
+            elif error is not None:
+                # 只有出错的 adapter 按它自己的错误信息分类
+                info = json.loads(error.read_text(encoding="utf-8"))
+                logging.error("✗ %s 评估出错：%s（见 %s）", job.label, info["error"], error)
+                results.append((job, 1, classify_failure(1, f"{info['error']}\n{info.get('traceback', '')}")))
+            elif returncode == 0:
+                logging.error("✗ %s 命令成功但没有生成 %s", job.label, path)
+                results.append((job, 1, UNKNOWN))
+            elif started_ok:
+                logging.warning("↩ %s 未被评估（进程退出码 %d），放回队列", job.label, returncode)
+                results.append((job, None, None))
+            else:
+                logging.error("✗ %s 失败（退出码 %d，见 %s）", job.label, returncode, log_path)
+                results.append((job, returncode, failure))
+    return results
+
+
+def followups_of(job: Job) -> List[Tuple[str, str, Path]]:
+    """任务成功后要入队的下游任务；须在 finish 之前准备好，与完成状态一起提交。"""
+    if job.stage == TRAIN:
+        return write_followups(job) if PIPELINE else []
+    if job.stage == MERGE:
+        return [(job.exp, EVAL, stage_config_path(job, job.exp, EVAL))]
+    return []
+
+
+def on_success(job: Job, followups: List[Tuple[str, str, Path]]) -> None:
+    if job.stage == TRAIN:
+        append_ready(job.train_dir / "ready_experiments.txt", job.exp)
+        if followups:
+            logging.info("➕ %s：已加入%s任务", job.label, "合并" if followups[0][1] == MERGE else "评估")
+
+
+# --------------------- 失败分类 ---------------------
+OOM = "oom"
+DATA = "data"
+KILLED = "killed"
+UNKNOWN = "unknown"
+
+_FAILURE_PATTERNS = [
+    (OOM, re.compile(r"CUDA out of memory|OutOfMemoryError|CUBLAS_STATUS_ALLOC_FAILED|CUDA error: out of memory")),
+    # 只匹配 LLaMA-Factory 数据加载阶段（data/loader.py、data/parser.py）抛出的错误，
+    # 其它位置的 KeyError / FileNotFoundError 多是环境问题，值得重试
+    (DATA, re.compile(
+        r"Cannot find valid samples|Undefined dataset .* in|Cannot open .*dataset_info\.json"
+        r"|DatasetGenerationError|ValueError: File .* not found"
+        # evalroot.claim_scoring：结果目录已有其它打分方式的结果（rmeval.py 以此退出），换目录之前重试无用
+        r"|不可比；请使用另一个结果目录"
+    )),
+]
+# SIGKILL / SIGTERM / SIGINT：被抢占或宿主机 OOM killer 杀掉
+_KILLED_CODES = {-9, 137, -15, 143, -2, 130}
+
+
+def classify_failure(returncode: int, log_tail: str) -> str:
+    for failure, pattern in _FAILURE_PATTERNS:
+        if pattern.search(log_tail):
+            return failure
+    if returncode in _KILLED_CODES:
+        return KILLED
+    return UNKNOWN
+
+
+def read_log_tail(log_path: Path, start: int, limit: int = 1 << 16) -> str:
+    """读取本次尝试写入日志的最后 limit 字节。"""
+    try:
+        with log_path.open("rb") as f:
+            f.seek(max(start, f.seek(0, os.SEEK_END) - limit))
+            return f.read().decode("utf-8", errors="replace")
+    except OSError:
+        return ""
+
+
+def oom_variant(job: Job) -> Optional[Path]:
+    """生成 batch size 减半、梯度累积加倍的 YAML（有效 batch 不变）；batch size 已为 1 时返回 None。"""
+    text = job.yaml_path.read_text(encoding="utf-8")
+    try:
+        bs = int(read_value(text, "per_device_train_batch_size") or 1)
+        accum = int(read_value(text, "gradient_accumulation_steps") or 1)
+    except ValueError:
+        return None
+    if bs <= 1:
+        return None
+    new_bs = bs // 2
+    variant = job.train_dir / "variants" / f"{job.exp}.bs{new_bs}.yaml"
+    variant.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(variant, apply_overrides(text, {
+        "per_device_train_batch_size": new_bs,
+        "gradient_accumulation_steps": accum * bs // new_bs,
+    }))
+    return variant
+
+
+def append_dead(train_dir: Path, exp: str, failure: str, error: str) -> None:
+    with (train_dir / "dead_experiments.txt").open("a", encoding="utf-8") as fp:
+        fp.write(f"{exp}\t{failure}\t{error}\n")
+
+
+def handle_failure(q: JobQueue, job: Job, returncode: int, failure: str) -> bool:
+    """按失败策略处理一次失败；返回 True 表示任务已重新入队（或已不归本 worker）。"""
+    error = f"exit code {returncode}"
+    config = None
+    retryable = failure != DATA and job.attempts < MAX_ATTEMPTS
+    if retryable and failure == OOM and job.stage == TRAIN:
+        variant = oom_variant(job)
+        if variant is None:
+            logging.warning("%s OOM，但 per_device_train_batch_size 已为 1，无法再减小", job.label)
+            retryable = False
+        else:
+            config = str(variant)
+    if retryable:
+        delay = RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        if not q.retry(job, delay, returncode, error, failure, config):
+            logging.warning("%s 已被回收并由其它 worker 领取，不再记录本次失败", job.label)
+            return True
+        logging.warning(
+            "↻ %s 失败（%s，第 %d/%d 次），%.0f 秒后重试%s",
+            job.label, failure, job.attempts, MAX_ATTEMPTS, delay,
+            f"，改用 {Path(config).name}" if config else "",
+        )
         return True
-    logging.error("✗ %s 失败（退出码 %d）", cfg_path.name, result.returncode)
+    if not q.finish(job, returncode, error, failure):
+        logging.warning("%s 已被回收并由其它 worker 领取，不再记录本次失败", job.label)
+        return True
+    append_dead(job.train_dir, job.exp, failure if job.stage == TRAIN else f"{job.stage}/{failure}", error)
+    logging.error("☠ %s 失败（%s），已写入 dead_experiments.txt", job.label, failure)
     return False
 
+
+def run_yaml(
+    cfg_path: Path,
+    idx: int,
+    total: int,
+    device: Optional[str] = None,
+    log_path: Optional[Path] = None,
+    on_tick: Optional[Callable[[], None]] = None,
+    echo: bool = True,
+) -> int:
+    """运行一个训练任务并返回退出码；运行期间每 HEARTBEAT_INTERVAL 秒调用一次 on_tick。
+
+    输出追加写入 log_path（用于失败分类）；echo 为真时同时输出到终端。
+    """
+    logging.info("(%d/%d) ➜ %s%s", idx, total, cfg_path.name, f" [GPU {device}]" if device else "")
+    packed = read_value(cfg_path.read_text(encoding="utf-8"), "packed_seeds") is not None
+    cmd = [part.format(cfg=cfg_path) for part in shlex.split(PACKED_CMD if packed else TRAIN_CMD)]
+    env = None
+    if device is not None:
+        env = {**os.environ, "CUDA_VISIBLE_DEVICES": device}
+    returncode = run_command(cmd, env, log_path, on_tick, echo)
+    if returncode == 0:
+        logging.info("✓ 完成 %s", cfg_path.name)
+    else:
+        logging.error("✗ %s 失败（退出码 %d）", cfg_path.name, returncode)
+    return returncode
+
+
+def run_command(
+    cmd: List[str],
+    env: Optional[dict] = None,
+    log_path: Optional[Path] = None,
+    on_tick: Optional[Callable[[], None]] = None,
+    echo: bool = True,
+) -> int:
+    """运行子进程，输出追加写入 log_path（echo 时同时输出到终端），期间定时调用 on_tick。"""
+    if log_path is None:
+        log_path = Path(os.devnull)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with log_path.open("ab") as log:
+        proc = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+        def pump() -> None:
+            # 按块转发，保留 tqdm 的 \r 进度条
+            for chunk in iter(lambda: proc.stdout.read1(1 << 16), b""):
+                log.write(chunk)
+                if echo:
+                    sys.stdout.buffer.write(chunk)
+                    sys.stdout.flush()
+
+        reader = threading.Thread(target=pump, daemon=True)
+        reader.start()
+        while True:
+            try:
+                returncode = proc.wait(timeout=HEARTBEAT_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                if on_tick is not None:
+                    on_tick()
+        reader.join()
+    return returncode
+
 # --------------------- 主流程 ---------------------
 
-def main() -> None:
-    logging.info("使用 TRAIN_DIR: %s", TRAIN_DIR)
-    experiments = load_wait_list(WAIT_FILE)
-    total = len(experiments)
-    logging.info("将按顺序训练 %d 个实验。", total)
-
-    for idx, exp in enumerate(experiments, start=1):
-        yaml_path = TRAIN_DIR / f"{exp}.yaml"
-        if not yaml_path.is_file():
-            msg = f"缺少 YAML 文件：{yaml_path}"
-            if STRICT:
-                logging.error(msg)
-                sys.exit(1)
-            logging.warning(msg + "，跳过。")
-            continue
+def enqueue_wait_lists(q: JobQueue) -> None:
+    """把各目录 wait_experiments.txt 中的实验加入队列（已在队列中的保持原状态）。"""
+    for train_dir in TRAIN_DIRS:
+        exps = load_wait_list(train_dir / "wait_experiments.txt", allow_empty=True)
+        valid = []
+        for exp in exps:
+            yaml_path = train_dir / f"{exp}.yaml"
+            if not yaml_path.is_file():
+                msg = f"缺少 YAML 文件：{yaml_path}"
+                if STRICT:
+                    logging.error(msg)
+                    sys.exit(1)
+                logging.warning(msg + "，跳过。")
+                continue
+            valid.append(exp)
+        added = q.enqueue(train_dir, valid)
+        logging.info(
+            "使用 TRAIN_DIR: %s（新入队 %d 个，队列状态 %s）", train_dir, added, q.counts(train_dir, (TRAIN,))
+        )
 
-        if not run_yaml(yaml_path, idx, total):
-            logging.error("中断执行。可修复问题后重跑剩余任务。")
+
+def enqueue_manifests(q: JobQueue) -> None:
+    """把 sweep 清单中的任务加入队列；YAML 不预先生成。"""
+    for manifest in MANIFESTS:
+        try:
+            _, jobs = load_manifest(manifest)
+        except (OSError, ValueError) as e:
+            logging.error("无法读取清单 %s：%s", manifest, e)
             sys.exit(1)
+        train_dir = manifest_train_dir(manifest)
+        train_dir.mkdir(parents=True, exist_ok=True)
+        added = q.enqueue(train_dir, list(jobs), manifest=manifest)
+        logging.info(
+            "使用清单: %s（%d 个任务，新入队 %d 个，队列状态 %s）",
+            manifest, len(jobs), added, q.counts(train_dir, (TRAIN,)),
+        )
+
+
+def check_eval_root() -> None:
+    """流水线评估的打分方式与 --eval-root 中已有结果不一致时直接退出，而不是让每个评估任务失败。"""
+    existing = scoring_of(EVAL_ROOT)
+    if existing is None:
+        return
+    if EVAL_MODE == "merged":
+        ok = existing == MERGED_SCORING
+    else:
+        ok = existing.startswith(ADAPTER_SCORING_PREFIX)
+    if not ok:
+        logging.error(
+            "--eval-root %s 中的结果用 %s 打分，与 --eval-mode %s 的结果不可比，不能混在一起汇总；"
+            "请用 --eval-root 指定一个新的结果目录",
+            EVAL_ROOT, existing, EVAL_MODE,
+        )
+        sys.exit(1)
+
+
+def main() -> None:
+    if PIPELINE:
+        check_eval_root()
+    q = JobQueue(QUEUE_DB)
+    logging.info("任务队列：%s", QUEUE_DB)
+    enqueue_wait_lists(q)
+    enqueue_manifests(q)
+    reclaimed = q.reclaim_orphans() + q.reclaim_stale(HEARTBEAT_TIMEOUT)
+    if reclaimed:
+        logging.warning("已回收 %d 个中断/超时的任务", reclaimed)
+
+    total = sum(q.counts(d, (TRAIN,))[PENDING] for d in ALL_DIRS)
+    backlog = q.counts(stages=(MERGE, EVAL))[PENDING] if PIPELINE else 0
+    if not total and not backlog:
+        logging.error("wait_experiments 为空：%s", ", ".join(str(d) for d in ALL_DIRS))
+        sys.exit(1)
+    slots = parse_slots(args.devices)
+    logging.info("将用 %d 个槽位训练 %d 个实验：%s", len(slots), total, slots)
+    plan_queue(q, len(slots))
 
-        # -------- 成功后更新队列 --------
-        append_ready(READY_FILE, exp)
-        remaining = experiments[idx:]  # idx 已经是下一个
-        save_wait_list(WAIT_FILE, remaining)
-        # --------------------------------
+    # (worker 名, CUDA_VISIBLE_DEVICES, 依次尝试领取的阶段)
+    pools: List[Tuple[Optional[str], Optional[str], Tuple[str, ...]]] = []
+    eval_slots = parse_slots(args.eval_devices) if PIPELINE and args.eval_devices else []
+    for device in slots:
+        # 没有专用评估卡时训练槽位优先跑评估：评估短，且能尽早产出结果
+        stages = (EVAL, TRAIN) if PIPELINE and not eval_slots else (TRAIN,)
+        pools.append((device, device, stages))
+    if PIPELINE:
+        pools += [(f"eval{device}", device, (EVAL,)) for device in eval_slots]
+        pools += [(f"merge{i}", None, (MERGE,)) for i in range(MERGE_WORKERS)]
+        logging.info(
+            "流水线：%d 个合并 worker，评估%s", MERGE_WORKERS,
+            f"使用槽位 {eval_slots}" if eval_slots else "由训练槽位优先领取",
+        )
+        if EVAL_RUNGS and not EVAL_COVERAGE:
+            logging.warning("分阶段评估未设置 --eval-coverage：落选实验只按分数筛掉，不会为回归训练集的覆盖补选")
+    echo = len(pools) == 1
+    # 某阶段的任务可能由前面的阶段产生：这些阶段都空了，worker 才能退出
+    upstream = {TRAIN: (TRAIN,), MERGE: (TRAIN, MERGE), EVAL: STAGES}
 
-    logging.info("全部完成 🎉")
+    failed = threading.Event()
+    counter = iter(range(1, 1 << 30))
+    counter_lock = threading.Lock()
+
+    def claim(wid: str, stages: Tuple[str, ...]) -> Optional[Job]:
+        for stage in stages:
+            job = q.claim(wid, stage)
+            if job is not None:
+                return job
+        return None
+
+    def worker(name: Optional[str], device: Optional[str], stages: Tuple[str, ...]) -> None:
+        wid = worker_id(name)
+        watch = sorted({s for stage in stages for s in upstream[stage]})
+        while not failed.is_set():
+            q.reclaim_stale(HEARTBEAT_TIMEOUT)
+            job = claim(wid, stages)
+            if job is None:
+                counts = q.counts(stages=watch)
+                if not counts[PENDING] and not counts[CLAIMED] + counts[RUNNING]:
+                    return
+                # 还有任务在退避、在其它槽位上运行，或前面的阶段还会产生任务
+                ready = q.next_ready_at(stages)
+                time.sleep(5.0 if ready is None else min(5.0, max(0.2, ready - time.time())))
+                continue
+            batch = [job]
+            if job.stage == EVAL and EVAL_BATCH > 1 and eval_values(job)["adapter"] == "true":
+                batch += q.claim_many(wid, EVAL, EVAL_BATCH - 1)
+
+            def on_tick(batch: List[Job] = batch) -> None:
+                for claimed in batch:
+                    q.heartbeat(claimed)
+
+            for claimed in batch:
+                q.start(claimed)
+            if job.stage == EVAL:
+                results = run_eval_batch(batch, device, on_tick, echo)
+            elif job.stage != TRAIN:
+                results = [(job, *run_stage_logged(job, device, on_tick, echo))]
+            else:
+                with counter_lock:
+                    idx = next(counter)
+                log_path = job.train_dir / "logs" / f"{job.exp}.log"
+                if not render_manifest_job(job) or not ensure_dataset(job) or not ensure_tokenized(
+                    job, log_path, on_tick=on_tick, echo=echo
+                ):
+                    returncode, failure = -1, DATA
+                else:
+                    log_start = log_path.stat().st_size if log_path.is_file() else 0
+                    returncode = run_yaml(
+                        prepare_launch_config(job), idx, total, device, log_path, on_tick=on_tick, echo=echo,
+                    )
+                    failure = None
+                    if returncode != 0:
+                        failure = classify_failure(returncode, read_log_tail(log_path, log_start))
+                results = [(job, returncode, failure)]
+            for job, returncode, failure in results:
+                if returncode is None:
+                    q.release(job, "evaluation process exited before this job", refund=True)
+                elif returncode == 0:
+                    # -------- 成功后更新队列：下游任务与完成状态一起提交 --------
+                    followups = followups_of(job)
+                    if not q.finish(job, followups=followups):
+                        logging.warning("%s 已被回收并由其它 worker 领取，结果交给新的所有者处理", job.label)
+                        continue
+                    on_success(job, followups)
+                elif not handle_failure(q, job, returncode, failure) and ON_FAILURE == "abort":
+                    # 不再派发新任务，等其它槽位上正在跑的任务结束
+                    failed.set()
+            if job.stage == TRAIN:
+                export_lists(q, job.train_dir)
+                plan_queue(q, len(slots))
+
+    threads = [
+        threading.Thread(target=worker, args=pool, name=f"slot-{pool[0]}", daemon=True)
+        for pool in pools
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    counts = q.counts()
+    if failed.is_set():
+        logging.error("中断执行。可修复问题后重跑剩余任务（失败任务可用 jobqueue.py requeue 放回队列）。")
+        sys.exit(1)
+    if counts[PENDING]:
+        logging.error(
+            "所有 worker 已退出，但队列中仍有 %d 个待执行任务（队列状态 %s），请重跑 run.py 处理。",
+            counts[PENDING], counts,
+        )
+        sys.exit(1)
+    if counts[FAILED]:
+        logging.warning("队列已排空，%d 个实验失败，见各目录 dead_experiments.txt。", counts[FAILED])
+    logging.info("全部完成 🎉（队列状态 %s）", counts)
 
 
 if __name__ == "__main__":
@@ -117,6 +1118,3 @@ if __name__ == "__main__":
         datefmt="%Y-%m-%d %H:%M:%S",
     )
     main()
-
-
-
@@ -6,10 +6,13 @@
 set -e  # 任何命令出错即退出
 
 # 需要训练的目录编号（可按需增删）
+dirs=()
 for dir in 3812 8280 9864; do
-  echo "⏳ 正在训练目录 ${dir} ..."
-  # 调用训练脚本，指定对应的训练目录
-  python /root/autodl-tmp/HP/run.py --train-dir "/root/autodl-tmp/HP/train/${dir}"
+  dirs+=("/root/autodl-tmp/HP/train/${dir}")
 done
 
-echo "✅ 所有训练任务已完成"
\ No newline at end of file
+# 所有目录交给同一个调度器，按检测到的 GPU 并行训练（可用 DEVICES=0,1 指定槽位）
+echo "⏳ 正在训练目录 ${dirs[*]} ..."
+python /root/autodl-tmp/HP/run.py --train-dir "${dirs[@]}"
+
+echo "✅ 所有训练任务已完成"
@@ -0,0 +1,104 @@
+"""
+训练耗时预测与调度顺序（run.py 使用）。
+
+* 工作量 work = min(数据集行数, max_samples) × num_train_epochs × 种子数（打包任务）；
+* 用已完成任务的实际耗时（队列中的 wall_seconds）拟合 耗时 ≈ a + b·work；
+  同一数据集、同样工作量的任务跑过时，直接用其平均耗时；
+* 待训练任务按预测耗时从长到短领取（LPT，最长处理时间优先），减少最后只剩一张卡在跑长任务的情况；
+* 按槽位模拟列表调度，估计剩余时间（ETA）。
+"""
+from __future__ import annotations
+
+import heapq
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from yamlgenerate import read_value
+
+_ROWS_CACHE: Dict[Tuple[str, int, int], int] = {}
+
+
+def _number(text: Optional[str], default: float) -> float:
+    try:
+        return float(text) if text not in (None, "", "null") else default
+    except ValueError:
+        return default
+
+
+def dataset_rows(dataset: str, data_root: Path, store=None) -> Optional[int]:
+    """数据集行数：优先读 pairstore 的实验索引头，其次解析 data_root/<dataset>.json（按 mtime 缓存）。"""
+    if store is not None and store.has_experiment(dataset):
+        return store.experiment_size(dataset)
+    path = data_root / f"{dataset}.json"
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    key = (str(path), st.st_size, st.st_mtime_ns)
+    if key not in _ROWS_CACHE:
+        with path.open("r", encoding="utf-8") as f:
+            _ROWS_CACHE[key] = len(json.load(f))
+    return _ROWS_CACHE[key]
+
+
+def job_work(yaml_text: str, rows: Optional[int]) -> float:
+    max_samples = _number(read_value(yaml_text, "max_samples"), 0)
+    if rows is None:
+        n = max_samples or 1.0
+    else:
+        n = min(rows, max_samples) if max_samples else rows
+    epochs = _number(read_value(yaml_text, "num_train_epochs"), 3.0)
+    seeds = read_value(yaml_text, "packed_seeds")
+    n_seeds = len([s for s in seeds.strip("[]").split(",") if s.strip()]) if seeds else 1
+    return n * epochs * n_seeds
+
+
+class RuntimeModel:
+    """耗时 ≈ intercept + slope · work，最小二乘拟合；历史不足时退化为平均速率。"""
+
+    def __init__(self, history: Iterable[Tuple[str, float, float]]):
+        self.exact: Dict[Tuple[str, float], List[float]] = {}
+        points = []
+        for dataset, work, wall in history:
+            if work and wall and wall > 0:
+                points.append((work, wall))
+                self.exact.setdefault((dataset, work), []).append(wall)
+        self.n = len(points)
+        self.intercept, self.slope = 0.0, None
+        if not points:
+            return
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        var = sum((x - mean_x) ** 2 for x, _ in points)
+        if len(points) >= 2 and var > 0:
+            slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var
+            if slope > 0 and mean_y - slope * mean_x >= 0:
+                self.slope, self.intercept = slope, mean_y - slope * mean_x
+                return
+        # 工作量都相同或拟合出负数：按平均速率
+        self.slope = mean_y / mean_x
+
+    def predict(self, dataset: str, work: float) -> Optional[float]:
+        same = self.exact.get((dataset, work))
+        if same:
+            return sum(same) / len(same)
+        if self.slope is None:
+            return None
+        return self.intercept + self.slope * work
+
+
+def simulate_makespan(running: Sequence[float], pending: Sequence[float], slots: int) -> float:
+    """列表调度模拟：running 为各运行中任务的剩余秒数，pending 按领取顺序排列，返回全部完成所需秒数。"""
+    free = sorted(list(running)[:slots]) + [0.0] * max(0, slots - len(running))
+    heapq.heapify(free)
+    for cost in pending:
+        heapq.heappush(free, heapq.heappop(free) + cost)
+    return max(free) if free else 0.0
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m{s:02d}s"
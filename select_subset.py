@@ -0,0 +1,220 @@
+"""
+用 PPM 回归模型挑选送人工标注的偏好数据子集（替代 sample_best_subset 的模拟退火）。
+
+每条偏好数据按 coef.jsonl 中的分箱特征得到一个 0/1 向量 x_r，子集 S 的特征计数为
+c(S) = Σ_{r∈S} x_r，PPM 预测分数为 f(c)：
+
+* 线性模型 f(c) = c0 + w·c：每条数据的贡献 g_r = w·x_r 互不影响，按 g_r 从大到小取前 k 条
+  就是基数约束下的最优解；
+* 二次模型 f(c) = c0 + b·c + cᵀAc：贪心，每步选边际增益
+  Δ_r = x_r·(b + (A+Aᵀ)c) + x_rᵀAx_r 最大的一条，c 与 (A+Aᵀ)c 增量更新；
+  特征向量相同的数据合并成一个“模式”，每步只在去重后的模式上计算增益。
+
+选择顺序只算一次，各个预算（0.25 / 0.50 / 0.75）取同一顺序的前缀。
+
+特征取值约定（features.jsonl 每行一条数据）：
+* `name::min_val=a|max_val=b`：数值列 name 落在 [a, b)（最后一箱含右端点）；列的最大值超过 1 时先做 min-max 归一化；
+* `analyzer_closed_set::feature_name=f|constraints=v`：列 f（列表或字符串）包含 v；
+* `analyzer_scalar::feature_name=f|value=v`：列 f 等于 v；
+* `analyzer_open_set::feature_name=f|check_for_existence=1`：列 f 非空。
+
+python select_subset.py \
+  --input_path /root/autodl-tmp/data/multipref/features/helpsteer2-features.jsonl \
+  --output_dir /root/autodl-tmp/data/directory_q/ \
+  --model_dir regressor/quadratic --budget 0.25 0.50 0.75
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from todpo import iter_jsonl
+
+
+def load_coefficients(path: Path) -> Tuple[List[str], np.ndarray]:
+    """coef.jsonl → (特征名列表, 系数向量)。"""
+    names, coefs = [], []
+    for rec in iter_jsonl(str(path)):
+        names.append(rec["feat"])
+        coefs.append(float(rec["coef"]))
+    return names, np.asarray(coefs)
+
+
+def parse_feature(name: str) -> Tuple[str, Dict[str, str]]:
+    """`kind::k1=v1|k2=v2` → (kind, {k1: v1, k2: v2})；值里可以含 `=`，按第一个 `=` 切分。"""
+    kind, _, spec = name.partition("::")
+    params = dict(part.split("=", 1) for part in spec.split("|") if "=" in part)
+    return kind, params
+
+
+def _contains(value: Any, item: str) -> bool:
+    if isinstance(value, (list, tuple, set)):
+        return item in value
+    return value == item
+
+
+def _present(value: Any) -> bool:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return False
+    return bool(value) if isinstance(value, (list, tuple, dict, str)) else True
+
+
+def feature_matrix(df: pd.DataFrame, feature_names: Sequence[str]) -> np.ndarray:
+    """(行数 × 特征数) 的 uint8 0/1 矩阵，列顺序与 feature_names 一致。"""
+    X = np.zeros((len(df), len(feature_names)), dtype=np.uint8)
+    normalized: Dict[str, pd.Series] = {}
+    missing = set()
+    for j, name in enumerate(feature_names):
+        kind, params = parse_feature(name)
+        column = params.get("feature_name", kind)
+        if column not in df.columns:
+            missing.add(column)
+            continue
+        values = df[column]
+        if "min_val" in params:
+            if column not in normalized:
+                num = pd.to_numeric(values, errors="coerce")
+                lo, hi = num.min(), num.max()
+                if hi > 1 and hi > lo:
+                    num = (num - lo) / (hi - lo)
+                normalized[column] = num
+            num = normalized[column]
+            low, high = float(params["min_val"]), float(params["max_val"])
+            mask = (num >= low) & ((num < high) | ((high >= 1.0) & (num <= high)))
+        elif "constraints" in params:
+            mask = values.map(lambda v, c=params["constraints"]: _contains(v, c))
+        elif "value" in params:
+            mask = values.map(lambda v, c=params["value"]: _contains(v, c))
+        elif "check_for_existence" in params:
+            mask = values.map(_present)
+        else:
+            raise ValueError(f"无法识别的特征：{name}")
+        X[:, j] = mask.to_numpy(dtype=bool)
+    if missing:
+        logging.warning("输入中没有这些列，对应特征全部记为 0：%s", ", ".join(sorted(missing)))
+    return X
+
+
+def selection_order(
+    X: np.ndarray,
+    linear: np.ndarray,
+    quadratic: Optional[np.ndarray],
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """返回前 k 条被选中的行号（按选择顺序）及每一步的边际增益。"""
+    if quadratic is None:
+        gains = X @ linear
+        order = np.argsort(-gains, kind="stable")[:k]
+        return order, gains[order]
+
+    patterns, inverse, counts = np.unique(X, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    # 每个模式对应的行号，按文件顺序出队
+    members = np.argsort(inverse, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    taken = np.zeros(len(patterns), dtype=np.int64)
+
+    P = patterns.astype(np.float64)
+    sym = quadratic + quadratic.T
+    P_sym = P @ sym                                   # 选中模式 p 后 (A+Aᵀ)c 的增量
+    self_term = np.einsum("ij,jk,ik->i", P, quadratic, P)
+    pull = np.zeros_like(linear)                      # (A+Aᵀ)c
+    order = np.empty(k, dtype=np.int64)
+    step_gains = np.empty(k)
+    for step in range(k):
+        gains = P @ (linear + pull) + self_term
+        gains[taken >= counts] = -np.inf
+        p = int(np.argmax(gains))
+        order[step] = members[starts[p] + taken[p]]
+        step_gains[step] = gains[p]
+        taken[p] += 1
+        pull += P_sym[p]
+    return order, step_gains
+
+
+def budget_sizes(budgets: Sequence[float], n_rows: int) -> List[int]:
+    sizes = []
+    for b in budgets:
+        if not 0 < b <= 1:
+            raise ValueError(f"预算应在 (0, 1] 之间：{b}")
+        sizes.append(int(round(b * n_rows)))
+    return sizes
+
+
+# ---------------------------------------------------------------------- CLI
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Pick the rows to route to human annotators with the PPM regressor",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument("--input_path", type=Path, required=True, help="每行一条数据的特征 JSONL（helpsteer2-features.jsonl），或 featstore.py 构建的特征存储目录")
+    parser.add_argument("--output_dir", type=Path, required=True, help="每个预算输出一个 budget_<b>.json")
+    parser.add_argument("--coef_path", type=Path, default=Path("regressor/linear/coef.jsonl"),
+                        help="线性模型的逐特征系数")
+    parser.add_argument("--model_dir", type=Path, default=None,
+                        help="可选：用 regressor/<kind>/ 下的 model.pkl（+ poly.pkl）代替 coef.jsonl，如 regressor/quadratic")
+    parser.add_argument("--budget", type=float, nargs="+", default=[0.25, 0.50, 0.75], help="送人工标注的比例")
+    parser.add_argument("--id_col", default="id", help="数据 id 所在列；缺失时使用行号")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+    intercept, quadratic = 0.0, None
+    if args.model_dir:
+        from ppmscore import PPMScorer
+
+        scorer = PPMScorer.from_dir(args.model_dir)
+        names, linear, quadratic, intercept = scorer.feature_names, scorer.linear, scorer.quadratic, scorer.intercept
+        logging.info("使用 %s 模型（%s）", scorer.kind, args.model_dir)
+    else:
+        names, linear = load_coefficients(args.coef_path)
+        logging.info("使用线性系数 %s（不含截距）", args.coef_path)
+
+    if args.input_path.is_dir():
+        from featstore import FeatureStore
+
+        features = FeatureStore(args.input_path)
+        ids, X = features.ids, features.matrix(names)
+    else:
+        df = pd.DataFrame.from_records(list(iter_jsonl(str(args.input_path))))
+        ids = df[args.id_col].tolist() if args.id_col in df.columns else list(range(len(df)))
+        X = feature_matrix(df, names)
+    if not len(X):
+        raise SystemExit(f"{args.input_path} 为空")
+    sizes = budget_sizes(args.budget, len(X))
+    logging.info("%d 条数据 × %d 个特征，去重后 %d 种特征组合", X.shape[0], X.shape[1], len(np.unique(X, axis=0)))
+
+    order, gains = selection_order(X, linear, quadratic, max(sizes))
+    predicted = intercept + np.cumsum(gains)
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    for budget, k in zip(args.budget, sizes):
+        chosen = np.sort(order[:k])
+        counts = X[chosen].sum(axis=0)
+        out = {
+            "budget": budget,
+            "k": k,
+            "predicted_score": float(predicted[k - 1]) if k else float(intercept),
+            "ids": [ids[i] for i in chosen],
+            "counts": {name: int(c) for name, c in zip(names, counts)},
+        }
+        path = args.output_dir / f"budget_{budget:.2f}.json"
+        path.write_text(json.dumps(out, ensure_ascii=False), encoding="utf-8")
+        logging.info("预算 %.2f：%d 条，预测分数 %.4f → %s", budget, k, out["predicted_score"], path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
@@ -1,9 +1,16 @@
 import argparse
 import logging
 import os
-import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from convcache import MANIFEST_NAME, ConversionManifest, source_fingerprint
+from pairstore import PairStore, prepare_experiment
+from todpo import CONVERTER_VERSION, convert_file
 
 # 配置日志设置
 logging.basicConfig(
@@ -12,11 +19,6 @@ logging.basicConfig(
     handlers=[logging.StreamHandler(sys.stdout)],  # 输出到控制台
     level=logging.INFO,  # 日志级别为INFO
 )
-TO_DPO_TEMPLATE = (
-    "python /root/autodl-tmp/HP/todpo.py "
-    "{input_path}/{experiment_name}.jsonl "
-    "{output_path}/{experiment_name}.json "
-)
 # 解析命令行参数
 def get_args():
     # fmt: off
@@ -30,9 +32,54 @@ def get_args():
     parser.add_argument("--input_path", type=str, default="data/",help="Path to the local directory containing the datasets.")
     parser.add_argument("--output_path", type=str, default="output_path/",help="Path to the local directory to save the models.")
     parser.add_argument("--sort_by_swaps", action="store_true", default=False,help="If set, will prioritize running experiments with high swaps.")
+    parser.add_argument("--store", type=Path, default=None,help="If set, deduplicate into this pairstore directory instead of writing one JSON per experiment.")
+    parser.add_argument("--force", action="store_true", default=False,help="Ignore the conversion manifest and reconvert every experiment.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,help="Number of worker processes used for conversion.")
     # fmt: on
     return parser.parse_args()
 
+def parse_experiment_name(experiment_str: str) -> str:
+    """去掉实验名后可能附带的 ::feat1___feat2 部分。"""
+    return experiment_str.split("::")[0]
+
+
+def experiment_paths(input_path: str, output_path: str, experiment_name: str) -> Tuple[str, str]:
+    return (
+        os.path.join(input_path, f"{experiment_name}.jsonl"),
+        os.path.join(output_path, f"{experiment_name}.json"),
+    )
+
+
+def convert_experiment(
+    input_path: str, output_path: str, experiment_name: str
+) -> Tuple[str, int, Optional[str], Optional[Dict[str, Any]]]:
+    """在 worker 进程中转换单个实验，返回 (实验名, 记录数, 错误信息, 源文件指纹)。"""
+    src, dst = experiment_paths(input_path, output_path, experiment_name)
+    tmp = dst + ".tmp"
+    try:
+        fingerprint = source_fingerprint(src)
+        count = convert_file(src, tmp)
+        # 写完再改名，避免中断时留下半截的 json
+        os.replace(tmp, dst)
+        return experiment_name, count, None, fingerprint
+    except Exception as e:  # noqa: BLE001 - 失败的文件记录下来，不影响其它实验
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return experiment_name, 0, f"{type(e).__name__}: {e}", None
+
+
+def prepare_for_store(
+    input_path: str, experiment_name: str
+) -> Tuple[str, Any, Optional[str], Optional[Dict[str, Any]]]:
+    """--store 模式：worker 只负责解析与规范化，写入由主进程完成。"""
+    src = os.path.join(input_path, f"{experiment_name}.jsonl")
+    try:
+        fingerprint = source_fingerprint(src)
+        return experiment_name, prepare_experiment(src), None, fingerprint
+    except Exception as e:  # noqa: BLE001
+        return experiment_name, None, f"{type(e).__name__}: {e}", None
+
+
 # 主程序执行逻辑
 def main():
     # 获取命令行参数
@@ -41,7 +88,7 @@ def main():
     # 读取实验文件，获取实验名称列表
     experiment_path: Path = args.experiment_path
     with experiment_path.open("r") as f:
-        experiment_names = f.read().splitlines()
+        experiment_names = [line for line in f.read().splitlines() if line.strip()]
 
     # 如果设置了根据交换量排序实验，则按交换量排序
     if args.sort_by_swaps:
@@ -51,21 +98,82 @@ def main():
             reverse=True,  # 按降序排序
         )
 
-    # 为每个实验创建训练命令
-    commands_for_experiments = []
-    for idx, experiment_str in enumerate(experiment_names):
-        if "::" in experiment_str:
-            experiment_name, _ = experiment_str.split("::")
-        else:
-            experiment_name = experiment_str
-        cmd = TO_DPO_TEMPLATE.format(
-            input_path = args.input_path,
-            experiment_name = experiment_name,
-            output_path = args.output_path
-        )
-        logging.info(cmd)
-        subprocess.run(cmd, shell=True)
-    logging.info("All jobs finished. You can track the logs above.")
+    experiment_names = [parse_experiment_name(x) for x in experiment_names]
+    store = PairStore(args.store) if args.store else None
+    if store is None:
+        os.makedirs(args.output_path, exist_ok=True)
+        manifest_dir = args.output_path
+    else:
+        manifest_dir = str(args.store)
+
+    def output_of(name: str) -> str:
+        if store is not None:
+            return str(store.experiment_path(name))
+        return experiment_paths(args.input_path, args.output_path, name)[1]
+
+    # 跳过源文件与转换器版本都没有变化的实验
+    manifest = ConversionManifest(os.path.join(manifest_dir, MANIFEST_NAME), CONVERTER_VERSION)
+    if args.force:
+        pending = experiment_names
+    else:
+        pending = [
+            name for name in experiment_names
+            if not manifest.is_current(
+                name, os.path.join(args.input_path, f"{name}.jsonl"), output_of(name)
+            )
+        ]
+    skipped = len(experiment_names) - len(pending)
+    workers = max(1, min(args.workers, len(pending) or 1))
+    logging.info(
+        "Converting %d experiments with %d workers (%d up to date, skipped)",
+        len(pending), workers, skipped,
+    )
+
+    # 在进程池中转换，避免每个实验都启动一个新的解释器
+    succeeded: List[Tuple[str, int]] = []
+    failed: List[Tuple[str, str]] = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            if store is None:
+                futures = [
+                    pool.submit(convert_experiment, args.input_path, args.output_path, name)
+                    for name in pending
+                ]
+            else:
+                futures = [pool.submit(prepare_for_store, args.input_path, name) for name in pending]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="converting"):
+                name, result, error, fingerprint = future.result()
+                if error is None and store is not None:
+                    try:
+                        added = store.add_experiment(name, result)
+                        logging.debug("%s: %d new unique pairs", name, added)
+                        result = len(result)
+                    except OSError as e:
+                        error = f"{type(e).__name__}: {e}"
+                if error is None:
+                    succeeded.append((name, result))
+                    manifest.record(name, fingerprint, output_of(name), result)
+                else:
+                    failed.append((name, error))
+    finally:
+        # 中途中断也保留已完成部分的记录
+        manifest.save()
+        if store is not None:
+            store.close()
+
+    # 每个文件的转换结果汇总
+    for name, count in sorted(succeeded):
+        logging.info("✓ %s (%d records)", name, count)
+    for name, error in sorted(failed):
+        logging.error("✗ %s: %s", name, error)
+    logging.info(
+        "All jobs finished: %d succeeded, %d failed, %d skipped.",
+        len(succeeded), len(failed), skipped,
+    )
+    if store is not None:
+        logging.info("Store %s now holds %d unique pairs.", args.store, len(store))
+    if failed:
+        sys.exit(1)
 
 # 执行主程序
 if __name__ == "__main__":
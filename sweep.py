@@ -0,0 +1,194 @@
+"""
+参数扫描：基础配置 + 扫描轴（实验子集 × 种子 × 超参数）→ 一个紧凑的 JSONL 任务清单。
+
+清单第一行是表头（基础 YAML 模板、扫描轴），之后每行一个任务，只记录与基础配置不同的参数：
+
+    {"sweep": 1, "base": "### model\\n...", "axes": {...}, "tokenized_root": null}
+    {"dataset": "human_datamodel_...", "job": "human_datamodel_...__learning_rate-5e-06__seed3812", "params": {...}}
+
+YAML 不再预先生成，run.py --manifest 在任务启动时才渲染到 <清单目录>/<清单名>/<job>.yaml。
+
+python sweep.py generate \
+  --experiment_path /root/autodl-tmp/data/output/helpsteer2/experiments.txt \
+  --output /root/autodl-tmp/HP/sweeps/lr.jsonl \
+  --seeds 3812,8280,9864 --axis learning_rate=1.0e-5,5.0e-6 --axis pref_loss=simpo,sigmoid
+python sweep.py render /root/autodl-tmp/HP/sweeps/lr.jsonl --output_path /tmp/lr   # 查看渲染结果
+python run.py --manifest /root/autodl-tmp/HP/sweeps/lr.jsonl --devices 0,1,2,3
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from yamlgenerate import NUM_SEEDS, SAMPLE_SIZE, TEMPLATE, apply_overrides, read_value, use_tokenized_cache
+
+MANIFEST_VERSION = 1
+_UNSAFE = re.compile(r"[^\w.+-]")
+
+
+def parse_axis(spec: str) -> Tuple[str, List[str]]:
+    """`key=v1,v2,...` → (key, [v1, v2, ...])"""
+    key, sep, values = spec.partition("=")
+    if not sep or not key.strip() or not values.strip():
+        raise argparse.ArgumentTypeError(f"扫描轴格式应为 key=v1,v2,...：{spec}")
+    return key.strip(), [v.strip() for v in values.split(",") if v.strip()]
+
+
+def job_suffix(params: Dict[str, Any]) -> str:
+    """除 seed 外的扫描参数编码进任务名 / output_dir，保证不同组合互不覆盖。"""
+    return "".join(
+        f"__{key}-{_UNSAFE.sub('_', str(value))}" for key, value in sorted(params.items()) if key != "seed"
+    )
+
+
+def build_jobs(datasets: List[str], axes: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+    keys = list(axes)
+    jobs = []
+    for dataset in datasets:
+        for combo in itertools.product(*(axes[k] for k in keys)):
+            params = dict(zip(keys, combo))
+            jobs.append({
+                "dataset": dataset,
+                "job": f"{dataset}{job_suffix(params)}__seed{params['seed']}",
+                "params": params,
+            })
+    return jobs
+
+
+def write_manifest(
+    path: Path, base: str, axes: Dict[str, List[str]], jobs: List[Dict[str, Any]],
+    tokenized_root: Optional[Path] = None,
+) -> None:
+    header = {
+        "sweep": MANIFEST_VERSION,
+        "base": base,
+        "axes": axes,
+        "tokenized_root": str(tokenized_root.expanduser().resolve()) if tokenized_root else None,
+    }
+    lines = [json.dumps(header, ensure_ascii=False)]
+    # 每行一个任务、键排序：清单可以直接 diff
+    lines += [json.dumps(job, ensure_ascii=False, sort_keys=True) for job in jobs]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def load_manifest(path: Path) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """返回 (表头, {任务名: 任务})。"""
+    with path.open("r", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("sweep") != MANIFEST_VERSION:
+            raise ValueError(f"不是 sweep 清单或版本不支持：{path}")
+        jobs = {}
+        for line in f:
+            if line.strip():
+                job = json.loads(line)
+                jobs[job["job"]] = job
+    return header, jobs
+
+
+def manifest_train_dir(path: Path) -> Path:
+    """渲染出的 YAML、日志和 wait/ready 列表所在目录。"""
+    return path.parent / path.stem
+
+
+def render_job(header: Dict[str, Any], job: Dict[str, Any]) -> str:
+    params = dict(job["params"])
+    seed = params.pop("seed")
+    text = header["base"].format(dataset_name=job["dataset"], seed=seed)
+    overrides: Dict[str, Any] = dict(params)
+    suffix = job_suffix(params)
+    output_dir = read_value(text, "output_dir")
+    if suffix and output_dir and "output_dir" not in params:
+        overrides["output_dir"] = output_dir + suffix
+    if overrides:
+        text = apply_overrides(text, overrides)
+    if header.get("tokenized_root"):
+        text = use_tokenized_cache(text, job["dataset"], Path(header["tokenized_root"]))
+    return text
+
+
+# ---------------------------------------------------------------------- CLI
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Generate a parameter-sweep job manifest",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("generate", help="生成任务清单")
+    p.add_argument("--experiment_path", type=Path, nargs="+", required=True,
+                   help="文本文件，每行一个 experiment_name；多个文件取并集")
+    p.add_argument("--output", type=Path, required=True, help="清单路径（.jsonl）")
+    p.add_argument("--base", type=Path, default=None,
+                   help="基础 YAML 模板（含 {dataset_name} / {seed} 占位符），默认使用 yamlgenerate.py 的 TEMPLATE")
+    p.add_argument("--sample_size", type=int, default=SAMPLE_SIZE, help="随机抽取的实验数，0 表示全部")
+    p.add_argument("--sort_by_swaps", action="store_true", help="若文件名包含 SWAPS_123，则按数字降序排序")
+    p.add_argument("--seed", type=int, default=42, help="抽样 / 生成训练种子用的随机种子")
+    p.add_argument("--seeds", default=None, help=f"训练种子，逗号分隔；默认随机生成 {NUM_SEEDS} 个")
+    p.add_argument("--axis", type=parse_axis, action="append", default=[],
+                   help="扫描轴 key=v1,v2,...，可重复；如 --axis learning_rate=1.0e-5,5.0e-6")
+    p.add_argument("--tokenized_root", type=Path, default=os.getenv("TOKENIZED_ROOT"),
+                   help="共享分词缓存目录（见 tokcache.py）")
+
+    p = sub.add_parser("render", help="把清单中的任务渲染成 YAML（调试用，run.py 会按需渲染）")
+    p.add_argument("manifest", type=Path)
+    p.add_argument("--output_path", type=Path, default=None, help="默认 <清单目录>/<清单名>/")
+    p.add_argument("jobs", nargs="*", help="只渲染这些任务，默认全部")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+    if args.command == "render":
+        header, jobs = load_manifest(args.manifest)
+        out = args.output_path or manifest_train_dir(args.manifest)
+        out.mkdir(parents=True, exist_ok=True)
+        for name in args.jobs or list(jobs):
+            (out / f"{name}.yaml").write_text(render_job(header, jobs[name]), encoding="utf-8")
+        logging.info("已渲染 %d 个 YAML → %s", len(args.jobs or jobs), out)
+        return
+
+    random.seed(args.seed)
+    names: List[str] = []
+    for path in args.experiment_path:
+        names += [line.strip().split("::")[0] for line in path.read_text().splitlines() if line.strip()]
+    names = list(dict.fromkeys(names))
+    if args.sort_by_swaps:
+        names.sort(key=lambda n: int(n.split("SWAPS_")[1]), reverse=True)
+    if args.sample_size and len(names) > args.sample_size:
+        logging.info("已随机抽取 %d/%d 个实验名。", args.sample_size, len(names))
+        names = random.sample(names, args.sample_size)
+
+    seeds = args.seeds.split(",") if args.seeds else [str(s) for s in random.sample(range(1, 9999), NUM_SEEDS)]
+    axes = {"seed": seeds}
+    for key, values in args.axis:
+        if key in ("seed", "dataset"):
+            raise SystemExit(f"{key} 不能作为超参数轴，请使用 --seeds / --experiment_path")
+        axes[key] = values
+    base = args.base.read_text(encoding="utf-8") if args.base else TEMPLATE
+
+    jobs = build_jobs(names, axes)
+    write_manifest(args.output, base, axes, jobs, args.tokenized_root)
+    logging.info(
+        "✅ %s：%d 个实验 × %s = %d 个任务",
+        args.output, len(names), " × ".join(f"{len(v)} {k}" for k, v in axes.items()), len(jobs),
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
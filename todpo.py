@@ -1,6 +1,9 @@
 import json
 import argparse
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, Iterable, Iterator, List, TextIO, Union
+
+# transform_record / 输出格式变化时递增，submit.py 的转换缓存会据此失效
+CONVERTER_VERSION = "1"
 
 def pick_assistant_text(arr: Union[List[Any], Dict[Any, Any]]) -> str:
     items = arr.values() if isinstance(arr, dict) else arr
@@ -30,25 +33,42 @@ def transform_record(item: Dict[str, Any]) -> Dict[str, Any]:
         }
     }
 
-def read_jsonl(path: str) -> List[Dict[str, Any]]:
-    records: List[Dict[str, Any]] = []
+def iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """逐行读取 JSONL，每次只在内存中保留一条记录。"""
     with open(path, 'r', encoding='utf-8') as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
-            records.append(json.loads(line))
-    return records
+            yield json.loads(line)
 
-def main(input_path: str, output_path: str):
-    # 读取 JSONL
-    data = read_jsonl(input_path)
-    # 转换
-    transformed = [transform_record(rec) for rec in data]
-    # 输出为 JSON array
+def read_jsonl(path: str) -> List[Dict[str, Any]]:
+    return list(iter_jsonl(path))
+
+def write_json_array(records: Iterable[Dict[str, Any]], fp: TextIO, indent: int = 2) -> int:
+    """把记录逐条写成 JSON array，输出与 json.dump(list, indent=indent) 完全一致。"""
+    pad = " " * indent
+    count = 0
+    for rec in records:
+        body = json.dumps(rec, ensure_ascii=False, indent=indent)
+        # 字符串里的换行已被转义，按行缩进是安全的
+        fp.write("[\n" if count == 0 else ",\n")
+        fp.write(pad + body.replace("\n", "\n" + pad))
+        count += 1
+    fp.write("\n]" if count else "[]")
+    return count
+
+def convert_file(input_path: str, output_path: str) -> int:
+    """流式转换：读一行、transform 一条、写一条，内存占用与文件大小无关。"""
     with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(transformed, f, ensure_ascii=False, indent=2)
-    print(f"✅ 转换完成 → {output_path}")
+        return write_json_array(
+            (transform_record(rec) for rec in iter_jsonl(input_path)), f
+        )
+
+def main(input_path: str, output_path: str):
+    # 逐条读取 JSONL → 转换 → 以 JSON array 增量写出
+    count = convert_file(input_path, output_path)
+    print(f"✅ 转换完成（{count} 条）→ {output_path}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="读取 JSONL 并转换成指定格式 JSON")
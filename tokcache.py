@@ -0,0 +1,331 @@
+"""
+跨实验共享的持久化分词缓存。
+
+所有实验的数据都来自同一批 (prompt, chosen, rejected) 三元组（见 pairstore.py），
+因此每个唯一三元组只用 LLaMA-Factory 分词一次，结果以 Arrow 分片保存（load_from_disk 为内存映射）：
+
+    <root>/<key>/pool.json             已分词的分片列表，key = hash(tokenizer, template, cutoff_len)
+    <root>/<key>/shards/<start>-<end>  pairstore 第 [start, end) 条唯一记录的分词结果
+    <root>/<key>/experiments/<exp>     按实验的索引数组从分片中挑出的行（chosen_* / rejected_* 按标志位交换），
+                                       即 YAML 中的 tokenized_path
+
+pairstore 新增记录时只对新增部分分词；实验数据集只做索引查找，不再重新分词。
+
+python tokcache.py ensure /root/autodl-tmp/HP/train/3812/<exp>.yaml \
+  --store /root/autodl-tmp/data/output/helpsteer2/pairstore
+python tokcache.py stats --root /root/autodl-tmp/HP/tokenized
+"""
+from __future__ import annotations
+
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pairstore import FLIP, PairStore, canonicalize
+from todpo import write_json_array
+from yamlgenerate import read_value
+
+DEFAULT_TOKENIZED_ROOT = "/root/autodl-tmp/HP/tokenized"
+DEFAULT_DATA_ROOT = "/root/autodl-tmp/data/output/helpsteer2/transwaps"
+CACHE_VERSION = "1"
+# 这些参数决定分词结果；dataset / max_samples 只影响挑选哪些行
+TOKENIZE_KEYS = ("model_name_or_path", "template", "cutoff_len")
+# 与 datagenerate.py 登记的数据集格式一致
+DATASET_ENTRY = {
+    "ranking": True,
+    "formatting": "sharegpt",
+    "columns": {"messages": "conversations", "chosen": "chosen", "rejected": "rejected"},
+}
+
+
+def tokenize_params(yaml_text: str) -> Dict[str, str]:
+    params = {k: read_value(yaml_text, k) for k in TOKENIZE_KEYS}
+    missing = [k for k, v in params.items() if not v]
+    if missing:
+        raise ValueError(f"YAML 缺少分词参数：{', '.join(missing)}")
+    return params
+
+
+def cache_key(params: Dict[str, str]) -> str:
+    text = "|".join([CACHE_VERSION] + [f"{k}={params[k]}" for k in TOKENIZE_KEYS])
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def tokenized_path_for(root: os.PathLike, params: Dict[str, str], dataset: str) -> Path:
+    """yamlgenerate.py 写入 YAML 的 tokenized_path。"""
+    return Path(root) / cache_key(params) / "experiments" / dataset
+
+
+def _replace_dir(tmp: Path, dst: Path) -> None:
+    if dst.exists():
+        shutil.rmtree(dst)
+    os.replace(tmp, dst)
+
+
+def tokenize_rows(rows, params: Dict[str, str], out_dir: Path, workers: int) -> int:
+    """用 LLaMA-Factory 的数据管线对 rows（sharegpt 偏好记录）分词，保存到 out_dir，返回行数。"""
+    from llamafactory.data import get_dataset, get_template_and_fix_tokenizer
+    from llamafactory.hparams import get_train_args
+    from llamafactory.model import load_tokenizer
+
+    work = out_dir.with_name(out_dir.name + ".work")
+    shutil.rmtree(work, ignore_errors=True)
+    work.mkdir(parents=True)
+    with (work / "pool.json").open("w", encoding="utf-8") as f:
+        count = write_json_array(rows, f)
+    (work / "dataset_info.json").write_text(
+        json.dumps({"pool": {"file_name": "pool.json", **DATASET_ENTRY}}, ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+    saved = work / "tokenized"
+    model_args, data_args, training_args, _, _ = get_train_args(dict(
+        stage="dpo",
+        do_train=True,
+        finetuning_type="lora",
+        model_name_or_path=params["model_name_or_path"],
+        trust_remote_code=True,
+        template=params["template"],
+        cutoff_len=int(params["cutoff_len"]),
+        dataset="pool",
+        dataset_dir=str(work),
+        tokenized_path=str(saved),
+        overwrite_cache=True,
+        preprocessing_num_workers=workers,
+        output_dir=str(work / "trainer"),
+        report_to="none",
+    ))
+    tokenizer_module = load_tokenizer(model_args)
+    template = get_template_and_fix_tokenizer(tokenizer_module["tokenizer"], data_args)
+    try:
+        get_dataset(template, model_args, data_args, training_args, stage="rm", **tokenizer_module)
+    except SystemExit as e:
+        # LLaMA-Factory 保存 tokenized_path 后会直接退出
+        if e.code not in (0, None):
+            raise
+
+    from datasets import load_from_disk
+
+    n = len(load_from_disk(str(saved))["train"])
+    if n != count:
+        # 丢弃了无效样本，行号无法与 pairstore 对齐
+        raise ValueError(f"分词后行数 {n} 与输入 {count} 不一致，无法按索引复用")
+    _replace_dir(saved, out_dir)
+    shutil.rmtree(work, ignore_errors=True)
+    return count
+
+
+class TokenCache:
+    def __init__(self, root: os.PathLike, params: Dict[str, str], store: PairStore, workers: int = 16):
+        self.params = params
+        self.store = store
+        self.workers = workers
+        self.dir = Path(root) / cache_key(params)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._pool_path = self.dir / "pool.json"
+
+    @contextmanager
+    def _locked(self):
+        with open(self.dir / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # ------------------------------------------------------------------ 分片
+    def _keys_digest(self, start: int, end: int) -> str:
+        with (self.store.root / "pairs.keys").open("rb") as f:
+            f.seek(start * 16)
+            return hashlib.blake2b(f.read((end - start) * 16), digest_size=16).hexdigest()
+
+    def shards(self) -> List[Dict[str, Any]]:
+        if not self._pool_path.is_file():
+            return []
+        return json.loads(self._pool_path.read_text(encoding="utf-8"))["shards"]
+
+    def _save_shards(self, shards: List[Dict[str, Any]]) -> None:
+        tmp = self._pool_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"params": self.params, "shards": shards}, indent=2), encoding="utf-8")
+        os.replace(tmp, self._pool_path)
+
+    def ensure_pool(self) -> int:
+        """只对 pairstore 中尚未分词的记录分词，返回分片覆盖的记录数。调用方持有锁。"""
+        shards = self.shards()
+        # pairstore 被重建过：内容哈希对不上的分片全部作废
+        for i, shard in enumerate(shards):
+            if shard["end"] > len(self.store) or self._keys_digest(shard["start"], shard["end"]) != shard["keys"]:
+                logging.warning("分片 %s 与 pairstore 不一致，丢弃其后全部分片", shard["dir"])
+                for stale in shards[i:]:
+                    shutil.rmtree(self.dir / stale["dir"], ignore_errors=True)
+                shards = shards[:i]
+                self._save_shards(shards)
+                break
+
+        start, end = (shards[-1]["end"] if shards else 0), len(self.store)
+        if start < end:
+            name = f"shards/{start:09d}-{end:09d}"
+            logging.info("🔤 分词 pairstore 记录 [%d, %d) → %s", start, end, self.dir / name)
+            rows = (json.loads(self.store.get_line(i)) for i in range(start, end))
+            tokenize_rows(rows, self.params, self.dir / name, self.workers)
+            shards.append({"start": start, "end": end, "dir": name, "keys": self._keys_digest(start, end)})
+            self._save_shards(shards)
+        return end
+
+    # ------------------------------------------------------------------ 实验
+    def experiment_dir(self, name: str) -> Path:
+        return self.dir / "experiments" / name
+
+    def _meta(self, name: str, max_samples: Optional[int]) -> Dict[str, Any]:
+        # 只记录实验用到的分片：其它实验追加新分片不会使它失效
+        idx, _ = self.store.load_experiment(name)
+        needed = max(idx[:max_samples] if max_samples is not None else idx, default=-1) + 1
+        return {
+            "idx_mtime_ns": self.store.experiment_path(name).stat().st_mtime_ns,
+            "max_samples": max_samples,
+            "shards": [s["dir"] for s in self.shards() if s["start"] < needed],
+        }
+
+    def is_current(self, name: str, max_samples: Optional[int]) -> bool:
+        meta_path = self.experiment_dir(name).with_suffix(".meta.json")
+        if not self.experiment_dir(name).is_dir() or not meta_path.is_file():
+            return False
+        return json.loads(meta_path.read_text(encoding="utf-8")) == self._meta(name, max_samples)
+
+    def ensure_experiment(self, name: str, max_samples: Optional[int] = None) -> Path:
+        """按需组装实验的分词数据集（LLaMA-Factory 的 tokenized_path），返回目录。"""
+        with self._locked():
+            if self.is_current(name, max_samples):
+                return self.experiment_dir(name)
+            self.ensure_pool()
+            count = self._assemble(name, max_samples)
+            meta_path = self.experiment_dir(name).with_suffix(".meta.json")
+            meta_path.write_text(json.dumps(self._meta(name, max_samples)), encoding="utf-8")
+            logging.info("✓ %s（%d 条）→ %s", name, count, self.experiment_dir(name))
+            return self.experiment_dir(name)
+
+    def _assemble(self, name: str, max_samples: Optional[int]) -> int:
+        import numpy as np
+        from datasets import DatasetDict, concatenate_datasets, load_from_disk
+
+        pool = concatenate_datasets([load_from_disk(str(self.dir / s["dir"]))["train"] for s in self.shards()])
+        idx, flags = self.store.load_experiment(name)
+        # 与 LLaMA-Factory 一致：max_samples 取前 N 行
+        n = len(idx) if max_samples is None else min(len(idx), max_samples)
+        rows = np.frombuffer(idx, dtype=np.uint32)[:n].astype(np.int64)
+        flip = (np.frombuffer(flags, dtype=np.uint8)[:n] & FLIP) != 0
+
+        swap = {}
+        for col in pool.column_names:
+            if col.startswith("chosen_") and "rejected_" + col[7:] in pool.column_names:
+                swap[col], swap["rejected_" + col[7:]] = "rejected_" + col[7:], col
+        plain = pool.select(rows[~flip])
+        flipped = pool.select(rows[flip]).rename_columns(swap).select_columns(plain.column_names)
+        merged = concatenate_datasets([plain, flipped])
+        # 还原实验中的原始行序
+        order = np.empty(n, dtype=np.int64)
+        order[~flip] = np.arange(len(plain))
+        order[flip] = len(plain) + np.arange(len(flipped))
+
+        out = self.experiment_dir(name)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        tmp = out.with_name(out.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        DatasetDict({"train": merged.select(order)}).save_to_disk(str(tmp))
+        _replace_dir(tmp, out)
+        return n
+
+
+def ensure_from_config(config: Path, store: PairStore, data_root: Path) -> Optional[Path]:
+    """按 YAML 中的 tokenized_path 准备分词数据集；YAML 未设置 tokenized_path 时返回 None。"""
+    return ensure_from_text(config.read_text(encoding="utf-8"), store, data_root)
+
+
+def ensure_from_text(text: str, store: PairStore, data_root: Path) -> Optional[Path]:
+    """同 ensure_from_config，参数为 YAML 文本（packed_worker.py 的描述文件）。"""
+    tokenized_path = read_value(text, "tokenized_path")
+    if not tokenized_path or tokenized_path == "null":
+        return None
+    tokenized_path = Path(tokenized_path)
+    dataset = read_value(text, "dataset")
+    params = tokenize_params(text)
+    expected = tokenized_path_for(tokenized_path.parents[2], params, dataset)
+    if expected != tokenized_path:
+        raise ValueError(f"tokenized_path 与分词参数不匹配：{tokenized_path}（应为 {expected}）")
+
+    if not store.has_experiment(dataset):
+        # 未使用 pairstore 时，从已转换的数据集 JSON 导入
+        src = data_root / f"{dataset}.json"
+        with src.open("r", encoding="utf-8") as f:
+            added = store.add_experiment(dataset, [canonicalize(rec) for rec in json.load(f)])
+        logging.info("导入 %s 到 %s：新增 %d 条唯一记录", src, store.root, added)
+
+    max_samples = read_value(text, "max_samples")
+    workers = read_value(text, "preprocessing_num_workers")
+    cache = TokenCache(tokenized_path.parents[2], params, store, int(workers) if workers else 16)
+    return cache.ensure_experiment(dataset, int(max_samples) if max_samples not in (None, "null") else None)
+
+
+# ---------------------------------------------------------------------- CLI
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Shared tokenization cache for preference datasets",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("ensure", help="准备 YAML 中 tokenized_path 指向的分词数据集")
+    p.add_argument("configs", type=Path, nargs="+")
+    p.add_argument("--store", type=Path, default=os.getenv("PAIR_STORE"),
+                   help="pairstore 目录，默认使用 <tokenized_path 根目录>/pairstore")
+    p.add_argument("--data-root", type=Path, default=Path(os.getenv("DATA_ROOT", DEFAULT_DATA_ROOT)),
+                   help="未使用 pairstore 时读取 {dataset}.json 的目录")
+
+    p = sub.add_parser("stats", help="打印缓存统计")
+    p.add_argument("--root", type=Path, default=Path(os.getenv("TOKENIZED_ROOT", DEFAULT_TOKENIZED_ROOT)))
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+    if args.command == "stats":
+        for pool in sorted(args.root.glob("*/pool.json")):
+            info = json.loads(pool.read_text(encoding="utf-8"))
+            rows = info["shards"][-1]["end"] if info["shards"] else 0
+            exps = len(list((pool.parent / "experiments").glob("*.meta.json")))
+            logging.info("%s %s：%d 个分片，%d 条记录，%d 个实验", pool.parent.name, info["params"], len(info["shards"]), rows, exps)
+        return
+
+    failed = 0
+    for config in args.configs:
+        tokenized_path = read_value(config.read_text(encoding="utf-8"), "tokenized_path")
+        if not tokenized_path or tokenized_path == "null":
+            logging.info("%s 未设置 tokenized_path，跳过", config)
+            continue
+        store_dir = args.store or Path(tokenized_path).parents[2] / "pairstore"
+        store = PairStore(store_dir)
+        try:
+            ensure_from_config(config, store, args.data_root)
+        except Exception as e:
+            logging.error("✗ %s：%s", config, e)
+            failed += 1
+        finally:
+            store.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
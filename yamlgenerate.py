@@ -6,9 +6,11 @@ python /root/autodl-tmp/HP/yamlgenerate.py \
 import argparse
 import logging
 import os
+import re
 import sys
 from pathlib import Path
 import random
+from typing import Any, Dict, Optional
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
@@ -70,6 +72,74 @@ resume_from_checkpoint: null
 # eval_steps: 500
 """
 
+_KEY_LINE = re.compile(r"^(?P<key>[A-Za-z_][\w.]*):(?P<value>[^#\n]*?)(?P<comment>\s*#.*)?$")
+
+
+def format_value(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def read_value(yaml_text: str, key: str) -> Optional[str]:
+    """读取顶层 `key: value` 的原始字符串（不含注释），不存在时返回 None。"""
+    for line in yaml_text.splitlines():
+        m = _KEY_LINE.match(line)
+        if m and m.group("key") == key:
+            return m.group("value").strip()
+    return None
+
+
+def apply_overrides(yaml_text: str, overrides: Dict[str, Any]) -> str:
+    """按行替换顶层键的值，保留注释与原有顺序；模板里没有的键追加到末尾。"""
+    remaining = dict(overrides)
+    lines = []
+    for line in yaml_text.splitlines():
+        m = _KEY_LINE.match(line)
+        if m and m.group("key") in remaining:
+            key = m.group("key")
+            line = f"{key}: {format_value(remaining.pop(key))}{m.group('comment') or ''}"
+        lines.append(line)
+    if remaining:
+        lines.append("")
+        lines.append("### overrides")
+        lines.extend(f"{k}: {format_value(v)}" for k, v in remaining.items())
+    return "\n".join(lines) + "\n"
+
+
+_CHECKPOINT_DIR = re.compile(r"^checkpoint-(\d+)$")
+
+
+def latest_checkpoint(output_dir: Path) -> Optional[Path]:
+    """output_dir 下 step 最大、且已完整写出（含 trainer_state.json）的 checkpoint。"""
+    if not output_dir.is_dir():
+        return None
+    best, best_step = None, -1
+    for child in output_dir.iterdir():
+        m = _CHECKPOINT_DIR.match(child.name)
+        if m and int(m.group(1)) > best_step and (child / "trainer_state.json").is_file():
+            best, best_step = child, int(m.group(1))
+    return best
+
+
+def render_packed(exp_name: str, seeds) -> str:
+    """多种子打包描述：seed / output_dir 保留 {seed} 占位符，由 packed_worker.py 逐个渲染。"""
+    seeds_str = ",".join(str(s) for s in seeds)
+    return f"### packed\npacked_seeds: {seeds_str}\n\n" + TEMPLATE.format(
+        dataset_name=exp_name, seed="{seed}"
+    )
+
+
+def use_tokenized_cache(yaml_text: str, exp_name: str, root: Path) -> str:
+    """改为读取 tokcache.py 组装的分词数据集，不再每次训练重新分词。"""
+    from tokcache import tokenize_params, tokenized_path_for
+
+    path = tokenized_path_for(root.expanduser().resolve(), tokenize_params(yaml_text), exp_name)
+    return apply_overrides(yaml_text, {"tokenized_path": path, "overwrite_cache": False})
+
+
 def get_args():
     p = argparse.ArgumentParser(
         description="Generate YAML configs in bulk",
@@ -82,6 +152,12 @@ def get_args():
     p.add_argument("--sort_by_swaps", action="store_true",
                    help="若文件名包含 SWAPS_123，则按数字降序排序")
     p.add_argument("--seed", type=int, default=42, help="随机实验的随机种子")
+    p.add_argument("--packed", action="store_true",
+                   help="每个实验只生成一个包含全部种子的描述文件（<output_path>/packed/），\n"
+                        "由 run.py 调用 packed_worker.py 在同一进程内依次训练各种子")
+    p.add_argument("--tokenized_root", type=Path, default=os.getenv("TOKENIZED_ROOT"),
+                   help="共享分词缓存目录（见 tokcache.py）；设置后 YAML 使用 tokenized_path，\n"
+                        "由 run.py 在训练前按需组装 (可用环境变量 TOKENIZED_ROOT 覆盖)")
     return p.parse_args()
 
 
@@ -108,6 +184,22 @@ def main() -> None:
     # 为每个实验生成NUM_SEEDS个不同的随机种子
     seeds = random.sample(range(1, 9999), NUM_SEEDS)  # 生成不重复的随机种子
     
+    # 4'. 打包模式：每个实验一个描述文件
+    if args.packed:
+        packed_dir = args.output_path / "packed"
+        packed_dir.mkdir(parents=True, exist_ok=True)
+        exp_names = [name.split("::")[0] for name in names]
+        for exp_name in exp_names:
+            yaml_file = packed_dir / f"{exp_name}.yaml"
+            yaml_text = render_packed(exp_name, seeds)
+            if args.tokenized_root:
+                yaml_text = use_tokenized_cache(yaml_text, exp_name, args.tokenized_root)
+            yaml_file.write_text(yaml_text, encoding="utf-8")
+            logging.info("✅ 生成 %s（种子 %s）", yaml_file, seeds)
+        (packed_dir / "wait_experiments.txt").write_text("\n".join(exp_names) + "\n", encoding="utf-8")
+        logging.info("全部完成，共生成 %d 个打包任务（%d 个种子）。", len(exp_names), len(seeds))
+        return
+
     # 4. 生成 YAML
     for name in names:
         exp_name = name.split("::")[0]  # 去掉可能的 ::comment
@@ -125,6 +217,8 @@ def main() -> None:
             seed_dir.mkdir(parents=True, exist_ok=True)
             
             yaml_text = TEMPLATE.format(dataset_name=exp_name, seed=seed)
+            if args.tokenized_root:
+                yaml_text = use_tokenized_cache(yaml_text, exp_name, args.tokenized_root)
             yaml_file = seed_dir / f"{exp_name}.yaml"
             yaml_file.write_text(yaml_text, encoding="utf-8")
             logging.info("✅ 生成 %s", yaml_file)